@@ -1,7 +1,19 @@
+import logging
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class AppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "app"
-    
\ No newline at end of file
+
+    def ready(self):
+        if settings.MONGODB_ENSURE_INDEXES_ON_STARTUP:
+            from .utils.indexes import ensure_indexes
+            try:
+                ensure_indexes()
+            except Exception as e:
+                # Serving without an index is slow, not broken; don't block startup
+                logger.exception(f"Failed to reconcile MongoDB indexes: {str(e)}")
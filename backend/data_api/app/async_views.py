@@ -0,0 +1,284 @@
+"""Async versions of the project and whiteboard views, for ASGI.
+
+Served instead of their namesakes in views.py when API_ASYNC_VIEWS is on.
+Reads go through AsyncMongoClient, so a request waiting on MongoDB is a
+suspended coroutine rather than a blocked thread and one process can hold
+thousands of them. Writes that go through the shared sync helpers
+(save_board, patch_board, history, the autosave buffer) run in the default
+thread pool, as the collaboration hub does.
+
+Parsing requests and building responses is left to utils/project_api.py,
+as in the sync views, so the two differ only in how they reach MongoDB.
+Under WSGI keep the sync views: every async view would get an event loop,
+and so a MongoDB client, of its own.
+"""
+import asyncio
+import logging
+
+from bson.objectid import ObjectId
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from .utils import project_api
+from .utils.autosave import autosave_buffer
+from .utils.board_cache import board_cache
+from .utils.board_ops import PatchError, RevisionConflict
+from .utils.board_storage import is_documents, aload_board, aquery_viewport, save_board, patch_board, adelete_documents
+from .utils.fastjson import FastJsonResponse, loads
+from .utils.history import history
+from .utils.mongo import get_async_projects_collection, get_async_versions_collection, get_projects_collection
+from .utils.pagination import apaginate
+from .utils.permissions import read_access_filter, write_access_filter, METADATA_PROJECTION
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAPIView(View):
+    """Django View with async handlers; like DRF's APIView, exempt from CSRF"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+
+def _render(reply):
+    if reply.body is None:
+        return HttpResponse(status=reply.status, headers=reply.headers)
+    return FastJsonResponse(reply.body, status=reply.status, headers=reply.headers)
+
+
+def _data(request):
+    """The parsed body, failing as FastJSONParser does for the sync views"""
+    try:
+        data = loads(request.body or b'{}')
+    except ValueError as e:
+        raise project_api.RequestError(f"JSON parse error - {str(e)}")
+    return project_api.json_object(data)
+
+
+async def _flush(project_id):
+    # Read your own writes; the buffer's locks are not for the event loop, so only hop to a thread if needed
+    if autosave_buffer.pending(project_id):
+        await asyncio.to_thread(autosave_buffer.flush, project_id)
+
+
+async def _missing_or_forbidden(projects_collection, project_id):
+    # Tell "missing" from "forbidden" with an _id-only lookup
+    return project_api.missing_or_forbidden(
+        await projects_collection.count_documents({'_id': ObjectId(project_id)}, limit=1) > 0
+    )
+
+
+async def _readable(project_id, user_id):
+    """None if `user_id` may read the project, else the error Reply"""
+    projects_collection = get_async_projects_collection()
+    if await projects_collection.count_documents({'_id': ObjectId(project_id), **read_access_filter(user_id)},
+                                                 limit=1):
+        return None
+    return await _missing_or_forbidden(projects_collection, project_id)
+
+
+class NewProjectView(AsyncAPIView):
+    async def post(self, request):
+        try:
+            document = project_api.new_project(_data(request))
+            result = await get_async_projects_collection().insert_one(document)
+            return _render(project_api.created(result.inserted_id))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            return _render(project_api.failed('New project failed', e, 400))
+
+
+class AllProjectsView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            user_id, field, order, limit, position = project_api.project_list_params(request.GET)
+            projects, next_cursor = await apaginate(
+                get_async_projects_collection(), {'user_id': user_id}, project_api.PROJECT_LISTING_PROJECTION,
+                field, order, limit, position
+            )
+            return _render(project_api.project_list(projects, next_cursor))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            return _render(project_api.failed('Failed to fetch projects', e))
+
+
+class DeleteProjectView(AsyncAPIView):
+    async def delete(self, request):
+        try:
+            project_id = project_api.required_project(request.GET.get('project_id'))
+
+            autosave_buffer.discard(project_id)
+            board_cache.invalidate(project_id)
+            result = await get_async_projects_collection().delete_one({'_id': ObjectId(project_id)})
+            await adelete_documents(project_id)
+            await asyncio.to_thread(history.delete, project_id)
+            return _render(project_api.deleted(result.deleted_count))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            return _render(project_api.failed('Failed to delete project', e))
+
+
+class OpenWhiteBoardView(AsyncAPIView):
+    """Open a board. GET (query params) and POST (body) both honour If-None-Match"""
+    async def get(self, request, project_id):
+        return await self._open(request, project_id, from_body=False)
+
+    async def post(self, request, project_id):
+        return await self._open(request, project_id, from_body=True)
+
+    async def _open(self, request, project_id, from_body):
+        try:
+            user_id, metadata_only = project_api.open_request(_data(request) if from_body else request.GET, from_body)
+
+            await _flush(project_id)
+            if_none_match = request.headers.get('If-None-Match')
+            reply = project_api.open_from_cache(project_id, user_id, metadata_only, if_none_match)
+            if reply is not None:
+                return _render(reply)
+
+            projects_collection = get_async_projects_collection()
+            project = await projects_collection.find_one(
+                {'_id': ObjectId(project_id), **read_access_filter(user_id)},
+                METADATA_PROJECTION if metadata_only else None
+            )
+            if not project:
+                return _render(await _missing_or_forbidden(projects_collection, project_id))
+
+            reply = project_api.open_not_modified(project_id, project, metadata_only, if_none_match)
+            if reply is not None:
+                return _render(reply)
+            board = None
+            if not metadata_only:
+                board = await aload_board(project_id) if is_documents(project) else project_api.embedded_board(project)
+            return _render(project_api.opened(project_id, project, metadata_only, board))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            logger.exception(f"Error in OpenWhiteBoardView: {str(e)}")
+            return _render(project_api.failed('Failed to open whiteboard', e))
+
+
+class UploadWhiteBoardView(AsyncAPIView):
+    async def post(self, request):
+        try:
+            project_id, user_id, project_data, buffered = project_api.upload_request(_data(request))
+
+            if buffered:
+                # A pending save means an earlier request already found the project
+                if (not autosave_buffer.pending(project_id)
+                        and not await get_async_projects_collection().find_one({'_id': ObjectId(project_id)},
+                                                                               {'_id': 1})):
+                    return _render(project_api.upload_missing())
+                # put writes through inline when the buffer is full
+                saved = await asyncio.to_thread(autosave_buffer.put, project_id, project_data)
+                return _render(project_api.upload_buffered(saved))
+
+            autosave_buffer.discard(project_id)
+            revision = await asyncio.to_thread(save_board, get_projects_collection(), project_id,
+                                               {'_id': ObjectId(project_id)}, project_data)
+            return _render(project_api.uploaded(project_id, user_id, project_data, revision))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            logger.exception(f"Error in UploadWhiteBoardView: {str(e)}")
+            return _render(project_api.failed('Failed to save project', e))
+
+
+class PatchWhiteBoardView(AsyncAPIView):
+    """Apply a list of node/connection operations instead of re-uploading the whole board"""
+    async def patch(self, request, project_id):
+        try:
+            user_id, revision, ops = project_api.patch_request(_data(request))
+
+            await _flush(project_id)
+            query = {'_id': ObjectId(project_id), **write_access_filter(user_id)}
+            try:
+                new_revision = await asyncio.to_thread(patch_board, get_projects_collection(), project_id, query,
+                                                       revision, ops)
+            except (PatchError, RevisionConflict, LookupError) as e:
+                return _render(project_api.patch_failed(project_id, e))
+            return _render(project_api.patched(project_id, new_revision))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            logger.exception(f"Error in PatchWhiteBoardView: {str(e)}")
+            return _render(project_api.failed('Failed to patch project', e))
+
+
+class WhiteBoardViewportView(AsyncAPIView):
+    """Nodes inside a rectangle (x0, y0)-(x1, y1) and the connections touching them, a page at a time"""
+    async def get(self, request, project_id):
+        try:
+            user_id, box, limit, position = project_api.viewport_request(request.GET)
+
+            await _flush(project_id)
+            projects_collection = get_async_projects_collection()
+            project = await projects_collection.find_one(
+                {'_id': ObjectId(project_id), **read_access_filter(user_id)}, project_api.VIEWPORT_PROJECTION
+            )
+            if not project:
+                return _render(await _missing_or_forbidden(projects_collection, project_id))
+
+            if is_documents(project):
+                nodes, connections, next_cursor = await aquery_viewport(project_id, *box, limit, position)
+            else:
+                nodes, connections, next_cursor = project_api.embedded_viewport(project, box)
+            return _render(project_api.viewport(project, nodes, connections, next_cursor))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            logger.exception(f"Error in WhiteBoardViewportView: {str(e)}")
+            return _render(project_api.failed('Failed to load viewport', e))
+
+
+class ProjectVersionsView(AsyncAPIView):
+    """Newest-first list of a project's recorded versions"""
+    async def get(self, request, project_id):
+        try:
+            user_id, field, order, limit, position = project_api.version_list_params(request.GET)
+            denied = await _readable(project_id, user_id)
+            if denied is not None:
+                return _render(denied)
+
+            versions, next_cursor = await apaginate(
+                get_async_versions_collection(), {'project_id': project_id}, project_api.VERSION_LISTING_PROJECTION,
+                field, order, limit, position, unique=True
+            )
+            return _render(project_api.version_list(versions, next_cursor))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            return _render(project_api.failed('Failed to fetch versions', e))
+
+
+class ProjectVersionView(AsyncAPIView):
+    """A past version of the board, rebuilt from its snapshot and deltas"""
+    async def get(self, request, project_id, version):
+        try:
+            user_id = project_api.required_user(request.GET.get('user_id'))
+            denied = await _readable(project_id, user_id)
+            if denied is not None:
+                return _render(denied)
+
+            # Replaying deltas is CPU work on top of the reads
+            board = await asyncio.to_thread(history.reconstruct, project_id, version)
+            return _render(project_api.version(project_id, board))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            logger.exception(f"Error in ProjectVersionView: {str(e)}")
+            return _render(project_api.failed('Failed to load version', e))
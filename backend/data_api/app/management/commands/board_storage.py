@@ -0,0 +1,21 @@
+from bson.objectid import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+
+from app.utils.board_storage import convert, DOCUMENTS
+from app.utils.mongo import get_projects_collection
+
+
+class Command(BaseCommand):
+    help = "Move a whiteboard between the embedded and one-document-per-node storage layouts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id')
+        parser.add_argument('--layout', choices=[DOCUMENTS, 'embedded'], default=DOCUMENTS)
+
+    def handle(self, *args, **options):
+        project_id = options['project_id']
+        try:
+            convert(get_projects_collection(), project_id, {'_id': ObjectId(project_id)}, options['layout'])
+        except LookupError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"{project_id}: {options['layout']}"))
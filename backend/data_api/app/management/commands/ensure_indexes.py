@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from app.utils.indexes import ensure_indexes, explain_queries
+
+
+class Command(BaseCommand):
+    help = "Create or rebuild the MongoDB indexes declared in app/utils/indexes.py"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop-extra', action='store_true', help='Drop indexes that are not declared')
+        parser.add_argument('--explain', action='store_true',
+                            help='Report which declared query shapes still scan a collection')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        report = {'indexes': ensure_indexes(drop_extra=options['drop_extra'])}
+        if options['explain']:
+            report['queries'] = explain_queries()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for entry in report['indexes']:
+            line = f"{entry['collection']}.{entry['index']}: {entry['action']}"
+            self.stdout.write(self.style.WARNING(line) if entry['action'] == 'undeclared' else line)
+        for entry in report.get('queries', []):
+            line = f"{entry['collection']} / {entry['query']}: {' <- '.join(entry['stages'])}"
+            if entry['collscan']:
+                self.stdout.write(self.style.ERROR(f"COLLSCAN {line}"))
+            elif entry['in_memory_sort']:
+                self.stdout.write(self.style.WARNING(f"SORT {line}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"OK {line}"))
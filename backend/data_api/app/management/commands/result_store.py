@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.utils.result_store import get_result_store
+
+
+class Command(BaseCommand):
+    help = "Show the size of the on-disk pipeline result store, or empty it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true')
+
+    def handle(self, *args, **options):
+        result_store = get_result_store()
+        if result_store is None:
+            raise CommandError('The result store is disabled (RESULT_STORE_ENABLED)')
+        if options['clear']:
+            result_store.clear()
+        stored = result_store.stats()['bytes_stored'] or 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{result_store.directory}: {stored} of {result_store.max_bytes} bytes"
+        ))
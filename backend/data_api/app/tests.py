@@ -1,3 +1,1308 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import mongomock
+import numpy as np
+from bson import BSON
+from bson.objectid import ObjectId
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from pymongo.errors import DocumentTooLarge
+from rest_framework.test import APIRequestFactory
+
+from . import async_views, views
+from .utils import mongo
+from .utils.autosave import WriteBehindBuffer
+from .utils.board_cache import board_cache
+from .utils.board_ops import PatchError, RevisionConflict, apply_ops, save_patch, validate_ops
+from .utils.board_storage import DOCUMENTS, convert, load_board, patch_board, save_board
+from .utils.collab import ChannelLayer, CollabHub
+from .utils import datasets, executor, fastjson
+from .utils.compiler import PipelineValidationError, compile_pipeline
+from .utils.compression import CompressionMiddleware, accepted_encoding, brotli
+from .utils.events import EventBroker, format_sse
+from .utils.fastjson import FastJSONRenderer
+from .utils import history as history_module
+from .utils.history import VersionHistory, history
+from .utils.indexes import ensure_indexes
+from .utils.jobs import FINAL_STATES, JobManager, JobQueueFull
+from .utils.metrics import REQUEST_LATENCY, Histogram
+from .utils.operators import get_operator
+from .utils.pagination import decode_cursor, paginate
+from .utils.profiling import folded
+from .utils.result_store import ResultStore, get_result_store
+from .utils.table import Table, sizeof, to_table
+from .views import AllProjectsView, ExecutePipelineView, PatchWhiteBoardView, UploadWhiteBoardView
+
+try:
+    import mongomock_motor
+except ImportError:
+    mongomock_motor = None
+
+
+def port(node_id, kind, name, data_type):
+    return {'id': f"{node_id}-{kind}-{name}", 'type': kind, 'name': name, 'dataType': data_type, 'label': name}
+
+
+def make_node(node_id, node_type, data, inputs=(), outputs=(), position=(0, 0)):
+    return {
+        'id': node_id,
+        'type': node_type,
+        'title': node_type,
+        'position': {'x': position[0], 'y': position[1], 'z': 0},
+        'inputs': [port(node_id, 'input', name, data_type) for name, data_type in inputs],
+        'outputs': [port(node_id, 'output', name, data_type) for name, data_type in outputs],
+        'data': [{'name': name, 'dataType': 'text', 'value': value} for name, value in data.items()],
+    }
+
+
+def connect(source, source_port, target, target_port):
+    return {
+        'id': f"{source}->{target}",
+        'sourceNodeId': source, 'sourcePortId': f"{source}-output-{source_port}",
+        'targetNodeId': target, 'targetPortId': f"{target}-input-{target_port}",
+        'z': 0,
+    }
+
+
+def table_node(node_id, node_type, data):
+    # Ports as the frontend's nodeTemplates declare them
+    return make_node(node_id, node_type, data, [('data', 'data')], [('table', 'table')])
+
+
+def csv_input(csv):
+    return make_node('input', 'inputManager', {'text': csv, 'csv file': ''}, [('input text', 'text')],
+                     [('output', 'text'), ('output number', 'text')])
+
+
+def pipeline(rows=30):
+    """input -> typeCast -> filterRows -> textTransform over a small CSV"""
+    csv = 'id,city,qty\n' + '\n'.join(f"{index},{[' Paris', 'LIMA ', 'Oslo'][index % 3]},{index % 20}"
+                                      for index in range(rows))
+    nodes = [
+        csv_input(csv),
+        table_node('cast', 'typeCast', {'columns': 'qty', 'type': 'int'}),
+        table_node('filter', 'filterRows', {'column': 'qty', 'operator': '>', 'value': '5'}),
+        table_node('text', 'textTransform', {'columns': 'city', 'operations': 'strip,lower'}),
+    ]
+    connections = [connect('input', 'output', 'cast', 'data'), connect('cast', 'table', 'filter', 'data'),
+                   connect('filter', 'table', 'text', 'data')]
+    return {'nodes': nodes, 'connections': connections, 'use_cache': False}
+
+
+def allow_sort(builder):
+    """pymongo 4.11+ passes bulk ReplaceOne/UpdateOne a `sort`, which mongomock 4.3 does not take"""
+    for name in ('add_replace', 'add_update'):
+        method = getattr(builder, name)
+        if 'sort' not in method.__code__.co_varnames:
+            def without_sort(self, *args, _method=method, sort=None, **kwargs):
+                return _method(self, *args, **kwargs)
+            setattr(builder, name, without_sort)
+
+
+allow_sort(mongomock.collection.BulkOperationBuilder)
+
+
+class MongoTestCase(SimpleTestCase):
+    """Runs against an in-memory mongomock client in place of the shared MongoClient"""
+
+    def setUp(self):
+        super().setUp()
+        saved = mongo._client, mongo._client_pid
+        mongo._client, mongo._client_pid = mongomock.MongoClient(), os.getpid()
+        self.addCleanup(setattr, mongo, '_client', saved[0])
+        self.addCleanup(setattr, mongo, '_client_pid', saved[1])
+        # Latest versions cached from the previous test's database
+        history.heads.clear()
+        # Versions recorded in the background go to this test's database
+        self.addCleanup(history.flush)
+
+
+class MongoClientTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        saved = mongo._client, mongo._client_pid
+        mongo._client, mongo._client_pid = None, None
+        self.addCleanup(setattr, mongo, '_client', saved[0])
+        self.addCleanup(setattr, mongo, '_client_pid', saved[1])
+
+    @override_settings(MONGODB_URI='mongodb://localhost:1', MONGODB_MAX_POOL_SIZE=7)
+    def test_one_pooled_client_per_process(self):
+        client = mongo.get_client()
+        self.addCleanup(client.close)
+        self.assertIs(mongo.get_client(), client)
+        self.assertIs(mongo.get_users_collection().database.client, client)
+        self.assertIs(mongo.get_projects_collection().database.client, client)
+        self.assertEqual(client.options.pool_options.max_pool_size, 7)
+        # A client inherited across fork() is replaced in the child
+        mongo._client_pid = -1
+        child = mongo.get_client()
+        self.addCleanup(child.close)
+        self.assertIsNot(child, client)
+        mongo.close_client()
+        self.assertIsNone(mongo._client)
+
+
+def text_node(node_id, x=0, y=0):
+    return make_node(node_id, 'textProcessor', {'text': 'upper'}, [('input', 'text')], [('output', 'text')], (x, y))
+
+
+def new_board(nodes=('a', 'b', 'c'), **fields):
+    """An embedded project with a chain of text nodes, returning its id"""
+    board_nodes = [text_node(node_id, index * 100) for index, node_id in enumerate(nodes)]
+    connections = [connect(source, 'output', target, 'input') for source, target in zip(nodes, nodes[1:])]
+    return str(mongo.get_projects_collection().insert_one({
+        'user_id': 'owner', 'project_name': 'Board', 'nodes': board_nodes, 'connections': connections,
+        'collaborators': [], 'is_public': False, 'revision': 1, **fields,
+    }).inserted_id)
+
+
+def stored(project_id):
+    return mongo.get_projects_collection().find_one({'_id': ObjectId(project_id)})
+
+
+def error_codes(context):
+    return [error['code'] for error in context.exception.errors]
+
+
+class CompilerTests(SimpleTestCase):
+    def test_levels_and_fused_chain(self):
+        data = pipeline()
+        plan = compile_pipeline(data['nodes'], data['connections'])
+        self.assertEqual(plan.levels, (('input',), ('cast',), ('filter',), ('text',)))
+        self.assertEqual(plan.fused, (('cast', 'filter', 'text'),))
+
+    def test_node_without_id_is_a_validation_error(self):
+        nodes = [make_node('a', 'textProcessor', {}), {**make_node('b', 'textProcessor', {}), 'id': None}]
+        with self.assertRaises(PipelineValidationError) as context:
+            compile_pipeline(nodes, [])
+        self.assertEqual(error_codes(context), ['missing_id'])
+
+    def test_port_without_id_is_a_validation_error(self):
+        node = make_node('a', 'textProcessor', {}, [('input', 'text')])
+        del node['inputs'][0]['id']
+        with self.assertRaises(PipelineValidationError) as context:
+            compile_pipeline([node], [])
+        self.assertEqual(error_codes(context), ['invalid_port'])
+
+    def test_node_that_is_not_an_object_is_a_validation_error(self):
+        with self.assertRaises(PipelineValidationError) as context:
+            compile_pipeline([make_node('a', 'textProcessor', {}), 'b'], [])
+        self.assertEqual(error_codes(context), ['invalid_node'])
+
+    def test_ids_and_references_that_are_not_strings_are_validation_errors(self):
+        port = make_node('c', 'textProcessor', {}, [('input', 'text')])
+        port['inputs'][0]['id'] = ['input']
+        with self.assertRaises(PipelineValidationError) as context:
+            compile_pipeline([{**make_node('a', 'textProcessor', {}), 'id': ['a']},
+                              {**make_node('b', 'textProcessor', {}), 'type': {'name': 'textProcessor'}}, port],
+                             [{**connect('b', 'output', 'c', 'input'), 'sourceNodeId': 7}])
+        self.assertEqual(error_codes(context), ['invalid_node', 'invalid_node', 'invalid_port', 'invalid_connection'])
+        messages = [error['message'] for error in context.exception.errors]
+        self.assertEqual(messages[:2], ['Node at index 0 needs a string id', 'Node at index 1 needs a string type'])
+        self.assertIn('node c', messages[2])
+        self.assertEqual(context.exception.errors[2]['node_id'], 'c')
+
+    def test_dangling_connection_cycle_and_type_mismatch(self):
+        nodes = [make_node('a', 'textProcessor', {}, [('input', 'text')], [('output', 'text')]),
+                 make_node('b', 'textProcessor', {}, [('input', 'text')], [('output', 'text')]),
+                 table_node('c', 'typeCast', {})]
+        connections = [connect('a', 'output', 'b', 'input'), connect('b', 'output', 'a', 'input'),
+                       connect('a', 'output', 'missing', 'input'), connect('c', 'table', 'a', 'input')]
+        with self.assertRaises(PipelineValidationError) as context:
+            compile_pipeline(nodes, connections)
+        self.assertEqual(sorted(error_codes(context)), ['cycle', 'dangling_connection', 'type_mismatch'])
+
+    def test_view_returns_structured_errors(self):
+        request = APIRequestFactory().post('/api/execute-pipeline/', {
+            'nodes': [make_node('a', 'textProcessor', {}), {'type': 'textProcessor'}], 'connections': [],
+        }, format='json')
+        response = ExecutePipelineView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['code'] for error in response.data['errors']], ['missing_id'])
+
+
+NAP_SECONDS = 0.2
+
+
+def nap(inputs, data):
+    """A test operator that takes NAP_SECONDS whatever its input"""
+    time.sleep(NAP_SECONDS)
+    return {'output': 'done'}
+
+
+class SchedulerTests(SimpleTestCase):
+    def nap_node(self, node_id):
+        return make_node(node_id, 'nap', {}, [('input', 'text')], [('output', 'text')])
+
+    @mock.patch.dict('app.utils.operators.OPERATORS', {'nap': nap})
+    def test_independent_nodes_run_in_parallel_and_the_run_takes_its_critical_path(self):
+        nodes = [self.nap_node(node_id) for node_id in ('a', 'b', 'c', 'd', 'sink')]
+        connections = [connect(source, 'output', 'sink', 'input') for source in 'abcd']
+        started = time.perf_counter()
+        execution = executor.execute_graph(nodes, connections, executor='thread', max_workers=4, use_cache=False,
+                                           profile=True)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(execution['levels'], [['a', 'b', 'c', 'd'], ['sink']])
+        self.assertEqual({result['status'] for result in execution['results'].values()}, {'success'})
+        # Two naps deep, where one after the other would be five
+        self.assertGreaterEqual(elapsed, 2 * NAP_SECONDS)
+        self.assertLess(elapsed, 4 * NAP_SECONDS)
+        profiles = {node_id: result['profile'] for node_id, result in execution['results'].items()}
+        self.assertLess(max(profiles[node_id]['started_ms'] for node_id in 'abcd'), NAP_SECONDS * 1000)
+        self.assertGreaterEqual(profiles['sink']['started_ms'],
+                                max(profiles[node_id]['finished_ms'] for node_id in 'abcd'))
+
+    def test_process_pool_matches_thread_pool(self):
+        data = pipeline()
+        threaded = executor.execute_graph(data['nodes'], data['connections'], executor='thread', use_cache=False)
+        processes = executor.execute_graph(data['nodes'], data['connections'], executor='process', max_workers=2,
+                                           use_cache=False)
+        self.assertEqual({node_id: result['outputs'] for node_id, result in processes['results'].items()},
+                         {node_id: result['outputs'] for node_id, result in threaded['results'].items()})
+        self.assertEqual(processes['results']['text']['status'], 'success')
+
+
+class ProfilingTests(SimpleTestCase):
+    def test_folded_stacks_each_node_on_the_input_that_finished_last(self):
+        nodes = [text_node('a'), text_node('b'), text_node('c')]
+        plan = compile_pipeline(nodes, [connect('a', 'output', 'c', 'input'), connect('b', 'output', 'c', 'input')])
+        profiles = {'a': {'wall_ms': 5, 'finished_ms': 10}, 'b': {'wall_ms': 7.5, 'finished_ms': 30},
+                    'c': {'wall_ms': 4, 'finished_ms': 40, 'queue_ms': 2}}
+        self.assertEqual(folded(plan, {node['id']: node for node in nodes}, profiles).splitlines(), [
+            'pipeline;textProcessor:a 5000',
+            'pipeline;textProcessor:b 7500',
+            'pipeline;textProcessor:b;textProcessor:c;[queued] 2000',
+            'pipeline;textProcessor:b;textProcessor:c 4000',
+        ])
+
+    def test_fused_chain_is_one_frame(self):
+        data = pipeline()
+        execution = executor.execute_graph(data['nodes'], data['connections'], use_cache=False, profile=True)
+        stacks = [line.rsplit(' ', 1) for line in execution['profile']['folded'].splitlines()]
+        self.assertTrue(all(microseconds.isdigit() for _, microseconds in stacks))
+        self.assertEqual([stack for stack, _ in stacks if not stack.endswith('[queued]')], [
+            'pipeline;inputManager:input',
+            'pipeline;inputManager:input;typeCast:cast+filterRows:filter+textTransform:text',
+        ])
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_adds_up_thread_shards_into_cumulative_buckets(self):
+        histogram = Histogram('test_seconds', 'Test latencies', ('route',), (0.1, 1.0))
+        threads = [threading.Thread(target=histogram.observe, args=(value, 'a"b')) for value in (0.05, 0.5, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(histogram.render(), [
+            '# HELP test_seconds Test latencies',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{route="a\\"b",le="0.1"} 1',
+            'test_seconds_bucket{route="a\\"b",le="1.0"} 2',
+            'test_seconds_bucket{route="a\\"b",le="+Inf"} 3',
+            'test_seconds_sum{route="a\\"b"} 5.55',
+            'test_seconds_count{route="a\\"b"} 3',
+        ])
+
+    def test_requests_are_counted_by_route_and_scraped(self):
+        def count():
+            series = REQUEST_LATENCY.collect().get(('GET', 'api/whiteboard-cache-stats/', '200'))
+            return series[0][-1] if series else 0
+
+        before = count()
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/whiteboard-cache-stats/').status_code, 200)
+        self.assertEqual(count(), before + 2)
+        scraped = self.client.get('/metrics')
+        self.assertTrue(scraped['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(f'http_request_duration_seconds_count{{method="GET",route="api/whiteboard-cache-stats/",'
+                      f'status="200"}} {before + 2}', scraped.content.decode())
+
+
+class ResponseEncodingTests(SimpleTestCase):
+    def test_renderer_writes_mongo_and_numpy_values_with_or_without_orjson(self):
+        data = {'id': ObjectId('0123456789abcdef01234567'), 'at': datetime(2024, 1, 2, 3, 4, 5),
+                'n': np.int64(3), 'values': np.array([1.5, 2.0]), 'price': Decimal('1.50'), 'city': 'Zürich'}
+        expected = ('{"id":"0123456789abcdef01234567","at":"2024-01-02T03:04:05","n":3,"values":[1.5,2.0],'
+                    '"price":"1.50","city":"Zürich"}').encode('utf-8')
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+        with mock.patch.object(fastjson, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+
+    def test_accept_encoding_negotiation(self):
+        self.assertEqual(accepted_encoding('gzip, deflate, br'), 'br' if brotli else 'gzip')
+        self.assertEqual(accepted_encoding('gzip, br;q=0'), 'gzip')
+        self.assertEqual(accepted_encoding('*;q=0.5'), 'br' if brotli else 'gzip')
+        self.assertIsNone(accepted_encoding('gzip;q=0, identity'))
+        self.assertIsNone(accepted_encoding(None))
+        with mock.patch('app.utils.compression.brotli', None):
+            self.assertEqual(accepted_encoding('br, gzip'), 'gzip')
+
+    def test_large_json_is_gzipped_and_its_etag_weakened(self):
+        body = FastJSONRenderer().render({'nodes': [text_node(f"n{index}") for index in range(50)]})
+        middleware = CompressionMiddleware(
+            lambda request: HttpResponse(body, content_type='application/json', headers={'ETag': '"p:1"'}))
+        response = middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual((response['Content-Encoding'], response['ETag']), ('gzip', 'W/"p:1"'))
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        plain = middleware(RequestFactory().get('/'))
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(plain.content, body)
+        small = CompressionMiddleware(lambda request: HttpResponse(b'{}', content_type='application/json'))
+        self.assertFalse(small(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')).has_header('Content-Encoding'))
+
+
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(executor.result_cache.clear)
+
+    def run_twice(self, change):
+        executor.result_cache.clear()
+        data = pipeline()
+        first = executor.execute_graph(data['nodes'], data['connections'])
+        self.assertEqual(first['cache']['reused'], [])
+        change(data['nodes'])
+        return executor.execute_graph(data['nodes'], data['connections'])
+
+    @override_settings(PIPELINE_FUSION=False)
+    def test_only_nodes_downstream_of_an_edit_are_recomputed(self):
+        def raise_threshold(nodes):
+            nodes[2]['data'][2]['value'] = '10'
+
+        second = self.run_twice(raise_threshold)
+        self.assertEqual(second['cache'], {'reused': ['input', 'cast'], 'recomputed': ['filter', 'text'],
+                                           'hit_rate': 0.5, 'from_disk': []})
+        self.assertEqual([second['results'][node_id]['cached'] for node_id in second['order']],
+                         [True, True, False, False])
+
+    def test_unchanged_graph_is_all_reused(self):
+        second = self.run_twice(lambda nodes: None)
+        self.assertEqual(second['cache']['recomputed'], [])
+        self.assertEqual(second['cache']['hit_rate'], 1.0)
+        # Moving a node is not an edit
+        moved = self.run_twice(lambda nodes: nodes[1]['position'].update(x=500))
+        self.assertEqual(moved['cache']['reused'], ['input', 'cast', 'filter', 'text'])
+
+
+class EventBrokerTests(SimpleTestCase):
+    def test_history_then_live_events_in_order_until_close(self):
+        broker = EventBroker(history_size=10, max_channels=4, subscriber_queue_size=100)
+        broker.open('job')
+        broker.publish('job', {'event': 'job_started', 'n': 0})
+
+        async def listen():
+            received = []
+            async for event in broker.subscribe('job'):
+                received.append(event['n'])
+                if event['n'] == 0:
+                    # Published from a worker thread while the subscriber waits
+                    threading.Thread(target=publish_rest).start()
+            return received
+
+        def publish_rest():
+            for n in range(1, 6):
+                broker.publish('job', {'event': 'node_finished', 'n': n})
+            broker.close('job')
+
+        self.assertEqual(asyncio.run(listen()), [0, 1, 2, 3, 4, 5])
+
+    def test_closed_channel_replays_to_late_subscribers(self):
+        broker = EventBroker(history_size=2, max_channels=4, subscriber_queue_size=100)
+        broker.open('job')
+        for n in range(3):
+            broker.publish('job', {'event': 'node_finished', 'n': n})
+        broker.close('job')
+        broker.publish('job', {'event': 'node_finished', 'n': 3})
+
+        async def replay(name):
+            return [event['n'] async for event in broker.subscribe(name)]
+
+        # The bounded history keeps the latest events, and nothing after close
+        self.assertEqual(asyncio.run(replay('job')), [1, 2])
+        self.assertEqual(asyncio.run(replay('unknown')), [])
+        self.assertEqual(format_sse({'event': 'job_started', 'job_id': 'j'}),
+                         'event: job_started\ndata: {"event": "job_started", "job_id": "j"}\n\n')
+
+
+class JobManagerTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.manager = JobManager(max_workers=1, max_queued=4, heartbeat_seconds=60, stale_seconds=600,
+                                  max_attempts=2)
+        self.addCleanup(self.manager.shutdown)
+
+    def run_job(self, data):
+        job_id = self.manager.submit(data)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            job = self.manager.get(job_id)
+            if job['status'] in FINAL_STATES:
+                return job
+            time.sleep(0.02)
+        self.fail(f"Job {job_id} did not finish")
+
+    def test_mode_and_profile_reach_the_executor(self):
+        streamed = self.run_job({**pipeline(), 'mode': 'stream'})
+        self.assertEqual(streamed['status'], 'success')
+        self.assertEqual(streamed['result']['mode'], 'stream')
+        profiled = self.run_job({**pipeline(), 'profile': True})
+        self.assertEqual(profiled['status'], 'success')
+        self.assertNotIn('mode', profiled['result'])
+        self.assertIn('folded', profiled['result']['profile'])
+
+    def test_concurrent_submits_do_not_overfill_the_queue(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        insert_one = mongomock.collection.Collection.insert_one
+
+        def slow_insert(collection, *args, **kwargs):
+            time.sleep(0.05)
+            return insert_one(collection, *args, **kwargs)
+
+        outcomes = []
+
+        def submit():
+            try:
+                outcomes.append(self.manager.submit(pipeline()))
+            except JobQueueFull:
+                outcomes.append(None)
+
+        with mock.patch.object(mongomock.collection.Collection, 'insert_one', slow_insert), \
+                mock.patch('app.utils.jobs.process_pipeline', lambda *args, **kwargs: release.wait()):
+            threads = [threading.Thread(target=submit) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len([job_id for job_id in outcomes if job_id]), self.manager.max_queued)
+
+    def test_monitor_logs_failed_ticks(self):
+        manager = JobManager(max_workers=1, max_queued=4, heartbeat_seconds=0.01, stale_seconds=600,
+                             max_attempts=2)
+        self.addCleanup(manager.shutdown)
+
+        def fail():
+            manager._stopped.set()
+            raise RuntimeError('server selection timed out')
+
+        with mock.patch.object(manager, '_heartbeat', fail), self.assertLogs('app.utils.jobs', 'ERROR') as logs:
+            manager._monitor.join(5)
+        self.assertIn('server selection timed out', logs.output[0])
+
+    def test_unknown_mode_is_rejected_on_submit(self):
+        with self.assertRaises(PipelineValidationError):
+            self.manager.submit({**pipeline(), 'mode': 'turbo'})
+        self.assertEqual(mongo.get_jobs_collection().count_documents({}), 0)
+
+    def test_result_that_cannot_be_stored_fails_the_job(self):
+        update_one = mongomock.collection.Collection.update_one
+
+        def reject_results(collection, query, update, *args, **kwargs):
+            if 'result' in update.get('$set', {}):
+                raise DocumentTooLarge('BSON document too large')
+            return update_one(collection, query, update, *args, **kwargs)
+
+        with mock.patch.object(mongomock.collection.Collection, 'update_one', reject_results), \
+                self.assertLogs('app.utils.jobs', 'ERROR'):
+            job = self.run_job(pipeline())
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('BSON document too large', job['error'])
+        self.assertIsNone(job['result'])
+
+
+class BoardPatchTests(MongoTestCase):
+    def test_apply_ops(self):
+        board = {'nodes': [text_node('a'), text_node('b')], 'connections': [connect('a', 'output', 'b', 'input')]}
+        patched = apply_ops(board, [
+            {'op': 'move_node', 'node_id': 'a', 'position': {'x': 5, 'y': 6, 'z': 1}},
+            {'op': 'add_node', 'node': text_node('c')},
+            {'op': 'add_connection', 'connection': connect('b', 'output', 'c', 'input')},
+            {'op': 'delete_node', 'node_id': 'b'},
+        ])
+        self.assertEqual([node['id'] for node in patched['nodes']], ['a', 'c'])
+        self.assertEqual(patched['nodes'][0]['position'], {'x': 5, 'y': 6, 'z': 1})
+        # Connections of a deleted node go with it, added ones included
+        self.assertEqual(patched['connections'], [])
+        self.assertEqual(board['nodes'][0]['position']['x'], 0)
+
+    def test_add_node_with_existing_id_replaces_it(self):
+        project_id = new_board()
+        replacement = {**text_node('b', 999), 'title': 'replaced'}
+        self.assertEqual(save_patch(mongo.get_projects_collection(), {'_id': ObjectId(project_id)}, 1,
+                                    [{'op': 'add_node', 'node': replacement}]), 2)
+        nodes = stored(project_id)['nodes']
+        self.assertEqual([node['id'] for node in nodes], ['a', 'b', 'c'])
+        self.assertEqual(nodes[1]['title'], 'replaced')
+
+    def test_add_node_with_existing_id_replaces_it_in_documents_layout(self):
+        project_id = new_board()
+        query = {'_id': ObjectId(project_id)}
+        convert(mongo.get_projects_collection(), project_id, query, DOCUMENTS)
+        patch_board(mongo.get_projects_collection(), project_id, query, 2,
+                    [{'op': 'add_node', 'node': {**text_node('b', 999), 'title': 'replaced'}}])
+        nodes, _ = load_board(project_id)
+        self.assertEqual(sorted(node['id'] for node in nodes), ['a', 'b', 'c'])
+        self.assertEqual([node['title'] for node in nodes if node['id'] == 'b'], ['replaced'])
+
+    def test_patch_is_one_update_with_updated_at(self):
+        project_id = new_board()
+        collection = mongo.get_projects_collection()
+        ops = [{'op': 'delete_node', 'node_id': 'c'}, {'op': 'add_node', 'node': text_node('d')},
+               {'op': 'move_node', 'node_id': 'a', 'position': {'x': 1, 'y': 2, 'z': 0}}]
+        with mock.patch.object(collection, 'update_one', wraps=collection.update_one) as update_one:
+            self.assertEqual(save_patch(collection, {'_id': ObjectId(project_id)}, 1, ops), 2)
+        self.assertEqual(update_one.call_count, 1)
+        project = stored(project_id)
+        self.assertEqual([node['id'] for node in project['nodes']], ['a', 'b', 'd'])
+        self.assertEqual(len(project['connections']), 1)
+        self.assertIn('updated_at', project)
+
+    def test_concurrent_write_rejects_the_whole_patch(self):
+        project_id = new_board()
+        collection = mongo.get_projects_collection()
+        update_one = collection.update_one
+
+        def write_first(*args, **kwargs):
+            # Another writer lands just before the patch
+            update_one({'_id': ObjectId(project_id)}, {'$inc': {'revision': 1}})
+            return update_one(*args, **kwargs)
+
+        ops = [{'op': 'delete_node', 'node_id': 'c'}, {'op': 'add_node', 'node': text_node('d')}]
+        with mock.patch.object(collection, 'update_one', side_effect=write_first):
+            with self.assertRaises(RevisionConflict):
+                save_patch(collection, {'_id': ObjectId(project_id)}, 1, ops)
+        self.assertEqual([node['id'] for node in stored(project_id)['nodes']], ['a', 'b', 'c'])
+
+    def test_move_does_not_send_the_board(self):
+        project_id = new_board([f"n{index}" for index in range(200)])
+        collection = mongo.get_projects_collection()
+        with mock.patch.object(collection, 'update_one', wraps=collection.update_one) as update_one:
+            save_patch(collection, {'_id': ObjectId(project_id)}, 1, [move('n7', 5)])
+        sent = BSON.encode({'update': update_one.call_args.args[1]})
+        self.assertLess(len(sent), 1000)
+        self.assertNotIn(b'n8', sent)
+        self.assertEqual(stored(project_id)['nodes'][7]['position']['x'], 5)
+
+    def test_patch_matches_apply_ops(self):
+        project_id = new_board()
+        collection = mongo.get_projects_collection()
+        ops = [{'op': 'update_node', 'node_id': 'b', 'changes': {'title': '$renamed'}},
+               {'op': 'add_connection', 'connection': connect('a', 'output', 'c', 'input')},
+               {'op': 'delete_node', 'node_id': 'a'},
+               {'op': 'add_node', 'node': text_node('a', 50)},
+               {'op': 'update_connection', 'connection_id': 'b->c', 'changes': {'z': 3}}]
+        expected = apply_ops(stored(project_id), ops)
+        save_patch(collection, {'_id': ObjectId(project_id)}, 1, ops)
+        project = stored(project_id)
+        self.assertEqual((project['nodes'], project['connections']), (expected['nodes'], expected['connections']))
+        self.assertEqual(project['revision'], 2)
+
+    def test_malformed_ops_are_patch_errors(self):
+        malformed = [
+            {'op': 'add_node', 'node': 5},
+            {'op': 'add_node', 'node': {'id': ['a']}},
+            {'op': 'add_connection', 'connection': 'a->b'},
+            {'op': 'update_node', 'node_id': 'a', 'changes': 3},
+            {'op': 'update_connection', 'connection_id': 'a->b', 'changes': ['z']},
+            {'op': 'move_node', 'node_id': {'id': 'a'}, 'position': {'x': 1}},
+            {'op': 'move_node', 'node_id': 'a', 'position': 7},
+            {'op': ['move_node']},
+        ]
+        for op in malformed:
+            with self.subTest(op=op), self.assertRaises(PatchError):
+                validate_ops([op])
+        response = PatchWhiteBoardView.as_view()(APIRequestFactory().patch(
+            '/', {'user_id': 'owner', 'revision': 1, 'ops': malformed[:1]}, format='json'), project_id=new_board())
+        self.assertEqual(response.status_code, 400)
+
+    def test_view_reports_stale_revision_as_conflict(self):
+        project_id = new_board()
+        view = PatchWhiteBoardView.as_view()
+        body = {'user_id': 'owner', 'revision': 1,
+                'ops': [{'op': 'move_node', 'node_id': 'a', 'position': {'x': 1, 'y': 1, 'z': 0}}]}
+        first = view(APIRequestFactory().patch('/', body, format='json'), project_id=project_id)
+        self.assertEqual((first.status_code, first.data['revision']), (200, 2))
+        second = view(APIRequestFactory().patch('/', body, format='json'), project_id=project_id)
+        self.assertEqual((second.status_code, second.data), (409, {
+            'error': 'Project was modified concurrently (current revision 2)', 'revision': 2}))
+
+
+class WhiteBoardETagTests(MongoTestCase):
+    def open(self, project_id, tag=None):
+        headers = {'HTTP_IF_NONE_MATCH': tag} if tag else {}
+        return views.OpenWhiteBoardView.as_view()(
+            APIRequestFactory().get('/', {'user_id': 'owner'}, **headers), project_id=project_id)
+
+    def test_not_modified_until_a_write(self):
+        project_id = new_board(created_at=datetime(2024, 1, 1))
+        opened = self.open(project_id)
+        self.assertEqual((opened.status_code, opened['ETag']), (200, f'"{project_id}:1"'))
+        # The revision is known from the first open, so this one reads nothing
+        with mock.patch.object(mongomock.collection.Collection, 'find_one') as find_one:
+            again = self.open(project_id, opened['ETag'])
+        find_one.assert_not_called()
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.open(project_id, f"W/{opened['ETag']}").status_code, 304)
+
+        patched = PatchWhiteBoardView.as_view()(APIRequestFactory().patch('/', {
+            'user_id': 'owner', 'revision': 1,
+            'ops': [{'op': 'move_node', 'node_id': 'a', 'position': {'x': 9, 'y': 9, 'z': 0}}],
+        }, format='json'), project_id=project_id)
+        self.assertEqual(patched.status_code, 200)
+        after = self.open(project_id, opened['ETag'])
+        self.assertEqual((after.status_code, after['ETag']), (200, f'"{project_id}:2"'))
+        self.assertEqual(after.data['project']['nodes'][0]['position']['x'], 9)
+
+
+@override_settings(AUTOSAVE_WINDOW_SECONDS=60)
+class AutosaveTests(MongoTestCase):
+    def upload(self, project_id, max_pending=10):
+        buffer = WriteBehindBuffer(window_seconds=60, max_pending=max_pending)
+        self.addCleanup(buffer.discard, project_id)
+        body = {'user_id': 'owner', 'project': {'id': project_id, 'name': 'Saved', 'nodes': [text_node('z')]}}
+        with mock.patch('app.views.autosave_buffer', buffer):
+            response = UploadWhiteBoardView.as_view()(APIRequestFactory().post('/', body, format='json'))
+        return response, buffer
+
+    def test_missing_project_is_not_found_before_buffering(self):
+        response, buffer = self.upload(str(ObjectId()))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(buffer.metrics()['received'], 0)
+
+    def test_save_is_queued(self):
+        project_id = new_board()
+        response, buffer = self.upload(project_id)
+        self.assertEqual((response.status_code, response.data['coalesced']), (202, False))
+        self.assertTrue(buffer.pending(project_id))
+        self.assertEqual(stored(project_id)['project_name'], 'Board')
+
+    def test_save_written_inline_when_buffer_is_full(self):
+        project_id = new_board()
+        response, buffer = self.upload(project_id, max_pending=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(buffer.pending(project_id))
+        self.assertEqual(buffer.metrics()['inline'], 1)
+        self.assertEqual(stored(project_id)['project_name'], 'Saved')
+
+
+class PaginationTests(MongoTestCase):
+    def all_pages(self, collection, field, order, limit):
+        pages, position = [], None
+        while True:
+            documents, cursor = paginate(collection, {}, {field: 1}, field, order, limit, position)
+            pages.append([document['_id'] for document in documents])
+            if cursor is None:
+                return pages
+            position = decode_cursor(cursor, field, order)
+
+    def test_null_and_missing_sort_values_are_not_skipped(self):
+        collection = mongo.get_projects_collection()
+        ids = collection.insert_many([{'rank': 2}, {'rank': None}, {'rank': 1}, {}, {'rank': 3}, {}]).inserted_ids
+        for order in ('asc', 'desc'):
+            everything, _ = paginate(collection, {}, {'rank': 1}, 'rank', order, 100)
+            pages = self.all_pages(collection, 'rank', order, 2)
+            self.assertEqual([document_id for page in pages for document_id in page],
+                             [document['_id'] for document in everything])
+            self.assertEqual(sorted(document['_id'] for document in everything), sorted(ids))
+
+    def test_listings_are_paged_by_default_and_capped(self):
+        mongo.get_projects_collection().insert_many([
+            {'user_id': 'owner', 'project_name': f"Project {index}", 'created_at': datetime(2024, 1, index + 1)}
+            for index in range(5)])
+        view = AllProjectsView.as_view()
+        with self.settings(PAGINATION_DEFAULT_LIMIT=2, PAGINATION_MAX_LIMIT=3):
+            first = view(APIRequestFactory().get('/', {'user_id': 'owner'}))
+            capped = view(APIRequestFactory().get('/', {'user_id': 'owner', 'limit': 500}))
+            rest = view(APIRequestFactory().get('/', {'user_id': 'owner', 'cursor': capped.data['next_cursor']}))
+        self.assertEqual([project['name'] for project in first.data['projects']], ['Project 4', 'Project 3'])
+        self.assertIsNotNone(first.data['next_cursor'])
+        self.assertEqual(len(capped.data['projects']), 3)
+        self.assertEqual(([project['name'] for project in rest.data['projects']], rest.data['next_cursor']),
+                         (['Project 1', 'Project 0'], None))
+
+
+def move(node_id, x):
+    return {'op': 'move_node', 'node_id': node_id, 'position': {'x': x, 'y': 0, 'z': 0}}
+
+
+class CollabTests(MongoTestCase):
+    def hub(self):
+        return CollabHub(ChannelLayer(100), tick_seconds=0.01, snapshot_seconds=60, snapshot_max_ops=1000)
+
+    def drain(self, hub, channel):
+        queue = hub.layer._queues[channel]
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    def test_two_members_edit_and_leave(self):
+        project_id = new_board()
+
+        async def scenario():
+            hub = self.hub()
+            first, second = hub.layer.new_channel(), hub.layer.new_channel()
+            room = await hub.join(project_id, first, 'owner')
+            self.assertEqual(self.drain(hub, first), [
+                {'type': 'welcome', 'revision': 1, 'seq': 0, 'members': ['owner']},
+                {'type': 'joined', 'user_id': 'owner'}])
+            await hub.join(project_id, second, 'editor')
+            self.assertEqual(self.drain(hub, second)[0]['members'], ['editor', 'owner'])
+            self.assertEqual(self.drain(hub, first), [{'type': 'joined', 'user_id': 'editor'}])
+
+            # Moves within a tick are compacted into one broadcast to both members
+            hub.submit(room, [move('a', 10)])
+            hub.submit(room, [move('a', 20), move('b', 30)])
+            await asyncio.sleep(0.05)
+            broadcast = {'type': 'ops', 'seq': 1, 'ops': [move('a', 20), move('b', 30)]}
+            self.assertEqual(self.drain(hub, first), [broadcast])
+            self.assertEqual(self.drain(hub, second), [broadcast])
+
+            await hub.leave(room, first)
+            self.assertEqual(self.drain(hub, second), [{'type': 'left', 'user_id': 'owner'}])
+            self.assertEqual(stored(project_id)['revision'], 1)
+            await hub.leave(room, second)
+            self.assertEqual(hub.rooms, {})
+            return hub
+
+        hub = asyncio.run(scenario())
+        project = stored(project_id)
+        self.assertEqual(project['revision'], 2)
+        self.assertEqual([node['position']['x'] for node in project['nodes']], [20, 30, 200])
+        self.assertEqual(hub.counters['snapshots'], 1)
+
+    def test_plain_save_mid_session_resyncs_the_room(self):
+        project_id = new_board()
+
+        async def scenario():
+            hub = self.hub()
+            channel = hub.layer.new_channel()
+            room = await hub.join(project_id, channel, 'owner')
+            self.drain(hub, channel)
+            hub.submit(room, [move('a', 10)])
+            hub._tick(room)
+            # An upload from outside the room replaces node c with z
+            save_board(mongo.get_projects_collection(), project_id, {'_id': ObjectId(project_id)},
+                       {'nodes': [text_node('a'), text_node('b'), text_node('z')], 'connections': []})
+            save = hub._save
+
+            async def edit_while_saving(room, ops):
+                # A move broadcast while the snapshot is in flight
+                hub.submit(room, [move('z', 7)])
+                hub._tick(room)
+                return await save(room, ops)
+
+            hub._save = edit_while_saving
+            await hub.snapshot(room)
+            messages = self.drain(hub, channel)
+            hub._save = save
+            await hub.leave(room, channel)
+            return hub, messages
+
+        hub, messages = asyncio.run(scenario())
+        self.assertEqual([message['type'] for message in messages], ['ops', 'ops', 'resync'])
+        resync = messages[2]
+        self.assertEqual((resync['revision'], resync['seq']), (3, 2))
+        self.assertEqual([(node['id'], node['position']['x']) for node in resync['nodes']],
+                         [('a', 10), ('b', 0), ('z', 7)])
+        self.assertEqual(hub.counters['resyncs'], 1)
+        self.assertEqual([(node['id'], node['position']['x']) for node in stored(project_id)['nodes']],
+                         [('a', 10), ('b', 0), ('z', 7)])
+
+    def test_welcome_revision_covers_ops_broadcast_while_saving(self):
+        project_id = new_board()
+
+        async def scenario():
+            hub = self.hub()
+            first, second = hub.layer.new_channel(), hub.layer.new_channel()
+            room = await hub.join(project_id, first, 'owner')
+            hub.submit(room, [move('a', 10)])
+            hub._tick(room)
+            save = hub._save
+
+            async def edit_while_saving(room, ops):
+                # The first member keeps dragging while the joiner waits for the save
+                revision = await save(room, ops)
+                if revision == 2:
+                    hub.submit(room, [move('a', 20)])
+                    hub._tick(room)
+                return revision
+
+            hub._save = edit_while_saving
+            await hub.join(project_id, second, 'editor')
+            return self.drain(hub, second)
+
+        messages = asyncio.run(scenario())
+        self.assertEqual(messages[0], {'type': 'welcome', 'revision': 3, 'seq': 2, 'members': ['editor', 'owner']})
+        self.assertEqual(messages[1:], [{'type': 'joined', 'user_id': 'editor'}])
+        self.assertEqual(stored(project_id)['revision'], 3)
+        self.assertEqual(stored(project_id)['nodes'][0]['position']['x'], 20)
+
+
+def clean(node_type, fields, **inputs):
+    """Run a data-cleaning operator on tables given as dicts of columns, returning its rows"""
+    tables = {port: to_table(value) for port, value in inputs.items()}
+    return get_operator(node_type)(tables, fields)['table'].to_json()['rows']
+
+
+PEOPLE = {'name': ['ann', 'bob', 'cy', 'dee', 'eve'], 'city': ['Oslo', 'Lima', 'Oslo', None, 'Lima'],
+          'age': [30, None, 25, 41, 30]}
+
+
+class CleaningTests(SimpleTestCase):
+    def column(self, rows, name):
+        return [row[name] for row in rows]
+
+    def test_filter_rows(self):
+        self.assertEqual(self.column(clean('filterRows', {'column': 'age', 'operator': '>=', 'value': '30'},
+                                           data=PEOPLE), 'name'), ['ann', 'dee', 'eve'])
+        self.assertEqual(self.column(clean('filterRows', {'column': 'city', 'operator': 'isnull'}, data=PEOPLE),
+                                     'name'), ['dee'])
+        self.assertEqual(self.column(clean('filterRows', {'column': 'city', 'operator': 'contains', 'value': 'sl'},
+                                           data=PEOPLE), 'name'), ['ann', 'cy'])
+        with self.assertRaisesMessage(ValueError, 'Expected a number'):
+            clean('filterRows', {'column': 'age', 'operator': '==', 'value': 'old'}, data=PEOPLE)
+        with self.assertRaisesMessage(ValueError, 'Unknown filter operator'):
+            clean('filterRows', {'column': 'age', 'operator': '~'}, data=PEOPLE)
+
+    def test_type_cast_and_text_transform(self):
+        rows = clean('typeCast', {'columns': 'flag', 'type': 'bool'}, data={'flag': ['Yes', 'no', None, ' 1']})
+        self.assertEqual(self.column(rows, 'flag'), [True, False, None, True])
+        with self.assertRaisesMessage(ValueError, 'Column age has missing values'):
+            clean('typeCast', {'columns': 'age', 'type': 'int'}, data=PEOPLE)
+        rows = clean('textTransform', {'operations': 'upper,strip'}, data={'city': [' oslo ', None], 'n': [1, 2]})
+        self.assertEqual(rows, [{'city': 'OSLO', 'n': 1}, {'city': None, 'n': 2}])
+        with self.assertRaisesMessage(ValueError, 'Unknown text operation: shout'):
+            clean('textTransform', {'operations': 'shout'}, data=PEOPLE)
+
+    def test_fill_missing(self):
+        data = {'x': [None, 1.0, None, 4.0, 4.0], 'city': PEOPLE['city']}
+        self.assertEqual(self.column(clean('fillMissing', {'strategy': 'mean', 'columns': 'x'}, data=data), 'x'),
+                         [3.0, 1.0, 3.0, 4.0, 4.0])
+        self.assertEqual(self.column(clean('fillMissing', {'strategy': 'median', 'columns': 'x'}, data=data), 'x'),
+                         [4.0, 1.0, 4.0, 4.0, 4.0])
+        rows = clean('fillMissing', {'strategy': 'mode'}, data=data)
+        self.assertEqual((self.column(rows, 'x'), self.column(rows, 'city')),
+                         ([4.0, 1.0, 4.0, 4.0, 4.0], ['Oslo', 'Lima', 'Oslo', 'Lima', 'Lima']))
+        # A leading gap has nothing to copy from
+        self.assertEqual(self.column(clean('fillMissing', {'strategy': 'ffill'}, data=data), 'x'),
+                         [None, 1.0, 1.0, 4.0, 4.0])
+        self.assertEqual(self.column(clean('fillMissing', {'strategy': 'value', 'value': '0'}, data=data), 'x'),
+                         [0.0, 1.0, 0.0, 4.0, 4.0])
+        with self.assertRaisesMessage(ValueError, 'Column city is not numeric'):
+            clean('fillMissing', {'strategy': 'mean'}, data=data)
+        with self.assertRaisesMessage(ValueError, 'Unknown fill strategy: guess'):
+            clean('fillMissing', {'strategy': 'guess'}, data=data)
+
+    def test_dedupe(self):
+        self.assertEqual(self.column(clean('dedupe', {'columns': 'city'}, data=PEOPLE), 'name'), ['ann', 'bob', 'dee'])
+        self.assertEqual(self.column(clean('dedupe', {'columns': 'city,age'}, data=PEOPLE), 'name'), PEOPLE['name'])
+        self.assertEqual(self.column(clean('dedupe', {'columns': 'age', 'keep': 'last'}, data=PEOPLE), 'name'),
+                         ['bob', 'cy', 'dee', 'eve'])
+        with self.assertRaisesMessage(ValueError, 'keep must be first or last'):
+            clean('dedupe', {'keep': 'middle'}, data=PEOPLE)
+        with self.assertRaisesMessage(ValueError, 'Unknown column: zip'):
+            clean('dedupe', {'columns': 'zip'}, data=PEOPLE)
+
+    def test_sort_rows_puts_missing_last(self):
+        self.assertEqual(self.column(clean('sortRows', {'column': 'age'}, data=PEOPLE), 'name'),
+                         ['cy', 'ann', 'eve', 'dee', 'bob'])
+        self.assertEqual(self.column(clean('sortRows', {'column': 'city', 'order': 'desc'}, data=PEOPLE), 'name'),
+                         ['ann', 'cy', 'bob', 'eve', 'dee'])
+        with self.assertRaisesMessage(ValueError, 'order must be asc or desc'):
+            clean('sortRows', {'column': 'age', 'order': 'up'}, data=PEOPLE)
+
+    def test_normalize(self):
+        data = {'x': [2.0, None, 6.0, 4.0], 'same': [5, 5, 5, 5], 'city': ['a', 'b', 'c', 'd']}
+        rows = clean('normalize', {}, data=data)
+        self.assertEqual(self.column(rows, 'x'), [0.0, None, 1.0, 0.5])
+        # A constant column has no spread to scale by
+        self.assertEqual(self.column(rows, 'same'), [0.0] * 4)
+        self.assertEqual(self.column(rows, 'city'), data['city'])
+        rows = clean('normalize', {'method': 'zscore', 'columns': 'x'}, data=data)
+        self.assertAlmostEqual(rows[0]['x'], -2 / (8 / 3) ** 0.5)
+        self.assertEqual((rows[1]['x'], rows[3]['x']), (None, 0.0))
+        with self.assertRaisesMessage(ValueError, 'Column city is not numeric'):
+            clean('normalize', {'columns': 'city'}, data=data)
+        with self.assertRaisesMessage(ValueError, 'Unknown normalization method: log'):
+            clean('normalize', {'method': 'log'}, data=data)
+
+    def test_join(self):
+        left = {'id': [1, 2, 3, None], 'name': ['a', 'b', 'c', 'd']}
+        right = {'id': [2, 2, 4, None], 'name': ['x', 'y', 'z', 'w'], 'score': [1.5, 2.5, 3.5, 4.5]}
+        self.assertEqual(clean('join', {'on': 'id'}, left=left, right=right), [
+            {'id': 2.0, 'name': 'b', 'name_right': 'x', 'score': 1.5},
+            {'id': 2.0, 'name': 'b', 'name_right': 'y', 'score': 2.5}])
+        # Missing keys never match, not even each other
+        rows = clean('join', {'on': 'id', 'how': 'left'}, left=left, right=right)
+        self.assertEqual([(row['name'], row['name_right'], row['score']) for row in rows],
+                         [('a', None, None), ('b', 'x', 1.5), ('b', 'y', 2.5), ('c', None, None), ('d', None, None)])
+        with self.assertRaisesMessage(ValueError, 'Join needs at least one column in on'):
+            clean('join', {}, left=left, right=right)
+        with self.assertRaisesMessage(ValueError, 'how must be inner or left'):
+            clean('join', {'on': 'id', 'how': 'outer'}, left=left, right=right)
+        with self.assertRaisesMessage(ValueError, 'Unknown column: name'):
+            clean('join', {'on': 'name'}, left=left, right={'id': [1]})
+
+    def test_group_aggregate(self):
+        rows = clean('groupAggregate', {'by': 'city', 'aggregations': 'age:mean, age:max, age:count, *:count'},
+                     data=PEOPLE)
+        # Groups come in key order, a missing key first
+        self.assertEqual(rows, [
+            {'city': None, 'age_mean': 41.0, 'age_max': 41.0, 'age_count': 1, 'count': 1},
+            {'city': 'Lima', 'age_mean': 30.0, 'age_max': 30.0, 'age_count': 1, 'count': 2},
+            {'city': 'Oslo', 'age_mean': 27.5, 'age_max': 30.0, 'age_count': 2, 'count': 2}])
+        self.assertEqual(clean('groupAggregate', {'aggregations': 'age:sum, age:min'}, data=PEOPLE),
+                         [{'age_sum': 126.0, 'age_min': 25.0}])
+        with self.assertRaisesMessage(ValueError, 'Aggregation must look like column:count|sum|mean|min|max'):
+            clean('groupAggregate', {'by': 'city', 'aggregations': 'age:median'}, data=PEOPLE)
+        with self.assertRaisesMessage(ValueError, 'Column name is not numeric'):
+            clean('groupAggregate', {'by': 'city', 'aggregations': 'name:sum'}, data=PEOPLE)
+
+
+class ExecutionModeTests(SimpleTestCase):
+    def results(self, mode, fusion, body=None):
+        with self.settings(PIPELINE_FUSION=fusion, PIPELINE_FUSION_BATCH_ROWS=7, STREAM_BATCH_ROWS=7):
+            response = ExecutePipelineView.as_view()(
+                APIRequestFactory().post('/', {**(body or pipeline()), 'mode': mode}, format='json'))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def outputs(self, data):
+        # Stream mode also counts the batches each table came in
+        return {node_id: (result['status'], {port: {key: value for key, value in output.items() if key != 'batches'}
+                                             if isinstance(output, dict) else output
+                                             for port, output in result['outputs'].items()})
+                for node_id, result in data['results'].items()}
+
+    def test_fused_and_unfused_outputs_match(self):
+        fused, unfused = self.results('batch', True), self.results('batch', False)
+        self.assertEqual((fused['fused'], unfused['fused']), ([['cast', 'filter', 'text']], []))
+        self.assertEqual(self.outputs(fused), self.outputs(unfused))
+        self.assertEqual(fused['results']['text']['outputs']['text-output-table']['num_rows'], 18)
+
+    def test_stream_and_batch_outputs_match(self):
+        self.assertEqual(self.outputs(self.results('stream', True)), self.outputs(self.results('batch', False)))
+
+    def test_stream_run_is_profiled_as_a_whole(self):
+        data = self.results('stream', True, {**pipeline(), 'profile': True})
+        profile = data['profile']
+        self.assertFalse(profile['per_node'])
+        self.assertGreater(profile['total_ms'], 0)
+        self.assertRegex(profile['folded'], r'^pipeline;\[stream\] \d+$')
+
+    def test_unknown_mode_is_a_bad_request(self):
+        response = ExecutePipelineView.as_view()(
+            APIRequestFactory().post('/', {**pipeline(), 'mode': 'turbo'}, format='json'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['code'] for error in response.data['errors']], ['invalid_mode'])
+
+    def assertModesAgree(self, csv, node_type, data):
+        body = {'nodes': [csv_input(csv), table_node('clean', node_type, data)],
+                'connections': [connect('input', 'output', 'clean', 'data')], 'use_cache': False}
+        batch = self.outputs(self.results('batch', False, body))
+        self.assertEqual(self.outputs(self.results('stream', True, body)), batch)
+        self.assertEqual(batch['clean'][0], 'success')
+        return batch['clean'][1]['clean-output-table']
+
+    def test_column_empty_in_the_first_batch_widens_to_text(self):
+        csv = 'id,note\n' + '\n'.join(f"{index},{'' if index < 9 else 'hello'}" for index in range(20))
+        output = self.assertModesAgree(csv, 'filterRows', {'column': 'note', 'operator': 'contains', 'value': 'hel'})
+        self.assertEqual((output['num_rows'], output['dtypes']['note']), (11, 'object'))
+
+    def test_fill_missing_mean_and_mode_fill_only_columns_with_gaps(self):
+        rows = [f"{index},{'' if index % 5 == 2 else index % 4},{['x', 'y', 'y'][index % 3]},"
+                f"{'' if index % 6 == 1 else ['b', 'a'][index % 2]}" for index in range(20)]
+        csv = 'id,qty,city,tag\n' + '\n'.join(rows)
+        output = self.assertModesAgree(csv, 'fillMissing', {'strategy': 'mode', 'columns': ''})
+        self.assertEqual(output['dtypes'], {'id': 'int64', 'qty': 'float64', 'city': 'object', 'tag': 'object'})
+        self.assertNotIn(None, [row['tag'] for row in output['rows']])
+        output = self.assertModesAgree(csv.replace(',b', ',').replace(',a', ','), 'fillMissing',
+                                       {'strategy': 'mean', 'columns': 'id,qty,city'})
+        self.assertEqual(output['dtypes']['id'], 'int64')
+        self.assertNotIn(None, [row['qty'] for row in output['rows']])
+
+
+class HistoryTests(MongoTestCase):
+    def board(self, *node_ids, x=0):
+        return {'nodes': [text_node(node_id, x) for node_id in node_ids], 'connections': []}
+
+    def assertVersion(self, versions, version, board, kind):
+        rebuilt = versions.reconstruct('p', version)
+        self.assertEqual({'nodes': rebuilt['nodes'], 'connections': rebuilt['connections']}, board)
+        stored_kind = mongo.get_versions_collection().find_one({'project_id': 'p', 'version': version})['kind']
+        self.assertEqual(stored_kind, kind)
+
+    def test_saves_and_patches_rebuild_every_version(self):
+        versions = VersionHistory(snapshot_every=3, head_entries=4, head_max_bytes=10 ** 6)
+        versions.record_state('p', 1, {**self.board('a', 'b'), 'project_name': 'Board'})
+        versions.record_ops('p', 2, [move('a', 50)], load_board=self.fail)
+        versions.record_state('p', 3, self.board('a', 'b', 'c'))
+        versions.record_ops('p', 4, [{'op': 'delete_node', 'node_id': 'b'}], load_board=self.fail)
+
+        moved = self.board('a', 'b')
+        moved['nodes'][0]['position']['x'] = 50
+        self.assertVersion(versions, 1, self.board('a', 'b'), 'snapshot')
+        self.assertVersion(versions, 2, moved, 'delta')
+        self.assertVersion(versions, 3, self.board('a', 'b', 'c'), 'delta')
+        self.assertVersion(versions, 4, self.board('a', 'c'), 'snapshot')
+        self.assertEqual(versions.reconstruct('p')['project_name'], 'Board')
+
+    def test_cached_head_behind_the_store_is_rebuilt(self):
+        ours = VersionHistory(snapshot_every=50, head_entries=4, head_max_bytes=10 ** 6)
+        other_process = VersionHistory(snapshot_every=50, head_entries=4, head_max_bytes=10 ** 6)
+        ours.record_state('p', 1, self.board('a', 'b'))
+        other_process.record_state('p', 2, self.board('a'))
+        # Diffed against our stale head this save would look like no change at all
+        ours.record_state('p', 3, self.board('a', 'b'))
+        self.assertVersion(ours, 2, self.board('a'), 'delta')
+        self.assertVersion(ours, 3, self.board('a', 'b'), 'delta')
+
+    def test_patch_after_unrecorded_revisions_is_a_snapshot_of_the_stored_board(self):
+        versions = VersionHistory(snapshot_every=50, head_entries=4, head_max_bytes=10 ** 6)
+        versions.record_state('p', 1, self.board('a'))
+        versions.record_ops('p', 4, [{'op': 'add_node', 'node': text_node('c')}],
+                            load_board=lambda: self.board('a', 'b', 'c'))
+        self.assertVersion(versions, 4, self.board('a', 'b', 'c'), 'snapshot')
+        self.assertIsNone(versions.reconstruct('p', 2))
+
+    def test_consecutive_patch_is_recorded_from_the_cached_head(self):
+        versions = VersionHistory(snapshot_every=50, head_entries=4, head_max_bytes=10 ** 6)
+        versions.record_state('p', 1, self.board(*'abcdefgh'))
+        with mock.patch.object(mongomock.collection.Collection, 'find_one') as find_one, \
+                mock.patch('app.utils.history._size', wraps=history_module._size) as size:
+            versions.record_ops('p', 2, [move('a', 50)], load_board=self.fail)
+        find_one.assert_not_called()
+        # Only the ops are measured, not the board
+        self.assertEqual([call.args[0] for call in size.call_args_list], [[move('a', 50)]])
+        self.assertEqual(mongo.get_versions_collection().find_one({'version': 2})['kind'], 'delta')
+
+    def test_saves_record_their_version_in_the_background(self):
+        project_id = new_board()
+        started, release = threading.Event(), threading.Event()
+        record_state = history.record_state
+
+        def blocked(*args):
+            started.set()
+            release.wait(5)
+            return record_state(*args)
+
+        with mock.patch.object(history, 'record_state', blocked):
+            self.assertEqual(save_board(mongo.get_projects_collection(), project_id, {'_id': ObjectId(project_id)},
+                                        {'nodes': [text_node('a')], 'connections': []}), 2)
+            self.assertTrue(started.wait(5))
+            self.assertEqual(mongo.get_versions_collection().count_documents({}), 0)
+            release.set()
+            history.flush()
+        self.assertEqual(history.reconstruct(project_id, 2)['nodes'], [text_node('a')])
+
+    def test_locks_do_not_grow_with_projects(self):
+        versions = VersionHistory(snapshot_every=50, head_entries=4, head_max_bytes=10 ** 6)
+        for index in range(20):
+            versions.record_state(f"p{index}", 1, self.board('a'))
+        self.assertEqual(len(versions._locks), 4)
+        self.assertEqual(len(versions.heads), 4)
+
+
+class IndexTests(MongoTestCase):
+    def actions(self, report, collection='project_versions'):
+        return {entry['index']: entry['action'] for entry in report if entry['collection'] == collection}
+
+    def test_ensure_indexes_creates_rebuilds_and_reports(self):
+        self.assertEqual(self.actions(ensure_indexes()), {'project_id_version': 'created'})
+        self.assertEqual(set(self.actions(ensure_indexes(), 'users').values()), {'ok'})
+        versions = mongo.get_versions_collection()
+        versions.drop_index('project_id_version')
+        versions.create_index([('project_id', 1), ('version', 1)], name='project_id_version')
+        # The listing index the unique one made redundant, left behind by an older deploy
+        versions.create_index([('project_id', 1), ('version', 1), ('_id', 1)], name='project_id_version_id')
+        self.assertEqual(self.actions(ensure_indexes()),
+                         {'project_id_version': 'rebuilt', 'project_id_version_id': 'undeclared'})
+        self.assertEqual(self.actions(ensure_indexes(drop_extra=True)),
+                         {'project_id_version': 'ok', 'project_id_version_id': 'dropped'})
+        self.assertTrue(versions.index_information()['project_id_version']['unique'])
+        self.assertNotIn('project_id_version_id', versions.index_information())
+
+
+class ResultStoreTests(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def files(self):
+        return sorted(name for _, _, names in os.walk(self.directory) for name in names if name != 'usage')
+
+    def test_entry_over_the_limit_once_pickled_is_skipped(self):
+        words = np.empty(1000, dtype=object)
+        words[:] = [f"a long string value number {index}" for index in range(1000)]
+        outputs = {'table': Table({'word': words})}
+        store = ResultStore(self.directory, max_bytes=10 ** 9, max_entry_bytes=16 * 1024)
+        self.assertLess(sizeof(outputs), store.max_entry_bytes)
+        store.put('big', outputs)
+        self.assertEqual((store.counters['skipped'], store.counters['writes']), (1, 0))
+        self.assertEqual(self.files(), [])
+        store.put('small', {'table': Table({'word': words[:10]})})
+        self.assertEqual(store.counters['writes'], 1)
+        self.assertIsNotNone(store.get('small'))
+
+    def test_failed_write_leaves_no_temporary_file(self):
+        store = ResultStore(self.directory, max_bytes=10 ** 9, max_entry_bytes=10 ** 9)
+        with mock.patch('app.utils.result_store.os.replace', side_effect=OSError('disk full')), \
+                self.assertLogs('app.utils.result_store', 'WARNING'):
+            store.put('key', {'value': 1})
+        self.assertEqual(store.counters['errors'], 1)
+        self.assertEqual(self.files(), [])
+
+    def test_store_follows_the_settings(self):
+        with self.settings(RESULT_STORE_ENABLED=False):
+            self.assertIsNone(get_result_store())
+        with self.settings(RESULT_STORE_ENABLED=True, RESULT_STORE_DIR=self.directory):
+            self.assertEqual(get_result_store().directory, self.directory)
+
+    def test_dataset_source_is_not_stored(self):
+        with self.settings(DATASET_DIR=os.path.join(self.directory, 'datasets'), RESULT_STORE_ENABLED=True,
+                           RESULT_STORE_DIR=os.path.join(self.directory, 'results')):
+            store = get_result_store()
+            dataset = datasets.ingest(b'id,city,qty\n1,Paris,3\n2,Lima,9\n3,Oslo,12\n')
+            data = pipeline()
+            data['nodes'][0] = make_node('input', 'inputManager', {'text': '', 'csv file': dataset['id']},
+                                         [('input text', 'text')], [('output', 'text'), ('output number', 'text')])
+            execution = executor.execute_graph(data['nodes'], data['connections'], use_cache=False)
+        results = execution['results']
+        self.assertEqual(results['text']['outputs']['text-output-table']['num_rows'], 2)
+        self.assertIsNone(store.get(results['input']['key']))
+        self.assertIsNotNone(store.get(results['text']['key']) or store.get(f"{results['text']['key']}:preview"))
+
+
+@unittest.skipUnless(mongomock_motor, 'mongomock_motor is not installed')
+@override_settings(AUTOSAVE_WINDOW_SECONDS=60)
+class ViewParityTests(MongoTestCase):
+    """The async views answer every request as the sync views do"""
+
+    def setUp(self):
+        super().setUp()
+        client = mongomock_motor.AsyncMongoMockClient(mock_mongo_client=mongo._client)
+        patcher = mock.patch.object(mongo, 'get_async_client', lambda: client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def board(self, layout=None, **fields):
+        project_id = new_board(created_at=datetime(2024, 1, 1), **fields)
+        if layout:
+            convert(mongo.get_projects_collection(), project_id, {'_id': ObjectId(project_id)}, layout)
+        return project_id
+
+    def call(self, module, name, request, **kwargs):
+        view = getattr(module, name).as_view()
+        if module is async_views:
+            response = asyncio.run(view(request, **kwargs))
+        else:
+            response = view(request, **kwargs)
+            response.render()
+        return response.status_code, response.get('ETag'), json.loads(response.content) if response.content else None
+
+    def compare(self, name, make_request, project_id=None):
+        """The sync and async replies to make_request(project_id), on a fresh board each if project_id is None"""
+        replies = []
+        for module in (views, async_views):
+            target = project_id or self.board()
+            # Served from the board cache, the async view would not touch MongoDB
+            board_cache.invalidate(target)
+            request, kwargs = make_request(target)
+            replies.append(self.call(module, name, request, **kwargs))
+        self.assertEqual(replies[0], replies[1])
+        return replies[0]
+
+    def post(self, body, content_type='application/json'):
+        data = body if isinstance(body, bytes) else json.dumps(body)
+        return RequestFactory().post('/', data, content_type=content_type)
+
+    def test_bad_request_bodies(self):
+        for body in (b'{"user_id": ', b'[1, 2]', {'user_id': 'owner'}):
+            status, _, reply = self.compare('NewProjectView', lambda _: (self.post(body), {}))
+            self.assertEqual(status, 400)
+        self.assertEqual(reply, {'error': 'User ID and project name are required'})
+        status, _, reply = self.compare('UploadWhiteBoardView', lambda _: (self.post(b'{nope'), {}))
+        self.assertEqual(status, 400)
+        self.assertTrue(reply['error'].startswith('JSON parse error - '))
+        self.compare('OpenWhiteBoardView', lambda project_id: (self.post(b'{nope'), {'project_id': project_id}))
+
+    def test_open(self):
+        project_id = self.board(DOCUMENTS)
+        status, tag, _ = self.compare('OpenWhiteBoardView', lambda project_id: (
+            RequestFactory().get('/', {'user_id': 'owner'}), {'project_id': project_id}), project_id)
+        self.assertEqual(status, 200)
+        get = RequestFactory().get
+        requests = [
+            (lambda: get('/', {'user_id': 'owner'}, HTTP_IF_NONE_MATCH=tag), project_id, 304),
+            (lambda: get('/', {'user_id': 'owner', 'metadata_only': 'true'}), project_id, 200),
+            (lambda: self.post({'user_id': 'owner', 'metadata_only': True}), project_id, 200),
+            (lambda: get('/', {'user_id': 'stranger'}), project_id, 403),
+            (lambda: get('/', {'user_id': 'owner'}), str(ObjectId()), 404),
+            (lambda: get('/'), project_id, 400),
+        ]
+        for request, target, expected in requests:
+            status, _, _ = self.compare('OpenWhiteBoardView', lambda _: (request(), {'project_id': target}), target)
+            self.assertEqual(status, expected)
+
+    def test_listings(self):
+        project_id = self.board()
+        self.board(project_name='Other')
+        save_board(mongo.get_projects_collection(), project_id, {'_id': ObjectId(project_id)},
+                   {'project_name': 'Renamed', 'nodes': [text_node('a')], 'connections': []})
+        history.flush()
+        requests = [
+            ('AllProjectsView', RequestFactory().get('/', {'user_id': 'owner'}), {}, 200),
+            ('AllProjectsView', RequestFactory().get('/', {'user_id': 'owner', 'limit': 1}), {}, 200),
+            ('AllProjectsView', RequestFactory().get('/', {'user_id': 'owner', 'cursor': 'bad'}), {}, 400),
+            ('ProjectVersionsView', RequestFactory().get('/', {'user_id': 'owner'}), {'project_id': project_id}, 200),
+            ('ProjectVersionsView', RequestFactory().get('/', {'user_id': 'stranger'}), {'project_id': project_id},
+             403),
+            ('ProjectVersionView', RequestFactory().get('/', {'user_id': 'owner'}),
+             {'project_id': project_id, 'version': 2}, 200),
+            ('ProjectVersionView', RequestFactory().get('/', {'user_id': 'owner'}),
+             {'project_id': project_id, 'version': 9}, 404),
+        ]
+        for name, request, kwargs, expected in requests:
+            status, _, _ = self.compare(name, lambda _: (request, kwargs), project_id)
+            self.assertEqual(status, expected)
+
+    def test_viewport(self):
+        for layout in (None, DOCUMENTS):
+            project_id = self.board(layout)
+            for query, expected in (({'x0': 0, 'y0': 0, 'x1': 150, 'y1': 10, 'limit': 1}, 200),
+                                    ({'x0': 0, 'y0': 0, 'x1': 'wide', 'y1': 10}, 400)):
+                status, _, _ = self.compare('WhiteBoardViewportView', lambda project_id: (
+                    RequestFactory().get('/', {'user_id': 'owner', **query}), {'project_id': project_id}), project_id)
+                self.assertEqual(status, expected)
+
+    def test_writes(self):
+        def upload(project_id):
+            return self.post({'user_id': 'owner', 'flush': True,
+                              'project': {'id': project_id, 'name': 'Saved', 'nodes': [text_node('z')]}}), {}
+
+        def patch(revision, ops):
+            def make_request(project_id):
+                body = json.dumps({'user_id': 'owner', 'revision': revision, 'ops': ops})
+                return RequestFactory().patch('/', body, content_type='application/json'), {'project_id': project_id}
+            return make_request
+
+        self.assertEqual(self.compare('UploadWhiteBoardView', upload)[0], 200)
+        self.assertEqual(self.compare('PatchWhiteBoardView', patch(1, [move('a', 5)]))[0], 200)
+        self.assertEqual(self.compare('PatchWhiteBoardView', patch(0, [move('a', 5)]))[0], 409)
+        self.assertEqual(self.compare('PatchWhiteBoardView', patch(1, [{'op': 'explode'}]))[0], 400)
+        self.assertEqual(self.compare('DeleteProjectView', lambda project_id: (
+            RequestFactory().delete(f"/?project_id={project_id}"), {}))[0], 204)
+        self.assertEqual(self.compare('DeleteProjectView', lambda _: (
+            RequestFactory().delete(f"/?project_id={ObjectId()}"), {}))[0], 404)
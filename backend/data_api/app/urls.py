@@ -1,16 +1,36 @@
+from django.conf import settings
 from django.urls import path
-from .views import ExecutePipelineView, SignupView, LoginView, NewProjectView, AllUsersView, AllProjectsView, DeleteProjectView, OpenWhiteBoardView, UploadWhiteBoardView
+from .views import ExecutePipelineView, SubmitPipelineJobView, PipelineJobView, CancelPipelineJobView, PipelineJobEventsView, SignupView, LoginView, AllUsersView, DatasetsView, DatasetView, AutosaveMetricsView, WhiteBoardCacheStatsView, ResultStoreStatsView, CollabStatsView, HealthView
+from . import views, async_views
+
+# Project and whiteboard views: async ones under ASGI (see data_api/asgi.py), sync ones under WSGI
+crud = async_views if settings.API_ASYNC_VIEWS else views
 
 urlpatterns = [
     path('execute-pipeline/', ExecutePipelineView.as_view(), name='execute-pipeline'),
+    path('pipeline-jobs/', SubmitPipelineJobView.as_view(), name='submit-pipeline-job'),
+    path('pipeline-jobs/<str:job_id>/', PipelineJobView.as_view(), name='pipeline-job'),
+    path('pipeline-jobs/<str:job_id>/cancel/', CancelPipelineJobView.as_view(), name='cancel-pipeline-job'),
+    path('pipeline-jobs/<str:job_id>/events/', PipelineJobEventsView.as_view(), name='pipeline-job-events'),
     path('signup/', SignupView.as_view(), name='signup'),
     path('login/', LoginView.as_view(), name='login'),
-    path('new-project/', NewProjectView.as_view(), name='new-project'),
+    path('new-project/', crud.NewProjectView.as_view(), name='new-project'),
     path('all-users/', AllUsersView.as_view(), name='all-users'),
-    path('all-projects/', AllProjectsView.as_view(), name='all-projects'),
-    path('delete-project/', DeleteProjectView.as_view(), name='delete-project'),
-    path('whiteboard/<str:project_id>/', OpenWhiteBoardView.as_view(), name='open-whiteboard'),
-    path('upload-whiteboard/', UploadWhiteBoardView.as_view(), name='upload-whiteboard'),
+    path('all-projects/', crud.AllProjectsView.as_view(), name='all-projects'),
+    path('delete-project/', crud.DeleteProjectView.as_view(), name='delete-project'),
+    path('whiteboard/<str:project_id>/', crud.OpenWhiteBoardView.as_view(), name='open-whiteboard'),
+    path('whiteboard/<str:project_id>/patch/', crud.PatchWhiteBoardView.as_view(), name='patch-whiteboard'),
+    path('whiteboard/<str:project_id>/viewport/', crud.WhiteBoardViewportView.as_view(), name='whiteboard-viewport'),
+    path('whiteboard/<str:project_id>/versions/', crud.ProjectVersionsView.as_view(), name='project-versions'),
+    path('whiteboard/<str:project_id>/versions/<int:version>/', crud.ProjectVersionView.as_view(), name='project-version'),
+    path('datasets/', DatasetsView.as_view(), name='datasets'),
+    path('datasets/<str:dataset_id>/', DatasetView.as_view(), name='dataset'),
+    path('upload-whiteboard/', crud.UploadWhiteBoardView.as_view(), name='upload-whiteboard'),
+    path('autosave-metrics/', AutosaveMetricsView.as_view(), name='autosave-metrics'),
+    path('whiteboard-cache-stats/', WhiteBoardCacheStatsView.as_view(), name='whiteboard-cache-stats'),
+    path('result-store-stats/', ResultStoreStatsView.as_view(), name='result-store-stats'),
+    path('collab-stats/', CollabStatsView.as_view(), name='collab-stats'),
+    path('health/', HealthView.as_view(), name='health'),
 ] 
 
 #as_view() is a method that converts class-based view into a function based view that takes request and return response
@@ -0,0 +1,171 @@
+"""Write-behind buffer for whiteboard autosaves.
+
+While someone drags nodes around the frontend saves several times a second.
+Saves for the same project arriving within the window are merged and only
+the latest state is written, once, when the window closes. Pending saves
+are flushed before the project is read or patched, and at shutdown.
+
+The buffer lives in one process. Reads served by that process see its
+pending saves, but under several worker processes a read landing on another
+worker can return the state from before the window, until the flush. Set
+AUTOSAVE_WINDOW_SECONDS to 0 where clients need read-your-writes across
+workers without session affinity.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from bson.objectid import ObjectId
+from django.conf import settings
+
+from .board_cache import board_cache
+from .board_storage import save_board
+from .mongo import get_projects_collection
+
+logger = logging.getLogger(__name__)
+
+# What put() did with a save
+QUEUED = 'queued'
+COALESCED = 'coalesced'
+WRITTEN = 'written'
+
+
+class WriteBehindBuffer:
+    def __init__(self, window_seconds, max_pending):
+        self.window_seconds = window_seconds
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        # project id -> (deadline, project_data)
+        self._pending = {}
+        # project ids currently being written, so flushes of one project never overlap
+        self._flushing = set()
+        self._stopped = False
+        self._thread = None
+        self.counters = {'received': 0, 'coalesced': 0, 'flushed': 0, 'failed': 0, 'inline': 0}
+
+    def put(self, project_id, project_data):
+        """Queue a full-state save, returning QUEUED, COALESCED if it replaced a
+        pending one, or WRITTEN if the buffer was full and it was written inline"""
+        with self._cond:
+            self.counters['received'] += 1
+            pending = self._pending.get(project_id)
+            if pending is not None:
+                self._pending[project_id] = (pending[0], project_data)
+                self.counters['coalesced'] += 1
+                return COALESCED
+            if len(self._pending) >= self.max_pending:
+                self.counters['inline'] += 1
+                inline = True
+            else:
+                self._pending[project_id] = (time.monotonic() + self.window_seconds, project_data)
+                inline = False
+                self._ensure_thread()
+                self._cond.notify()
+        if inline:
+            # Buffer is full: degrade to write-through rather than grow without bound
+            # A failed write is queued for the next window
+            return WRITTEN if self._write(project_id, project_data) else QUEUED
+        return QUEUED
+
+    def flush(self, project_id):
+        """Write a project's pending save now, e.g. before it is read"""
+        with self._cond:
+            while project_id in self._flushing:
+                self._cond.wait()
+            pending = self._pending.pop(project_id, None)
+            if pending is None:
+                return
+            self._flushing.add(project_id)
+        self._write_and_release(project_id, pending[1])
+
+    def pending(self, project_id):
+        """Whether flush(project_id) would have anything to write or wait for"""
+        with self._cond:
+            return project_id in self._pending or project_id in self._flushing
+
+    def discard(self, project_id):
+        with self._cond:
+            self._pending.pop(project_id, None)
+
+    def flush_all(self):
+        with self._cond:
+            project_ids = list(self._pending)
+        for project_id in project_ids:
+            self.flush(project_id)
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.flush_all()
+
+    def metrics(self):
+        with self._cond:
+            return {**self.counters, 'pending': len(self._pending), 'window_seconds': self.window_seconds}
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='autosave-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    now = time.monotonic()
+                    due = [pid for pid, (deadline, _) in self._pending.items()
+                           if deadline <= now and pid not in self._flushing]
+                    if due:
+                        break
+                    next_deadline = min((deadline for deadline, _ in self._pending.values()), default=None)
+                    self._cond.wait(None if next_deadline is None else max(next_deadline - now, 0.01))
+                if self._stopped:
+                    return
+                batch = [(pid, self._pending.pop(pid)[1]) for pid in due]
+                self._flushing.update(pid for pid, _ in batch)
+            for project_id, project_data in batch:
+                self._write_and_release(project_id, project_data)
+
+    def _write_and_release(self, project_id, project_data):
+        try:
+            self._write(project_id, project_data)
+        finally:
+            with self._cond:
+                self._flushing.discard(project_id)
+                self._cond.notify_all()
+
+    def _write(self, project_id, project_data):
+        """Save the state, returning False if it failed and was queued again"""
+        try:
+            # The updated_at guard stops a late flush from clobbering a newer
+            # save written directly or by another worker process
+            save_board(
+                get_projects_collection(), project_id,
+                {'_id': ObjectId(project_id), '$or': [
+                    {'updated_at': {'$lt': project_data['updated_at']}},
+                    {'updated_at': {'$exists': False}}
+                ]},
+                project_data
+            )
+        except Exception as e:
+            with self._cond:
+                self.counters['failed'] += 1
+                # Keep the state for the next window unless a newer save arrived meanwhile
+                if project_id not in self._pending:
+                    self._pending[project_id] = (time.monotonic() + self.window_seconds, project_data)
+            logger.exception(f"Autosave flush failed for project {project_id}: {str(e)}")
+            return False
+        # The flush bumped the revision; make the next open re-read it
+        board_cache.invalidate(project_id)
+        with self._cond:
+            self.counters['flushed'] += 1
+        return True
+
+
+autosave_buffer = WriteBehindBuffer(
+    window_seconds=settings.AUTOSAVE_WINDOW_SECONDS,
+    max_pending=settings.AUTOSAVE_MAX_PENDING,
+)
+
+atexit.register(autosave_buffer.shutdown)
@@ -0,0 +1,83 @@
+"""Revision registry and read-through cache for whiteboard documents.
+
+Every write path records the project's new revision (or forgets it) here,
+which lets OpenWhiteBoardView answer a conditional request with 304 without
+touching MongoDB, and serve hot public boards from memory. Entries expire
+after WHITEBOARD_CACHE_TTL_SECONDS, which bounds how long a write made by
+another worker process can go unnoticed.
+"""
+import json
+
+from django.conf import settings
+
+from .cache import LRUCache
+
+
+def etag(project_id, revision, metadata_only=False):
+    return f'"{project_id}:{revision}{":meta" if metadata_only else ""}"'
+
+
+def matches(if_none_match, tag):
+    # Weak comparison, as If-None-Match requires: compression weakens the ETag we sent
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or tag in [value.strip().removeprefix('W/')
+                                                   for value in if_none_match.split(',')]
+
+
+class BoardCache:
+    def __init__(self, max_entries, max_bytes, ttl_seconds):
+        # project id -> {'revision', 'user_id', 'collaborators', 'is_public'}
+        self.revisions = LRUCache(max_entries, ttl_seconds=ttl_seconds)
+        # project id -> (revision, client project data), public projects only
+        self.documents = LRUCache(
+            max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds,
+            sizeof=lambda entry: len(json.dumps(entry[1], default=str))
+        )
+
+    def remember(self, project_id, revision, user_id, collaborators, is_public):
+        self.revisions.set(project_id, {
+            'revision': revision,
+            'user_id': user_id,
+            'collaborators': frozenset(c.get('id') for c in collaborators or [] if isinstance(c, dict)),
+            'is_public': bool(is_public),
+        })
+
+    def bump(self, project_id, revision):
+        """Record a new revision after an edit that did not change access"""
+        entry = self.revisions.get(project_id)
+        if entry is not None:
+            self.revisions.set(project_id, {**entry, 'revision': revision})
+        self.documents.pop(project_id)
+
+    def invalidate(self, project_id):
+        self.revisions.pop(project_id)
+        self.documents.pop(project_id)
+
+    def known(self, project_id, user_id):
+        """The cached revision entry if `user_id` may read the project, else None"""
+        entry = self.revisions.get(project_id)
+        if entry is None:
+            return None
+        if entry['is_public'] or user_id == entry['user_id'] or user_id in entry['collaborators']:
+            return entry
+        return None
+
+    def store_document(self, project_id, revision, data):
+        self.documents.set(project_id, (revision, data))
+
+    def document(self, project_id, revision):
+        entry = self.documents.get(project_id)
+        if entry is None or entry[0] != revision:
+            return None
+        return entry[1]
+
+    def stats(self):
+        return {'revisions': self.revisions.stats(), 'documents': self.documents.stats()}
+
+
+board_cache = BoardCache(
+    max_entries=settings.WHITEBOARD_CACHE_ENTRIES,
+    max_bytes=settings.WHITEBOARD_CACHE_MAX_BYTES,
+    ttl_seconds=settings.WHITEBOARD_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,243 @@
+"""Whiteboard edit operations.
+
+A patch is a list of operations such as
+    {'op': 'move_node', 'node_id': 'n1', 'position': {'x': 10, 'y': 20, 'z': 1}}
+applied to a project's `nodes` and `connections`. `apply_ops` applies a
+patch to an in-memory board, and `save_patch` applies one to an embedded
+board in MongoDB as a single pipeline update guarded by the document
+revision, so a patch lands whole or not at all and only the ops are sent.
+"""
+import copy
+from datetime import datetime
+
+NODE_FIELDS = {'type', 'title', 'position', 'inputs', 'outputs', 'data'}
+CONNECTION_FIELDS = {'sourceNodeId', 'sourcePortId', 'targetNodeId', 'targetPortId', 'z'}
+
+OPS = {
+    'add_node': ('node',),
+    'update_node': ('node_id', 'changes'),
+    'move_node': ('node_id', 'position'),
+    'delete_node': ('node_id',),
+    'add_connection': ('connection',),
+    'update_connection': ('connection_id', 'changes'),
+    'delete_connection': ('connection_id',),
+}
+
+
+class PatchError(ValueError):
+    pass
+
+
+class RevisionConflict(Exception):
+    def __init__(self, revision):
+        self.revision = revision
+        super().__init__(f"Project was modified concurrently (current revision {revision})")
+
+
+def validate_ops(ops):
+    if not isinstance(ops, list) or not ops:
+        raise PatchError('ops must be a non-empty list')
+    for index, op in enumerate(ops):
+        if not isinstance(op, dict) or not isinstance(op.get('op'), str) or op['op'] not in OPS:
+            raise PatchError(f"Operation {index} has unknown op {op.get('op') if isinstance(op, dict) else op!r}")
+        missing = [field for field in OPS[op['op']] if field not in op]
+        if missing:
+            raise PatchError(f"Operation {index} ({op['op']}) is missing {', '.join(missing)}")
+        for field in OPS[op['op']]:
+            expected = str if field.endswith('_id') else dict
+            if not isinstance(op[field], expected):
+                raise PatchError(f"Operation {index} ({op['op']}) needs {field} to be "
+                                 f"{'a string' if expected is str else 'an object'}")
+        for kind in ('node', 'connection'):
+            if op['op'] == f"add_{kind}" and (not isinstance(op[kind].get('id'), str) or not op[kind]['id']):
+                raise PatchError(f"Operation {index} adds a {kind} without a string id")
+        allowed = NODE_FIELDS if op['op'] == 'update_node' else CONNECTION_FIELDS
+        if op['op'] in ('update_node', 'update_connection'):
+            unknown = set(op['changes']) - allowed
+            if unknown:
+                raise PatchError(f"Operation {index} ({op['op']}) cannot change {', '.join(sorted(unknown))}")
+
+
+def normalize(ops):
+    """Collapse a patch into its net effect.
+
+    Returns (deleted node ids, deleted connection ids, added nodes, added
+    connections, node changes, connection changes). Edits to something added
+    in the same patch are folded into the added document, and anything added
+    then deleted in the same patch disappears.
+    """
+    deleted_nodes, deleted_connections = [], []
+    added_nodes, added_connections = {}, {}
+    node_changes, connection_changes = {}, {}
+
+    for op in ops:
+        kind = op['op']
+        if kind == 'add_node':
+            added_nodes[op['node']['id']] = copy.deepcopy(op['node'])
+            node_changes.pop(op['node']['id'], None)
+        elif kind in ('update_node', 'move_node'):
+            changes = op['changes'] if kind == 'update_node' else {'position': op['position']}
+            target = added_nodes.get(op['node_id'])
+            if target is not None:
+                target.update(copy.deepcopy(changes))
+            else:
+                node_changes.setdefault(op['node_id'], {}).update(copy.deepcopy(changes))
+        elif kind == 'delete_node':
+            node_id = op['node_id']
+            node_changes.pop(node_id, None)
+            if added_nodes.pop(node_id, None) is None:
+                deleted_nodes.append(node_id)
+            # Connections to a deleted node go with it
+            for connection_id, connection in list(added_connections.items()):
+                if node_id in (connection.get('sourceNodeId'), connection.get('targetNodeId')):
+                    del added_connections[connection_id]
+        elif kind == 'add_connection':
+            added_connections[op['connection']['id']] = copy.deepcopy(op['connection'])
+            connection_changes.pop(op['connection']['id'], None)
+        elif kind == 'update_connection':
+            target = added_connections.get(op['connection_id'])
+            if target is not None:
+                target.update(copy.deepcopy(op['changes']))
+            else:
+                connection_changes.setdefault(op['connection_id'], {}).update(copy.deepcopy(op['changes']))
+        elif kind == 'delete_connection':
+            connection_changes.pop(op['connection_id'], None)
+            if added_connections.pop(op['connection_id'], None) is None:
+                deleted_connections.append(op['connection_id'])
+
+    return (deleted_nodes, deleted_connections, list(added_nodes.values()), list(added_connections.values()),
+            node_changes, connection_changes)
+
+
+def compact(ops):
+    """Rewrite a patch as its net effect in as few operations as possible.
+
+    A drag that produced a hundred move_node ops becomes one; the result
+    applies the same way as the input.
+    """
+    deleted_nodes, deleted_connections, added_nodes, added_connections, node_changes, connection_changes = \
+        normalize(ops)
+    compacted = [{'op': 'delete_node', 'node_id': node_id} for node_id in deleted_nodes]
+    compacted += [{'op': 'delete_connection', 'connection_id': connection_id} for connection_id in deleted_connections]
+    compacted += [{'op': 'add_node', 'node': node} for node in added_nodes]
+    compacted += [{'op': 'add_connection', 'connection': connection} for connection in added_connections]
+    for node_id, changes in node_changes.items():
+        if set(changes) == {'position'}:
+            compacted.append({'op': 'move_node', 'node_id': node_id, 'position': changes['position']})
+        else:
+            compacted.append({'op': 'update_node', 'node_id': node_id, 'changes': changes})
+    compacted += [{'op': 'update_connection', 'connection_id': connection_id, 'changes': changes}
+                  for connection_id, changes in connection_changes.items()]
+    return compacted
+
+
+def apply_ops(board, ops):
+    """Apply a patch to a board dict with `nodes` and `connections`, returning a new board"""
+    deleted_nodes, deleted_connections, added_nodes, added_connections, node_changes, connection_changes = \
+        normalize(ops)
+    deleted_nodes, deleted_connections = set(deleted_nodes), set(deleted_connections)
+    # Adding an id that already exists replaces it in place, as the documents layout's upsert does
+    added_nodes = {node['id']: node for node in added_nodes}
+    added_connections = {connection['id']: connection for connection in added_connections}
+
+    nodes = []
+    for node in board.get('nodes', []):
+        if node['id'] in deleted_nodes:
+            continue
+        if node['id'] in added_nodes:
+            nodes.append(added_nodes.pop(node['id']))
+            continue
+        node = copy.deepcopy(node)
+        node.update(node_changes.get(node['id'], {}))
+        nodes.append(node)
+    connections = []
+    for connection in board.get('connections', []):
+        if (connection['id'] in deleted_connections or connection.get('sourceNodeId') in deleted_nodes
+                or connection.get('targetNodeId') in deleted_nodes):
+            continue
+        if connection['id'] in added_connections:
+            connections.append(added_connections.pop(connection['id']))
+            continue
+        connection = copy.deepcopy(connection)
+        connection.update(connection_changes.get(connection['id'], {}))
+        connections.append(connection)
+
+    return {**board, 'nodes': nodes + list(added_nodes.values()),
+            'connections': connections + list(added_connections.values())}
+
+
+def revision_filter(revision):
+    # Projects saved before revisions existed have no field and count as 0
+    if revision == 0:
+        return {'$or': [{'revision': 0}, {'revision': {'$exists': False}}]}
+    return {'revision': revision}
+
+
+def _absent(value, values):
+    # {'$not': [{'$in': ...}]}, which mongomock gets wrong
+    return {'$eq': [{'$in': [value, values]}, False]}
+
+
+def _merged(item, changes):
+    """`item` with `changes` set; of repeated keys $arrayToObject keeps the last"""
+    return {'$arrayToObject': {'$concatArrays': [
+        {'$objectToArray': item}, {'$literal': [{'k': key, 'v': value} for key, value in changes.items()]}]}}
+
+
+def _patched(field, keep, added, changes):
+    """The array `field` with a patch applied as apply_ops does, as an aggregation expression"""
+    kept = {'$ifNull': [f"${field}", []]}
+    if keep is not None:
+        kept = {'$filter': {'input': kept, 'as': 'item', 'cond': keep}}
+    # An added id still on the board replaces the item in place, any other goes on the end
+    branches = [{'case': {'$eq': ['$$item.id', item['id']]}, 'then': {'$literal': item}} for item in added]
+    branches += [{'case': {'$eq': ['$$item.id', item_id]}, 'then': _merged('$$item', item_changes)}
+                 for item_id, item_changes in changes.items()]
+    array = kept
+    if branches:
+        array = {'$map': {'input': kept, 'as': 'item', 'in': {'$switch': {'branches': branches, 'default': '$$item'}}}}
+    if not added:
+        return array
+    kept_ids = {'$map': {'input': kept, 'as': 'item', 'in': '$$item.id'}}
+    return {'$concatArrays': [array, {'$filter': {'input': {'$literal': added}, 'as': 'new',
+                                                  'cond': _absent('$$new.id', kept_ids)}}]}
+
+
+def build_update(ops):
+    """The update pipeline that applies a patch to an embedded board.
+
+    Only the ops go over the wire: the arrays are filtered, mapped and
+    extended on the server, so moving one node of a large board does not
+    resend its nodes. Being one update, it lands whole or not at all.
+    """
+    deleted_nodes, deleted_connections, added_nodes, added_connections, node_changes, connection_changes = \
+        normalize(ops)
+    fields = {}
+    if deleted_nodes or added_nodes or node_changes:
+        fields['nodes'] = _patched('nodes', _absent('$$item.id', deleted_nodes) if deleted_nodes else None,
+                                   added_nodes, node_changes)
+    keep = [_absent('$$item.id', deleted_connections)] if deleted_connections else []
+    if deleted_nodes:
+        keep += [_absent('$$item.sourceNodeId', deleted_nodes), _absent('$$item.targetNodeId', deleted_nodes)]
+    if keep or added_connections or connection_changes:
+        fields['connections'] = _patched('connections', {'$and': keep} if keep else None, added_connections,
+                                         connection_changes)
+    revision = {'$add': [{'$ifNull': ['$revision', 0]}, 1]}
+    return [{'$set': {**fields, 'updated_at': datetime.now(), 'revision': revision}}]
+
+
+def save_patch(collection, query, revision, ops):
+    """Apply a patch to an embedded board in one update guarded by the document revision.
+
+    The update only matches while the revision is unchanged, so a
+    concurrent writer makes the whole patch fail instead of half of it
+    landing. Returns the new revision or raises RevisionConflict.
+    """
+    validate_ops(ops)
+    result = collection.update_one({'$and': [query, revision_filter(revision)]}, build_update(ops))
+    if result.matched_count:
+        return revision + 1
+    current = collection.find_one(query, {'revision': 1})
+    if current is None:
+        raise LookupError('Project not found')
+    raise RevisionConflict(current.get('revision', 0))
@@ -0,0 +1,260 @@
+"""Whiteboard storage layouts.
+
+Boards start out "embedded": `nodes` and `connections` are arrays inside the
+project document. That is one read per open, but it caps a board at
+MongoDB's 16 MB document limit and every open loads everything. Large boards
+switch to the "documents" layout: one document per node in `board_nodes` and
+per connection in `board_connections`, indexed by position, so a client can
+load just the viewport it is looking at.
+
+The project document keeps `storage: 'documents'` as the marker. The
+functions here dispatch on it so views, autosave and patches don't need to,
+and record every write in the version history (app/utils/history.py).
+"""
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from pymongo import DeleteMany, ReplaceOne, ReturnDocument, UpdateOne
+
+from .board_ops import normalize, revision_filter, save_patch, validate_ops, RevisionConflict
+from .history import history
+from .mongo import (get_board_nodes_collection, get_board_connections_collection,
+                    get_async_board_nodes_collection, get_async_board_connections_collection)
+from .pagination import apaginate, paginate
+
+logger = logging.getLogger(__name__)
+
+DOCUMENTS = 'documents'
+NOT_DOCUMENTS = {'storage': {'$ne': DOCUMENTS}}
+
+
+def is_documents(project):
+    return project.get('storage') == DOCUMENTS
+
+
+def _strip(document):
+    document.pop('_id', None)
+    document.pop('project_id', None)
+    return document
+
+
+def load_board(project_id):
+    """All nodes and connections of a documents-layout board"""
+    nodes = [_strip(doc) for doc in get_board_nodes_collection().find({'project_id': project_id})]
+    connections = [_strip(doc) for doc in get_board_connections_collection().find({'project_id': project_id})]
+    return nodes, connections
+
+
+def query_viewport(project_id, x0, y0, x1, y1, limit, position=None):
+    """One page of the nodes inside a rectangle, plus the connections touching them.
+
+    Pages are keyed on (position.x, _id), which the
+    (project_id, position.x, _id, position.y) index serves directly.
+    """
+    query = {
+        'project_id': project_id,
+        'position.x': {'$gte': x0, '$lte': x1},
+        'position.y': {'$gte': y0, '$lte': y1},
+    }
+    nodes, next_cursor = paginate(get_board_nodes_collection(), query, {'project_id': 0},
+                                  'position.x', 'asc', limit, position)
+    node_ids = [node['id'] for node in nodes]
+    connections = []
+    if node_ids:
+        connections = list(get_board_connections_collection().find(
+            {'project_id': project_id, '$or': [{'sourceNodeId': {'$in': node_ids}},
+                                               {'targetNodeId': {'$in': node_ids}}]},
+            {'_id': 0, 'project_id': 0}
+        ))
+    return [_strip(node) for node in nodes], connections, next_cursor
+
+
+async def aload_board(project_id):
+    """load_board on the async client"""
+    nodes = await get_async_board_nodes_collection().find({'project_id': project_id}).to_list()
+    connections = await get_async_board_connections_collection().find({'project_id': project_id}).to_list()
+    return [_strip(doc) for doc in nodes], [_strip(doc) for doc in connections]
+
+
+async def aquery_viewport(project_id, x0, y0, x1, y1, limit, position=None):
+    """query_viewport on the async client"""
+    query = {
+        'project_id': project_id,
+        'position.x': {'$gte': x0, '$lte': x1},
+        'position.y': {'$gte': y0, '$lte': y1},
+    }
+    nodes, next_cursor = await apaginate(get_async_board_nodes_collection(), query, {'project_id': 0},
+                                         'position.x', 'asc', limit, position)
+    node_ids = [node['id'] for node in nodes]
+    connections = []
+    if node_ids:
+        connections = await get_async_board_connections_collection().find(
+            {'project_id': project_id, '$or': [{'sourceNodeId': {'$in': node_ids}},
+                                               {'targetNodeId': {'$in': node_ids}}]},
+            {'_id': 0, 'project_id': 0}
+        ).to_list()
+    return [_strip(node) for node in nodes], connections, next_cursor
+
+
+def filter_viewport(nodes, connections, x0, y0, x1, y1):
+    """The same selection for an embedded board, done in memory"""
+    inside = [node for node in nodes
+              if x0 <= node.get('position', {}).get('x', 0) <= x1 and y0 <= node.get('position', {}).get('y', 0) <= y1]
+    ids = {node['id'] for node in inside}
+    return inside, [c for c in connections if c.get('sourceNodeId') in ids or c.get('targetNodeId') in ids]
+
+
+def write_documents(project_id, nodes, connections):
+    """Make the node/connection documents of a board exactly match the given lists"""
+    for collection, items in ((get_board_nodes_collection(), nodes), (get_board_connections_collection(), connections)):
+        ids = [item['id'] for item in items]
+        requests = [ReplaceOne({'project_id': project_id, 'id': item['id']}, {**item, 'project_id': project_id},
+                               upsert=True) for item in items]
+        requests.append(DeleteMany({'project_id': project_id, 'id': {'$nin': ids}}))
+        collection.bulk_write(requests, ordered=False)
+
+
+def delete_documents(project_id):
+    get_board_nodes_collection().delete_many({'project_id': project_id})
+    get_board_connections_collection().delete_many({'project_id': project_id})
+
+
+async def adelete_documents(project_id):
+    await get_async_board_nodes_collection().delete_many({'project_id': project_id})
+    await get_async_board_connections_collection().delete_many({'project_id': project_id})
+
+
+def _layout(collection, query):
+    project = collection.find_one(query, {'storage': 1})
+    if project is None:
+        return None
+    return DOCUMENTS if is_documents(project) else 'embedded'
+
+
+def _record(record, *args):
+    # History is best effort: a failure here must not fail the save itself
+    try:
+        record(*args)
+    except Exception as e:
+        logger.exception(f"Failed to record version history for project {args[0]}: {str(e)}")
+
+
+def _current_board(collection, project_id, query, revision):
+    """The stored board, or None if it is no longer at `revision`"""
+    project = collection.find_one(query, {'storage': 1, 'nodes': 1, 'connections': 1, 'revision': 1})
+    if project is None:
+        return {'nodes': [], 'connections': []}
+    if project.get('revision') != revision:
+        return None
+    if is_documents(project):
+        nodes, connections = load_board(project_id)
+        return {'nodes': nodes, 'connections': connections}
+    return {'nodes': project.get('nodes', []), 'connections': project.get('connections', [])}
+
+
+def save_board(collection, project_id, query, project_data):
+    """Full-board save for either layout; returns the new revision or None if `query` matched nothing.
+
+    Embedded boards that reach WHITEBOARD_DOCUMENT_LAYOUT_THRESHOLD nodes are
+    moved to the documents layout on the way.
+    """
+    revision = _save_board(collection, project_id, query, project_data)
+    if revision is not None:
+        history.defer(_record, history.record_state, project_id, revision, project_data)
+    return revision
+
+
+def _save_board(collection, project_id, query, project_data):
+    nodes, connections = project_data['nodes'], project_data['connections']
+    metadata = {key: value for key, value in project_data.items() if key not in ('nodes', 'connections')}
+    if len(nodes) < settings.WHITEBOARD_DOCUMENT_LAYOUT_THRESHOLD:
+        # The common case stays one round trip
+        result = collection.find_one_and_update(
+            {'$and': [query, NOT_DOCUMENTS]},
+            {'$set': project_data, '$inc': {'revision': 1}},
+            projection={'revision': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if result is not None:
+            return result['revision']
+    if _layout(collection, query) is None:
+        return None
+    write_documents(project_id, nodes, connections)
+    result = collection.find_one_and_update(
+        query,
+        {'$set': {**metadata, 'storage': DOCUMENTS, 'node_count': len(nodes)},
+         '$unset': {'nodes': '', 'connections': ''}, '$inc': {'revision': 1}},
+        projection={'revision': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return result['revision'] if result else None
+
+
+def patch_board(collection, project_id, query, revision, ops):
+    """Apply a patch to either layout, see board_ops.save_patch"""
+    new_revision = _patch_board(collection, project_id, query, revision, ops)
+    history.defer(_record, history.record_ops, project_id, new_revision, ops,
+                  lambda: _current_board(collection, project_id, query, new_revision))
+    return new_revision
+
+
+def _patch_board(collection, project_id, query, revision, ops):
+    layout = _layout(collection, query)
+    if layout is None:
+        raise LookupError('Project not found')
+    if layout != DOCUMENTS:
+        return save_patch(collection, {'$and': [query, NOT_DOCUMENTS]}, revision, ops)
+    validate_ops(ops)
+
+    # Claim the revision first, then edit the node and connection documents
+    claimed = collection.update_one(
+        {'$and': [query, revision_filter(revision)]},
+        {'$inc': {'revision': 1}, '$set': {'updated_at': datetime.now()}}
+    )
+    if claimed.matched_count == 0:
+        current = collection.find_one(query, {'revision': 1})
+        raise RevisionConflict(current.get('revision', 0) if current else revision)
+
+    deleted_nodes, deleted_connections, added_nodes, added_connections, node_changes, connection_changes = \
+        normalize(ops)
+    node_requests, connection_requests = [], []
+    if deleted_nodes:
+        node_requests.append(DeleteMany({'project_id': project_id, 'id': {'$in': deleted_nodes}}))
+        connection_requests.append(DeleteMany({'project_id': project_id, '$or': [
+            {'sourceNodeId': {'$in': deleted_nodes}}, {'targetNodeId': {'$in': deleted_nodes}}]}))
+    if deleted_connections:
+        connection_requests.append(DeleteMany({'project_id': project_id, 'id': {'$in': deleted_connections}}))
+    node_requests += [ReplaceOne({'project_id': project_id, 'id': node['id']}, {**node, 'project_id': project_id},
+                                 upsert=True) for node in added_nodes]
+    connection_requests += [ReplaceOne({'project_id': project_id, 'id': c['id']}, {**c, 'project_id': project_id},
+                                       upsert=True) for c in added_connections]
+    node_requests += [UpdateOne({'project_id': project_id, 'id': node_id}, {'$set': changes})
+                      for node_id, changes in node_changes.items()]
+    connection_requests += [UpdateOne({'project_id': project_id, 'id': connection_id}, {'$set': changes})
+                            for connection_id, changes in connection_changes.items()]
+    # Ordered, so deletes land before re-adds of the same id
+    if node_requests:
+        get_board_nodes_collection().bulk_write(node_requests, ordered=True)
+    if connection_requests:
+        get_board_connections_collection().bulk_write(connection_requests, ordered=True)
+    if added_nodes or deleted_nodes:
+        collection.update_one(query, {'$inc': {'node_count': len(added_nodes) - len(deleted_nodes)}})
+    return revision + 1
+
+
+def convert(collection, project_id, query, layout):
+    """Move a board between layouts, for the board_storage management command"""
+    project = collection.find_one(query)
+    if project is None:
+        raise LookupError('Project not found')
+    if layout == DOCUMENTS and not is_documents(project):
+        nodes, connections = project.get('nodes', []), project.get('connections', [])
+        write_documents(project_id, nodes, connections)
+        collection.update_one(query, {'$set': {'storage': DOCUMENTS, 'node_count': len(nodes)},
+                                      '$unset': {'nodes': '', 'connections': ''}, '$inc': {'revision': 1}})
+    elif layout != DOCUMENTS and is_documents(project):
+        nodes, connections = load_board(project_id)
+        collection.update_one(query, {'$set': {'nodes': nodes, 'connections': connections},
+                                      '$unset': {'storage': '', 'node_count': ''}, '$inc': {'revision': 1}})
+        delete_documents(project_id)
@@ -0,0 +1,342 @@
+"""Data-cleaning operators over columnar Tables.
+
+Every operator takes its table on the `data` input port (joins take `left`
+and `right`), returns it on `table`, and does its work with whole-column
+NumPy operations. Node `data` fields are the strings typed into the node,
+so column lists are comma separated.
+"""
+import numpy as np
+
+from .operators import register
+from .table import Table, to_table, is_missing, factorize, factorize_rows
+
+
+def _names(text):
+    return [name.strip() for name in (text or '').split(',') if name.strip()]
+
+
+def _columns(table, text, default=None):
+    """The columns listed in `text`, or `default` (all columns) when it is empty"""
+    names = _names(text)
+    if not names:
+        return table.names if default is None else default
+    for name in names:
+        table.column(name)
+    return names
+
+
+def _numeric(values, name):
+    if values.dtype.kind not in 'fiub':
+        raise ValueError(f"Column {name} is not numeric")
+    return values.astype(np.float64)
+
+
+def _missing_like(values, count):
+    """`count` missing values of a column's kind"""
+    if values.dtype.kind in 'iub':
+        return np.full(count, np.nan)
+    if values.dtype.kind == 'f':
+        return np.full(count, np.nan, dtype=values.dtype)
+    return np.full(count, None, dtype=object)
+
+
+def _parse_scalar(text, values):
+    # Compare numbers with numbers and text with text
+    if values.dtype.kind in 'fiub':
+        try:
+            return float(text)
+        except ValueError:
+            raise ValueError(f"Expected a number to compare with, got {text!r}")
+    return text
+
+
+COMPARISONS = {
+    '==': np.equal,
+    '!=': np.not_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+}
+
+
+@register('filterRows', fusible=True)
+def filter_rows(inputs, data):
+    table = to_table(inputs.get('data'))
+    name = (data.get('column') or '').strip()
+    values = table.column(name)
+    operator = (data.get('operator') or '==').strip()
+    missing = is_missing(values)
+    if operator == 'isnull':
+        mask = missing
+    elif operator == 'notnull':
+        mask = ~missing
+    elif operator == 'contains':
+        text = np.where(missing, '', values).astype(str)
+        mask = np.char.find(text, data.get('value') or '') >= 0
+    elif operator in COMPARISONS:
+        target = _parse_scalar(data.get('value') or '', values)
+        if values.dtype == object:
+            values = np.where(missing, '', values).astype(str)
+        mask = COMPARISONS[operator](values, target) & ~missing
+    else:
+        raise ValueError(f"Unknown filter operator: {operator}")
+    return {'table': table.take(mask)}
+
+
+def _forward_fill(values, missing):
+    # Index of the last present value at or before each row
+    last = np.where(~missing, np.arange(len(values)), 0)
+    np.maximum.accumulate(last, out=last)
+    filled = values[last]
+    # Leading gaps have nothing to copy from
+    leading = np.arange(len(values)) < (np.argmax(~missing) if (~missing).any() else len(values))
+    return np.where(leading, values, filled)
+
+
+@register('fillMissing')
+def fill_missing(inputs, data):
+    table = to_table(inputs.get('data'))
+    strategy = (data.get('strategy') or 'value').strip()
+    columns = {}
+    for name in _columns(table, data.get('columns')):
+        values = table.column(name)
+        missing = is_missing(values)
+        if not missing.any():
+            continue
+        if strategy == 'value':
+            fill = _parse_scalar(data.get('value') or '', values) if values.dtype.kind == 'f' else data.get('value')
+            columns[name] = np.where(missing, fill, values).astype(values.dtype)
+        elif strategy in ('mean', 'median'):
+            numbers = _numeric(values, name)
+            fill = (np.nanmean if strategy == 'mean' else np.nanmedian)(numbers) if (~missing).any() else np.nan
+            columns[name] = np.where(missing, fill, numbers)
+        elif strategy == 'mode':
+            present = values[~missing]
+            if not len(present):
+                continue
+            codes = factorize(present)
+            counts = np.bincount(codes)
+            columns[name] = np.where(missing, present[np.argmax(codes == np.argmax(counts))], values)
+        elif strategy == 'ffill':
+            columns[name] = _forward_fill(values, missing)
+        else:
+            raise ValueError(f"Unknown fill strategy: {strategy}")
+    return {'table': table.with_columns(**columns)}
+
+
+@register('dedupe')
+def dedupe(inputs, data):
+    """Drop rows repeating an earlier (or, with keep=last, a later) row's key columns"""
+    table = to_table(inputs.get('data'))
+    if not table.num_rows:
+        return {'table': table}
+    codes = factorize_rows([table.column(name) for name in _columns(table, data.get('columns'))])
+    keep = (data.get('keep') or 'first').strip()
+    if keep == 'first':
+        _, index = np.unique(codes, return_index=True)
+    elif keep == 'last':
+        _, index = np.unique(codes[::-1], return_index=True)
+        index = len(codes) - 1 - index
+    else:
+        raise ValueError(f"keep must be first or last, got {keep}")
+    return {'table': table.take(np.sort(index))}
+
+
+def sort_order(values, descending=False):
+    """Stable row order sorting `values`, missing values last either way"""
+    missing = is_missing(values)
+    present = np.flatnonzero(~missing)
+    codes = factorize(values[present]) if values.dtype.kind in 'Ob' else values[present]
+    ranked = present[np.argsort(-codes if descending else codes, kind='stable')]
+    return np.concatenate([ranked, np.flatnonzero(missing)])
+
+
+@register('sortRows')
+def sort_rows(inputs, data):
+    table = to_table(inputs.get('data'))
+    order = (data.get('order') or 'asc').strip()
+    if order not in ('asc', 'desc'):
+        raise ValueError(f"order must be asc or desc, got {order}")
+    return {'table': table.take(sort_order(table.column((data.get('column') or '').strip()), order == 'desc'))}
+
+
+TRUE_STRINGS = np.array(['true', '1', 'yes', 'y', 't'])
+
+
+def _cast(values, kind, name):
+    missing = is_missing(values)
+    if kind == 'float':
+        try:
+            return np.where(missing, 'nan', values).astype(np.float64) if values.dtype == object \
+                else values.astype(np.float64)
+        except ValueError as e:
+            raise ValueError(f"Column {name} cannot be cast to float: {str(e)}")
+    if kind == 'int':
+        numbers = _cast(values, 'float', name)
+        if missing.any():
+            raise ValueError(f"Column {name} has missing values and cannot be cast to int")
+        return np.trunc(numbers).astype(np.int64)
+    if kind == 'str':
+        text = values.astype(str).astype(object)
+        return np.where(missing, None, text)
+    if kind == 'bool':
+        if values.dtype.kind in 'fiub':
+            return np.where(missing, None, values.astype(bool)).astype(object)
+        lowered = np.char.lower(np.char.strip(np.where(missing, '', values).astype(str)))
+        return np.where(missing, None, np.isin(lowered, TRUE_STRINGS)).astype(object)
+    raise ValueError(f"Unknown type: {kind}")
+
+
+@register('typeCast', fusible=True)
+def type_cast(inputs, data):
+    table = to_table(inputs.get('data'))
+    kind = (data.get('type') or 'float').strip()
+    return {'table': table.with_columns(**{
+        name: _cast(table.column(name), kind, name) for name in _columns(table, data.get('columns'))
+    })}
+
+
+TEXT_TRANSFORMS = {
+    'strip': np.char.strip,
+    'lower': np.char.lower,
+    'upper': np.char.upper,
+    'title': np.char.title,
+}
+
+
+@register('textTransform', fusible=True)
+def text_transform(inputs, data):
+    """Apply the comma separated operations (strip, lower, upper, title) to text columns, in order"""
+    table = to_table(inputs.get('data'))
+    text_columns = [name for name in table.names if table.columns[name].dtype == object]
+    operations = _names(data.get('operations')) or ['strip']
+    for operation in operations:
+        if operation not in TEXT_TRANSFORMS:
+            raise ValueError(f"Unknown text operation: {operation}")
+    columns = {}
+    for name in _columns(table, data.get('columns'), text_columns):
+        values = table.column(name)
+        missing = is_missing(values)
+        text = np.where(missing, '', values).astype(str)
+        for operation in operations:
+            text = TEXT_TRANSFORMS[operation](text)
+        columns[name] = np.where(missing, None, text.astype(object))
+    return {'table': table.with_columns(**columns)}
+
+
+@register('normalize')
+def normalize(inputs, data):
+    """Scale numeric columns to [0, 1] (minmax) or to mean 0, std 1 (zscore)"""
+    table = to_table(inputs.get('data'))
+    numeric = [name for name in table.names if table.columns[name].dtype.kind in 'fiu']
+    method = (data.get('method') or 'minmax').strip()
+    columns = {}
+    for name in _columns(table, data.get('columns'), numeric):
+        values = _numeric(table.column(name), name)
+        if np.isnan(values).all():
+            continue
+        if method == 'minmax':
+            low, high = np.nanmin(values), np.nanmax(values)
+            span = high - low
+            columns[name] = (values - low) / span if span else np.where(np.isnan(values), np.nan, 0.0)
+        elif method == 'zscore':
+            std = np.nanstd(values)
+            centered = values - np.nanmean(values)
+            columns[name] = centered / std if std else np.where(np.isnan(values), np.nan, 0.0)
+        else:
+            raise ValueError(f"Unknown normalization method: {method}")
+    return {'table': table.with_columns(**columns)}
+
+
+@register('join')
+def join(inputs, data):
+    """Sort-merge join on equal key columns; how is inner or left"""
+    left, right = to_table(inputs.get('left')), to_table(inputs.get('right'))
+    keys = _names(data.get('on'))
+    if not keys:
+        raise ValueError('Join needs at least one column in on')
+    how = (data.get('how') or 'inner').strip()
+    if how not in ('inner', 'left'):
+        raise ValueError(f"how must be inner or left, got {how}")
+
+    # Codes over both sides at once, so equal keys get equal codes
+    codes = factorize_rows([np.concatenate([left.column(key), right.column(key)]) for key in keys])
+    left_codes, right_codes = codes[:left.num_rows], codes[left.num_rows:]
+    # Rows with a missing key never match
+    for key in keys:
+        left_codes = np.where(is_missing(left.column(key)), -1, left_codes)
+        right_codes = np.where(is_missing(right.column(key)), -2, right_codes)
+
+    order = np.argsort(right_codes, kind='stable')
+    sorted_codes = right_codes[order]
+    start = np.searchsorted(sorted_codes, left_codes, side='left')
+    counts = np.searchsorted(sorted_codes, left_codes, side='right') - start
+    if how == 'left':
+        # Unmatched left rows appear once, paired with nothing
+        emitted = np.maximum(counts, 1)
+    else:
+        emitted = counts
+    left_index = np.repeat(np.arange(left.num_rows), emitted)
+    offsets = np.arange(len(left_index)) - np.repeat(np.cumsum(emitted) - emitted, emitted)
+    matched = np.repeat(counts, emitted) > 0
+    right_index = order[np.where(matched, np.repeat(start, emitted) + offsets, 0)] if len(order) else \
+        np.zeros(len(left_index), dtype=np.int64)
+
+    columns = {name: values[left_index] for name, values in left.columns.items()}
+    for name, values in right.columns.items():
+        if name in keys:
+            continue
+        taken = values[right_index] if len(values) else _missing_like(values, len(right_index))
+        if not matched.all():
+            taken = np.where(matched, taken, _missing_like(values, len(taken)))
+        columns[f"{name}_right" if name in columns else name] = taken
+    return {'table': Table(columns)}
+
+
+AGGREGATIONS = ('count', 'sum', 'mean', 'min', 'max')
+
+
+@register('groupAggregate')
+def group_aggregate(inputs, data):
+    """Group by key columns and aggregate, e.g. aggregations = "price:mean, price:max, *:count" """
+    table = to_table(inputs.get('data'))
+    keys = _names(data.get('by'))
+    for key in keys:
+        table.column(key)
+    specs = [spec.split(':') for spec in _names(data.get('aggregations')) or ['*:count']]
+
+    if keys and table.num_rows:
+        codes = factorize_rows([table.column(key) for key in keys])
+        _, first, groups = np.unique(codes, return_index=True, return_inverse=True)
+    else:
+        first, groups = np.zeros(min(table.num_rows, 1), dtype=np.int64), np.zeros(table.num_rows, dtype=np.int64)
+    num_groups = len(first)
+    order = np.argsort(groups, kind='stable')
+    starts = np.searchsorted(groups[order], np.arange(num_groups))
+
+    columns = {key: table.column(key)[first] for key in keys}
+    for spec in specs:
+        if len(spec) != 2 or spec[1].strip() not in AGGREGATIONS:
+            raise ValueError(f"Aggregation must look like column:{'|'.join(AGGREGATIONS)}, got {':'.join(spec)}")
+        name, function = spec[0].strip(), spec[1].strip()
+        if name == '*':
+            columns['count'] = np.bincount(groups, minlength=num_groups)
+            continue
+        values = table.column(name)
+        present = ~is_missing(values)
+        count = np.bincount(groups, weights=present, minlength=num_groups)
+        if function == 'count':
+            result = count.astype(np.int64)
+        else:
+            numbers = _numeric(values, name)
+            if function in ('sum', 'mean'):
+                total = np.bincount(groups, weights=np.where(present, numbers, 0.0), minlength=num_groups)
+                result = total if function == 'sum' else np.divide(total, count, out=np.full(num_groups, np.nan),
+                                                                   where=count > 0)
+            else:
+                # fmin/fmax skip NaN unless a whole group is missing
+                reducer = np.fmin if function == 'min' else np.fmax
+                result = reducer.reduceat(numbers[order], starts) if num_groups else np.array([])
+        columns[f"{name}_{function}"] = result
+    return {'table': Table(columns)}
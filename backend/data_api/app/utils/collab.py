@@ -0,0 +1,333 @@
+"""Real-time collaborative editing over WebSockets.
+
+Collaborators connect to ws/whiteboard/<project_id>/?user_id=... and send
+    {'type': 'ops', 'ops': [...]}
+with the same operations PatchWhiteBoardView accepts. Each project is a room
+on the event loop. Ops arriving within a tick (COLLAB_TICK_SECONDS) are
+compacted, so a drag sends one move per node per tick, and broadcast as one
+    {'type': 'ops', 'seq': n, 'ops': [...]}
+message to everyone in the room, the sender included. The board is written
+to MongoDB as one patch every COLLAB_SNAPSHOT_SECONDS (or every
+COLLAB_SNAPSHOT_MAX_OPS ops), and when the last collaborator leaves.
+
+A joining client gets {'type': 'welcome', 'revision': r, ...} after any
+unsaved ops have been written, then opens the board at revision r and
+applies the broadcasts that follow. {'type': 'resync'} means the stored
+board was changed outside the room. When the room's ops could still be
+written on top, the message carries the board as it now is, with `nodes`,
+`connections`, `revision` and the `seq` it includes, and the client
+replaces its board with it; without them the client should reopen it.
+
+Rooms live in one process. Groups go through ChannelLayer, an in-process
+stand-in with the group_add/group_send shape of a channels layer, so a
+shared layer could replace it if collaborators are ever spread over
+several worker processes.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from itertools import count
+from urllib.parse import parse_qs
+
+from bson.objectid import ObjectId
+from django.conf import settings
+
+from .autosave import autosave_buffer
+from .board_cache import board_cache
+from .board_ops import apply_ops, compact, validate_ops, PatchError, RevisionConflict
+from .board_storage import is_documents, load_board, patch_board
+from .mongo import get_projects_collection
+from .permissions import write_access_filter
+
+logger = logging.getLogger(__name__)
+
+# Sent down a connection's queue when it fell too far behind
+OVERFLOW = object()
+
+
+class ChannelLayer:
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._queues = {}
+        self._groups = defaultdict(set)
+        self._names = count(1)
+
+    def new_channel(self):
+        name = f"channel-{next(self._names)}"
+        self._queues[name] = asyncio.Queue(maxsize=self.queue_size)
+        return name
+
+    def group_add(self, group, channel):
+        self._groups[group].add(channel)
+
+    def group_discard(self, group, channel):
+        members = self._groups.get(group)
+        if members is not None:
+            members.discard(channel)
+            if not members:
+                del self._groups[group]
+
+    def discard_channel(self, channel):
+        self._queues.pop(channel, None)
+
+    def send(self, channel, message):
+        queue = self._queues.get(channel)
+        if queue is None:
+            return
+        if queue.full():
+            # A stalled client is disconnected rather than buffered without
+            # bound; it reopens the board when it reconnects
+            while not queue.empty():
+                queue.get_nowait()
+            message = OVERFLOW
+        queue.put_nowait(message)
+
+    def group_send(self, group, message):
+        for channel in list(self._groups.get(group, ())):
+            self.send(channel, message)
+
+    async def receive(self, channel):
+        return await self._queues[channel].get()
+
+
+class Room:
+    def __init__(self, project_id):
+        self.project_id = project_id
+        self.group = f"board-{project_id}"
+        # channel -> user id
+        self.members = {}
+        self.revision = None
+        self.seq = 0
+        # Received but not yet broadcast, and broadcast but not yet saved
+        self.pending = []
+        self.unsaved = []
+        self.tick_handle = None
+        self.snapshot_handle = None
+        self.save_lock = asyncio.Lock()
+
+
+class CollabHub:
+    def __init__(self, layer, tick_seconds, snapshot_seconds, snapshot_max_ops):
+        self.layer = layer
+        self.tick_seconds = tick_seconds
+        self.snapshot_seconds = snapshot_seconds
+        self.snapshot_max_ops = snapshot_max_ops
+        self.rooms = {}
+        self.counters = {'ops_received': 0, 'ops_broadcast': 0, 'batches': 0, 'snapshots': 0,
+                         'snapshot_failures': 0, 'resyncs': 0}
+
+    async def join(self, project_id, channel, user_id):
+        room = self.rooms.get(project_id)
+        if room is None:
+            room = self.rooms[project_id] = Room(project_id)
+        room.members[channel] = user_id
+        async with room.save_lock:
+            if room.revision is None:
+                await asyncio.to_thread(autosave_buffer.flush, project_id)
+                project = await asyncio.to_thread(
+                    get_projects_collection().find_one, {'_id': ObjectId(project_id)}, {'revision': 1}
+                )
+                room.revision = project.get('revision', 0) if project else 0
+        # Make the stored board current so the newcomer can load it. Ops
+        # broadcast while it is written go round again, so the revision sent
+        # covers every broadcast up to the seq sent with it
+        while True:
+            self._tick(room)
+            failures = self.counters['snapshot_failures']
+            await self.snapshot(room)
+            if self.counters['snapshot_failures'] > failures:
+                room.members.pop(channel, None)
+                if not room.members:
+                    await self.leave(room, channel)
+                raise RuntimeError(f"Could not save project {project_id} for a joining collaborator")
+            if not room.unsaved and not room.save_lock.locked():
+                break
+        # No await from here on: the newcomer gets exactly the broadcasts after seq
+        self.layer.send(channel, {'type': 'welcome', 'revision': room.revision, 'seq': room.seq,
+                                  'members': sorted(set(room.members.values()))})
+        self.layer.group_add(room.group, channel)
+        self.layer.group_send(room.group, {'type': 'joined', 'user_id': user_id})
+        return room
+
+    async def leave(self, room, channel):
+        user_id = room.members.pop(channel, None)
+        self.layer.group_discard(room.group, channel)
+        self.layer.group_send(room.group, {'type': 'left', 'user_id': user_id})
+        if room.members:
+            return
+        self._tick(room)
+        await self.snapshot(room)
+        if not room.members and self.rooms.get(room.project_id) is room:
+            if room.snapshot_handle is not None:
+                room.snapshot_handle.cancel()
+            del self.rooms[room.project_id]
+
+    def submit(self, room, ops):
+        """Queue a client's ops for the next tick; raises PatchError if they are malformed"""
+        validate_ops(ops)
+        if len(ops) > settings.COLLAB_MAX_OPS_PER_MESSAGE:
+            raise PatchError(f"At most {settings.COLLAB_MAX_OPS_PER_MESSAGE} ops per message")
+        room.pending.extend(ops)
+        self.counters['ops_received'] += len(ops)
+        if room.tick_handle is None:
+            room.tick_handle = asyncio.get_running_loop().call_later(self.tick_seconds, self._tick, room)
+
+    def _tick(self, room):
+        if room.tick_handle is not None:
+            room.tick_handle.cancel()
+            room.tick_handle = None
+        if not room.pending:
+            return
+        ops, room.pending = compact(room.pending), []
+        room.seq += 1
+        self.layer.group_send(room.group, {'type': 'ops', 'seq': room.seq, 'ops': ops})
+        self.counters['batches'] += 1
+        self.counters['ops_broadcast'] += len(ops)
+        room.unsaved.extend(ops)
+        if len(room.unsaved) >= self.snapshot_max_ops:
+            asyncio.ensure_future(self.snapshot(room))
+        elif room.snapshot_handle is None:
+            room.snapshot_handle = asyncio.get_running_loop().call_later(
+                self.snapshot_seconds, lambda: asyncio.ensure_future(self.snapshot(room))
+            )
+
+    async def snapshot(self, room):
+        """Write the room's unsaved ops to MongoDB as one patch"""
+        async with room.save_lock:
+            if room.snapshot_handle is not None:
+                room.snapshot_handle.cancel()
+                room.snapshot_handle = None
+            if not room.unsaved:
+                return
+            ops, room.unsaved = compact(room.unsaved), []
+            try:
+                room.revision = await self._save(room, ops)
+                self.counters['snapshots'] += 1
+            except (RevisionConflict, PatchError, LookupError) as e:
+                # The stored board moved on without us; the clients must reload it
+                logger.warning(f"Collaboration snapshot for project {room.project_id} discarded: {str(e)}")
+                self.counters['resyncs'] += 1
+                board_cache.invalidate(room.project_id)
+                project = await asyncio.to_thread(
+                    get_projects_collection().find_one, {'_id': ObjectId(room.project_id)}, {'revision': 1}
+                )
+                room.revision = project.get('revision', 0) if project else 0
+                self.layer.group_send(room.group, {'type': 'resync', 'revision': room.revision})
+            except Exception as e:
+                self.counters['snapshot_failures'] += 1
+                logger.exception(f"Collaboration snapshot for project {room.project_id} failed: {str(e)}")
+                room.unsaved[:0] = ops
+                if room.snapshot_handle is None:
+                    room.snapshot_handle = asyncio.get_running_loop().call_later(
+                        self.snapshot_seconds, lambda: asyncio.ensure_future(self.snapshot(room))
+                    )
+
+    async def _save(self, room, ops):
+        query = {'_id': ObjectId(room.project_id)}
+        try:
+            revision = await asyncio.to_thread(
+                patch_board, get_projects_collection(), room.project_id, query, room.revision, ops
+            )
+        except RevisionConflict as e:
+            # A plain save landed in between: the ops still apply on top of it, but the
+            # members' boards lack that save, so they get the stored board in its place
+            revision = await asyncio.to_thread(
+                patch_board, get_projects_collection(), room.project_id, query, e.revision, ops
+            )
+            stored_revision, board = await asyncio.to_thread(_stored_board, room.project_id)
+            if stored_revision is not None:
+                revision = stored_revision
+            self.counters['resyncs'] += 1
+            # Ops broadcast since this snapshot began are not in the stored board yet
+            board = apply_ops(board, room.unsaved)
+            self.layer.group_send(room.group, {'type': 'resync', 'revision': revision, 'seq': room.seq, **board})
+        board_cache.bump(room.project_id, revision)
+        return revision
+
+    def stats(self):
+        return {**self.counters, 'rooms': len(self.rooms),
+                'members': sum(len(room.members) for room in self.rooms.values())}
+
+
+hub = CollabHub(
+    ChannelLayer(settings.COLLAB_QUEUE_SIZE),
+    tick_seconds=settings.COLLAB_TICK_SECONDS,
+    snapshot_seconds=settings.COLLAB_SNAPSHOT_SECONDS,
+    snapshot_max_ops=settings.COLLAB_SNAPSHOT_MAX_OPS,
+)
+
+
+def _stored_board(project_id):
+    """(revision, {'nodes': ..., 'connections': ...}) as stored, revision None if the project is gone"""
+    project = get_projects_collection().find_one(
+        {'_id': ObjectId(project_id)}, {'revision': 1, 'storage': 1, 'nodes': 1, 'connections': 1}
+    )
+    if project is None:
+        return None, {'nodes': [], 'connections': []}
+    if is_documents(project):
+        nodes, connections = load_board(project_id)
+    else:
+        nodes, connections = project.get('nodes', []), project.get('connections', [])
+    return project.get('revision', 0), {'nodes': nodes, 'connections': connections}
+
+
+def _can_edit(project_id, user_id):
+    return get_projects_collection().count_documents(
+        {'_id': ObjectId(project_id), **write_access_filter(user_id)}, limit=1
+    ) == 1
+
+
+async def websocket_application(scope, receive, send):
+    """Raw ASGI app for ws/whiteboard/<project_id>/, mounted in data_api/asgi.py"""
+    parts = scope['path'].strip('/').split('/')
+    if len(parts) != 3 or parts[:2] != ['ws', 'whiteboard'] or not ObjectId.is_valid(parts[2]):
+        await receive()
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    project_id = parts[2]
+    user_id = parse_qs(scope.get('query_string', b'').decode()).get('user_id', [None])[0]
+
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if not user_id or not await asyncio.to_thread(_can_edit, project_id, user_id):
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    await send({'type': 'websocket.accept'})
+
+    layer = hub.layer
+    channel = layer.new_channel()
+    try:
+        room = await hub.join(project_id, channel, user_id)
+    except Exception as e:
+        logger.exception(f"Collaborator {user_id} could not join project {project_id}: {str(e)}")
+        layer.discard_channel(channel)
+        await send({'type': 'websocket.close', 'code': 1011})
+        return
+
+    async def forward():
+        while True:
+            outgoing = await layer.receive(channel)
+            if outgoing is OVERFLOW:
+                await send({'type': 'websocket.close', 'code': 1013})
+                return
+            await send({'type': 'websocket.send', 'text': json.dumps(outgoing, default=str)})
+
+    writer = asyncio.ensure_future(forward())
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            try:
+                data = json.loads(message.get('text') or message.get('bytes') or '')
+                if not isinstance(data, dict) or data.get('type') != 'ops':
+                    raise PatchError("Expected {'type': 'ops', 'ops': [...]}")
+                hub.submit(room, data.get('ops'))
+            except (ValueError, PatchError) as e:
+                layer.send(channel, {'type': 'error', 'error': str(e)})
+    finally:
+        writer.cancel()
+        layer.discard_channel(channel)
+        await hub.leave(room, channel)
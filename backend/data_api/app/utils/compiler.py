@@ -0,0 +1,267 @@
+"""Compile a whiteboard pipeline into an immutable execution plan.
+
+Compilation resolves every connection to concrete ports, rejects malformed
+nodes and ports, dangling references, cycles and incompatible port data
+types, and computes the execution levels and the chains of nodes to run
+fused. It only looks at the shape of the graph (node ids, types, ports and
+connections, not node `data`), so plans are cached by a hash of that
+topology and re-running the same shape skips validation entirely.
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from django.conf import settings
+
+from .cache import LRUCache
+from .operators import OPERATORS, FUSIBLE
+
+# Input port types that accept a value of any type
+GENERIC_DATA_TYPES = {'data', 'any'}
+
+
+class PipelineValidationError(ValueError):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(error['message'] for error in errors))
+
+
+@dataclass(frozen=True)
+class Wire:
+    target_port: str
+    source_node: str
+    source_port: str
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    topology_hash: str
+    order: tuple
+    levels: tuple
+    # node id -> frozenset of node ids
+    upstream: MappingProxyType
+    downstream: MappingProxyType
+    # node id -> tuple of Wire, ports by name
+    wiring: MappingProxyType
+    # node id -> {output port name: port id}
+    output_ports: MappingProxyType
+    # Chains of fusible nodes in execution order, each run as one pass
+    fused: tuple = ()
+
+    def describe(self):
+        return {
+            'topology_hash': self.topology_hash,
+            'order': list(self.order),
+            'levels': [list(level) for level in self.levels],
+            'fused': [list(group) for group in self.fused],
+        }
+
+
+_plan_cache = LRUCache(settings.PIPELINE_PLAN_CACHE_SIZE)
+
+
+def _sorted(items):
+    # Sort by the JSON form, so missing (None) ids sort next to strings instead of raising
+    return sorted(items, key=lambda item: json.dumps(item, default=str))
+
+
+def topology_hash(nodes, connections):
+    def ports(items):
+        return _sorted([port.get('id'), port.get('name'), port.get('dataType')] for port in items or [])
+
+    shape = {
+        'nodes': _sorted(
+            [node.get('id'), node.get('type'), ports(node.get('inputs')), ports(node.get('outputs'))]
+            for node in nodes
+        ),
+        'connections': _sorted(
+            [c.get('sourceNodeId'), c.get('sourcePortId'), c.get('targetNodeId'), c.get('targetPortId')]
+            for c in connections
+        ),
+    }
+    return hashlib.sha256(json.dumps(shape, default=str).encode('utf-8')).hexdigest()
+
+
+def _error(code, message, **where):
+    return {'code': code, 'message': message, **where}
+
+
+def _not_strings(item, fields):
+    """The fields of `item` that are set to something other than a string"""
+    return [field for field in fields if item.get(field) is not None and not isinstance(item[field], str)]
+
+
+def check_shape(nodes, connections):
+    """Reject payloads whose nodes, ports or connections are not objects, or whose ids
+    and references are not strings, before anything indexes or hashes them"""
+    if not isinstance(nodes, list) or not isinstance(connections, list):
+        raise PipelineValidationError([_error('invalid_pipeline', 'nodes and connections must be lists')])
+    errors = []
+    for index, node in enumerate(nodes):
+        if not isinstance(node, dict):
+            errors.append(_error('invalid_node', f"Node at index {index} is not an object"))
+            continue
+        bad = _not_strings(node, ('id', 'type'))
+        if bad:
+            errors.append(_error('invalid_node', f"Node at index {index} needs a string {' and '.join(bad)}"))
+            continue
+        name = f"node {node['id']}" if node.get('id') else f"node at index {index}"
+        for kind in ('inputs', 'outputs'):
+            ports = node.get(kind) or []
+            if not isinstance(ports, list):
+                errors.append(_error('invalid_port', f"The {kind} of {name} is not a list", node_id=node.get('id')))
+                continue
+            for position, port in enumerate(ports):
+                if not isinstance(port, dict) or not port.get('id') or not port.get('name') \
+                        or _not_strings(port, ('id', 'name', 'dataType')):
+                    errors.append(_error('invalid_port', f"Port {position} of the {kind} of {name} needs a string "
+                                         f"id and name", node_id=node.get('id')))
+    for index, connection in enumerate(connections):
+        if not isinstance(connection, dict):
+            errors.append(_error('invalid_connection', f"Connection at index {index} is not an object"))
+            continue
+        bad = _not_strings(connection, ('id', 'sourceNodeId', 'sourcePortId', 'targetNodeId', 'targetPortId'))
+        if bad:
+            errors.append(_error('invalid_connection', f"Connection at index {index} needs a string "
+                                 f"{' and '.join(bad)}"))
+    if errors:
+        raise PipelineValidationError(errors)
+
+
+def _find_cycle(upstream, remaining):
+    """Walk upstream edges among the unsorted nodes until a node repeats"""
+    node_id = min(remaining)
+    path = []
+    while node_id not in path:
+        path.append(node_id)
+        node_id = min(source for source in upstream[node_id] if source in remaining)
+    return path[path.index(node_id):][::-1]
+
+
+def fuse_chains(node_map, downstream, wiring, order):
+    """Maximal chains of two or more fusible nodes, in execution order.
+
+    A node joins the chain of the node feeding it when that is its only
+    input and the node feeds nothing else, so nothing outside the chain ever
+    reads the tables in between.
+    """
+    def fusible(node_id):
+        return node_map[node_id].get('type') in FUSIBLE
+
+    chains = {}
+    for node_id in order:
+        if not fusible(node_id):
+            continue
+        wires = wiring[node_id]
+        parent = wires[0].source_node if len(wires) == 1 else None
+        if parent is not None and fusible(parent) and downstream[parent] == {node_id} \
+                and wires[0].source_port == 'table' and wires[0].target_port == 'data':
+            chains[node_id] = chains.pop(parent) + [node_id]
+        else:
+            chains[node_id] = [node_id]
+    return tuple(tuple(chain) for chain in sorted(chains.values(), key=lambda chain: order.index(chain[0]))
+                 if len(chain) > 1)
+
+
+def _plan(nodes, connections, digest):
+    errors = []
+    node_map = {}
+    for index, node in enumerate(nodes):
+        node_id = node.get('id')
+        if not node_id:
+            errors.append(_error('missing_id', f"Node at index {index} has no id"))
+            continue
+        if node_id in node_map:
+            errors.append(_error('duplicate_node', f"Duplicate node id {node_id}", node_id=node_id))
+            continue
+        if node.get('type') not in OPERATORS:
+            errors.append(_error('unknown_type', f"Node {node_id} has unknown type {node.get('type')!r}",
+                                 node_id=node_id))
+        node_map[node_id] = node
+
+    inputs = {node_id: {p['id']: p for p in node.get('inputs') or []} for node_id, node in node_map.items()}
+    outputs = {node_id: {p['id']: p for p in node.get('outputs') or []} for node_id, node in node_map.items()}
+    upstream = {node_id: set() for node_id in node_map}
+    downstream = {node_id: set() for node_id in node_map}
+    wiring = {node_id: [] for node_id in node_map}
+
+    for connection in connections:
+        connection_id = connection.get('id')
+        source, target = connection.get('sourceNodeId'), connection.get('targetNodeId')
+        source_port = outputs.get(source, {}).get(connection.get('sourcePortId'))
+        target_port = inputs.get(target, {}).get(connection.get('targetPortId'))
+        if source not in node_map or target not in node_map:
+            missing = source if source not in node_map else target
+            errors.append(_error('dangling_connection', f"Connection {connection_id} references unknown node {missing}",
+                                 connection_id=connection_id))
+            continue
+        if source_port is None:
+            errors.append(_error('unknown_port', f"Connection {connection_id} references unknown output port "
+                                 f"{connection.get('sourcePortId')} on node {source}", connection_id=connection_id))
+            continue
+        if target_port is None:
+            errors.append(_error('unknown_port', f"Connection {connection_id} references unknown input port "
+                                 f"{connection.get('targetPortId')} on node {target}", connection_id=connection_id))
+            continue
+        source_type, target_type = source_port.get('dataType'), target_port.get('dataType')
+        if source_type != target_type and target_type not in GENERIC_DATA_TYPES and source_type != 'any':
+            errors.append(_error('type_mismatch', f"Connection {connection_id} sends {source_type} from "
+                                 f"{source}.{source_port['name']} into {target_type} port "
+                                 f"{target}.{target_port['name']}", connection_id=connection_id))
+            continue
+        upstream[target].add(source)
+        downstream[source].add(target)
+        wiring[target].append(Wire(target_port['name'], source, source_port['name']))
+
+    # Kahn's algorithm, one level at a time
+    remaining = {node_id: len(sources) for node_id, sources in upstream.items()}
+    level = sorted(node_id for node_id, count in remaining.items() if count == 0)
+    levels = []
+    while level:
+        levels.append(tuple(level))
+        next_level = []
+        for node_id in level:
+            del remaining[node_id]
+            for child in downstream[node_id]:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    next_level.append(child)
+        level = sorted(next_level)
+    if remaining:
+        cycle = _find_cycle(upstream, remaining)
+        errors.append(_error('cycle', f"Pipeline contains a cycle: {' -> '.join(cycle + cycle[:1])}",
+                             node_ids=cycle))
+
+    if errors:
+        raise PipelineValidationError(errors)
+
+    order = tuple(node_id for level in levels for node_id in level)
+    return ExecutionPlan(
+        topology_hash=digest,
+        order=order,
+        levels=tuple(levels),
+        upstream=MappingProxyType({k: frozenset(v) for k, v in upstream.items()}),
+        downstream=MappingProxyType({k: frozenset(v) for k, v in downstream.items()}),
+        wiring=MappingProxyType({k: tuple(v) for k, v in wiring.items()}),
+        output_ports=MappingProxyType({
+            node_id: MappingProxyType({port['name']: port_id for port_id, port in ports.items()})
+            for node_id, ports in outputs.items()
+        }),
+        fused=fuse_chains(node_map, downstream, wiring, order),
+    )
+
+
+def compile_pipeline(nodes, connections):
+    """Return the execution plan for this graph shape, validating it on first sight"""
+    check_shape(nodes, connections)
+    digest = topology_hash(nodes, connections)
+    plan = _plan_cache.get(digest)
+    if plan is None:
+        plan = _plan(nodes, connections, digest)
+        _plan_cache.set(digest, plan)
+    return plan
+
+
+def plan_cache_stats():
+    return _plan_cache.stats()
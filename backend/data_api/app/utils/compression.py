@@ -0,0 +1,113 @@
+"""Negotiated compression of large responses.
+
+Board JSON is repetitive, so it compresses to a tenth of its size or less.
+Responses of at least RESPONSE_COMPRESSION_MIN_BYTES with a JSON or text
+content type are compressed with brotli when it is installed and the
+client accepts it, otherwise with gzip. Smaller responses are not worth the
+CPU, and streamed ones (server-sent events) must not be buffered.
+
+As with Django's GZipMiddleware, a strong ETag becomes a weak one, because
+the compressed bytes differ from the uncompressed ones. If-None-Match uses
+weak comparison, so conditional requests still get their 304.
+"""
+import asyncio
+import gzip
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+# Under ASGI, compressing a payload this large would stall the event loop
+# for milliseconds, so it goes to a thread
+OFFLOAD_BYTES = 256 * 1024
+
+
+def accepted_encoding(accept_encoding):
+    """'br', 'gzip' or None, from an Accept-Encoding header"""
+    qualities = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    wildcard = qualities.get('*', 0.0)
+    if brotli is not None and qualities.get('br', wildcard) > 0:
+        return 'br'
+    if qualities.get('gzip', wildcard) > 0:
+        return 'gzip'
+    return None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Sync and async capable, so async views are not pushed onto a thread for it"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        response = self.get_response(request)
+        encoding = self._encoding(request, response)
+        if encoding is not None:
+            self._apply(response, encoding, compress(response.content, encoding))
+        return response
+
+    async def _acall(self, request):
+        response = await self.get_response(request)
+        encoding = self._encoding(request, response)
+        if encoding is not None:
+            if len(response.content) >= OFFLOAD_BYTES:
+                compressed = await asyncio.to_thread(compress, response.content, encoding)
+            else:
+                compressed = compress(response.content, encoding)
+            self._apply(response, encoding, compressed)
+        return response
+
+    def _encoding(self, request, response):
+        """The encoding to compress the response with, or None to leave it be"""
+        if response.streaming or response.status_code != 200 or response.has_header('Content-Encoding'):
+            return None
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return None
+        content_type = response.get('Content-Type', '').lower()
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return None
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return accepted_encoding(request.headers.get('Accept-Encoding'))
+
+    def _apply(self, response, encoding, compressed):
+        if len(compressed) >= len(response.content):
+            return
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        tag = response.headers.get('ETag')
+        if tag and tag.startswith('"'):
+            response.headers['ETag'] = f"W/{tag}"
@@ -0,0 +1,133 @@
+"""Uploaded datasets, stored once on disk and memory-mapped by every worker.
+
+An uploaded CSV is parsed once, exactly as inline node text would be, and
+written to DATASET_DIR/<sha256 of the file>/ as one .npy file per column
+plus meta.json. Numeric columns are opened with mmap_mode='r', so all the
+worker processes reading a dataset share the same page cache pages instead
+of each parsing and holding their own copy. Text columns are dictionary
+encoded: their codes are memory-mapped and only the distinct values are
+decoded into the object arrays Tables use.
+
+That decoding is the limit of the sharing. Tables hold text as object
+arrays, so loading a dataset builds one private array per text column in
+every worker: 8 bytes per row per text column, pointing at that worker's
+single copy of each distinct value. The strings are not repeated per row,
+but a wide text-heavy dataset still costs each worker rows x text columns
+x 8 bytes, and is only freed when it leaves the DATASET_CACHE_ENTRIES
+cache.
+
+The id is the content hash, so uploading a file twice stores it once and a
+dataset id always names the same data, which keeps node result caching
+exact. An inputManager node references one through its `csv file` field.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+
+from .cache import LRUCache
+from .table import Table, from_csv, is_missing
+
+DATASET_ID = re.compile(r'^[0-9a-f]{64}$')
+
+# dataset id -> Table over the memory-mapped columns, per process
+_tables = LRUCache(settings.DATASET_CACHE_ENTRIES)
+
+
+def is_dataset_id(value):
+    return isinstance(value, str) and DATASET_ID.match(value) is not None
+
+
+def _directory(dataset_id):
+    if not is_dataset_id(dataset_id):
+        raise LookupError(f"Invalid dataset id: {dataset_id}")
+    return os.path.join(settings.DATASET_DIR, dataset_id)
+
+
+def _write_column(directory, index, values):
+    """Numbers are saved as they are, anything else as int32 codes into a list of distinct values"""
+    if values.dtype.kind in 'fiub':
+        np.save(os.path.join(directory, f"{index}.npy"), values)
+        return {'encoding': 'plain', 'dtype': str(values.dtype)}
+    missing = is_missing(values)
+    distinct, codes = np.unique(np.where(missing, '', values).astype(str), return_inverse=True)
+    np.save(os.path.join(directory, f"{index}.npy"), np.where(missing, -1, codes).astype(np.int32))
+    with open(os.path.join(directory, f"{index}.json"), 'w') as file:
+        json.dump(distinct.tolist(), file)
+    return {'encoding': 'dictionary', 'dtype': 'object'}
+
+
+def ingest(content, name=None):
+    """Store CSV bytes as a dataset unless the same bytes already are one; returns its metadata"""
+    dataset_id = hashlib.sha256(content).hexdigest()
+    final = _directory(dataset_id)
+    if os.path.exists(os.path.join(final, 'meta.json')):
+        return describe(dataset_id)
+
+    table = from_csv(content.decode('utf-8-sig'))
+    os.makedirs(settings.DATASET_DIR, exist_ok=True)
+    # Built next to its final place and renamed in, so readers never see half a dataset
+    staging = tempfile.mkdtemp(prefix='.ingest-', dir=settings.DATASET_DIR)
+    try:
+        columns = [{'name': column, **_write_column(staging, index, table.columns[column])}
+                   for index, column in enumerate(table.names)]
+        meta = {
+            'id': dataset_id,
+            'name': name,
+            'num_rows': table.num_rows,
+            'columns': columns,
+            'source_bytes': len(content),
+            'created_at': datetime.now().isoformat(),
+        }
+        with open(os.path.join(staging, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+        try:
+            os.rename(staging, final)
+        except OSError:
+            # A concurrent upload of the same file got there first
+            if not os.path.exists(os.path.join(final, 'meta.json')):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return describe(dataset_id)
+
+
+def describe(dataset_id):
+    """The dataset's metadata; raises LookupError if there is no such dataset"""
+    try:
+        with open(os.path.join(_directory(dataset_id), 'meta.json')) as file:
+            meta = json.load(file)
+    except FileNotFoundError:
+        raise LookupError(f"Dataset not found: {dataset_id}")
+    meta['stored_bytes'] = sum(entry.stat().st_size for entry in os.scandir(_directory(dataset_id)))
+    return meta
+
+
+def load(dataset_id):
+    """The dataset as a Table whose numeric columns are read-only memory maps"""
+    table = _tables.get(dataset_id)
+    if table is not None:
+        return table
+    directory = _directory(dataset_id)
+    meta = describe(dataset_id)
+    columns = {}
+    for index, column in enumerate(meta['columns']):
+        values = np.load(os.path.join(directory, f"{index}.npy"), mmap_mode='r')
+        if column['encoding'] == 'dictionary':
+            with open(os.path.join(directory, f"{index}.json")) as file:
+                distinct = json.load(file)
+            # Code -1, missing, picks the None on the end. The result is a
+            # private array of pointers into `lookup`, see the module docstring
+            lookup = np.empty(len(distinct) + 1, dtype=object)
+            lookup[:-1] = distinct
+            values = lookup[values]
+        columns[column['name']] = values
+    table = Table(columns)
+    _tables.set(dataset_id, table)
+    return table
@@ -0,0 +1,135 @@
+"""In-process pub/sub for pipeline progress events.
+
+Pipelines run on worker threads while subscribers are coroutines on the
+ASGI event loop, so each subscriber is just an asyncio.Queue fed through
+loop.call_soon_threadsafe. Hundreds of subscribers cost a queue each, not a
+thread each. Every channel keeps a bounded history so a subscriber that
+connects mid-run first replays what it missed.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+
+from django.conf import settings
+
+from .cache import LRUCache
+
+CLOSED = {'event': 'closed'}
+
+
+class Channel:
+    def __init__(self, history_size):
+        self.history = deque(maxlen=history_size)
+        self.subscribers = set()
+        self.closed = False
+
+
+class EventBroker:
+    def __init__(self, history_size, max_channels, subscriber_queue_size):
+        self.history_size = history_size
+        self.subscriber_queue_size = subscriber_queue_size
+        self._lock = threading.Lock()
+        self._channels = {}
+        # Closed channels stay replayable for late subscribers until evicted
+        self._closed = LRUCache(max_channels)
+
+    def open(self, name):
+        with self._lock:
+            self._channels.setdefault(name, Channel(self.history_size))
+
+    def is_local(self, name):
+        with self._lock:
+            return name in self._channels or name in self._closed
+
+    def publish(self, name, event):
+        """Thread-safe: record the event and hand it to every subscriber's loop"""
+        with self._lock:
+            channel = self._channels.get(name)
+            if channel is None:
+                return
+            channel.history.append(event)
+            subscribers = list(channel.subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, event)
+
+    def close(self, name):
+        with self._lock:
+            channel = self._channels.pop(name, None)
+            if channel is None:
+                return
+            channel.closed = True
+            subscribers = list(channel.subscribers)
+            channel.subscribers.clear()
+            self._closed.set(name, channel)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._deliver, queue, CLOSED)
+
+    @staticmethod
+    def _deliver(queue, event):
+        if queue.full():
+            # A stalled client must not grow memory without bound: drop its
+            # oldest pending event, it can always re-read the job status
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    async def subscribe(self, name):
+        """Async iterator over a channel's history then its live events"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.subscriber_queue_size)
+        with self._lock:
+            channel = self._channels.get(name)
+            if channel is None:
+                channel = self._closed.get(name)
+            if channel is None:
+                return
+            backlog = list(channel.history)
+            live = not channel.closed
+            if live:
+                channel.subscribers.add((loop, queue))
+        try:
+            for event in backlog:
+                yield event
+            while live:
+                event = await queue.get()
+                if event is CLOSED:
+                    break
+                yield event
+        finally:
+            with self._lock:
+                channel.subscribers.discard((loop, queue))
+
+
+broker = EventBroker(
+    history_size=settings.PIPELINE_EVENT_HISTORY,
+    max_channels=settings.PIPELINE_EVENT_CHANNELS,
+    subscriber_queue_size=settings.PIPELINE_EVENT_QUEUE_SIZE,
+)
+
+
+def format_sse(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+async def with_keepalive(events, interval):
+    """Yield SSE frames, sending a comment line whenever the stream is idle"""
+    iterator = events.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            # asyncio.wait, unlike wait_for, leaves the pending read alive on timeout
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield ': keepalive\n\n'
+                continue
+            try:
+                event = pending.result()
+            except StopAsyncIteration:
+                break
+            pending = None
+            yield format_sse(event)
+    finally:
+        if pending is not None:
+            pending.cancel()
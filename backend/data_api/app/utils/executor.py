@@ -0,0 +1,377 @@
+"""DAG execution engine for whiteboard pipelines.
+
+Nodes are wired port to port by connections
+(sourceNodeId/sourcePortId -> targetNodeId/targetPortId). A node is
+submitted to the worker pool as soon as every node feeding it has finished,
+so independent branches run side by side and a wide pipeline takes about
+as long as its critical path.
+
+Every node result is memoized under a content hash of its type, its `data`
+values and the hashes of the results feeding it, so re-running a pipeline
+after editing one node only recomputes the nodes downstream of the edit.
+Results are kept in memory and in the disk store (result_store.py), which
+other worker processes and later restarts read too.
+
+Chains the compiler marked as fused (row-by-row table nodes feeding only
+each other) run as one task that takes the input PIPELINE_FUSION_BATCH_ROWS
+rows at a time through every step, so the tables in between are never built
+whole. Only their previews are, which is all a result shows of them.
+"""
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from django.conf import settings
+
+from .cache import LRUCache
+from .compiler import compile_pipeline
+from .operators import get_operator
+from .profiling import run_profiled, rows, folded
+from .result_store import get_result_store
+from .table import Table, to_table, concat, slices, jsonable, sizeof
+
+_pool_lock = threading.Lock()
+_pools = {}
+
+# node key -> outputs by port name, shared by every request in this process
+result_cache = LRUCache(settings.PIPELINE_CACHE_SIZE, max_bytes=settings.PIPELINE_CACHE_MAX_BYTES,
+                        sizeof=sizeof)
+
+
+def get_pool(kind=None, max_workers=None):
+    """Return the shared thread or process pool for this process"""
+    kind = kind or settings.PIPELINE_EXECUTOR
+    max_workers = max_workers or settings.PIPELINE_MAX_WORKERS
+    if kind not in ('thread', 'process'):
+        raise ValueError(f"Unknown pipeline executor: {kind}")
+    key = (kind, max_workers, os.getpid())
+    with _pool_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool_class = ThreadPoolExecutor if kind == 'thread' else ProcessPoolExecutor
+            pool = pool_class(max_workers=max_workers)
+            _pools[key] = pool
+        return pool
+
+
+def shutdown_pools():
+    with _pool_lock:
+        for key, pool in list(_pools.items()):
+            if key[2] == os.getpid():
+                pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+
+atexit.register(shutdown_pools)
+
+
+def run_node(node_type, data, inputs):
+    """Run one operator; module level so it can be shipped to a process pool"""
+    return get_operator(node_type)(inputs, data)
+
+
+def run_fused(steps, inputs, batch_rows, preview_rows):
+    """Run a fused chain, given as (node_type, data) steps, batch by batch.
+
+    Returns (outputs, error) for each step, as running them one by one would.
+    Steps before the last return their table's preview. If any step fails
+    the chain is re-run node by node, so the error is reported exactly as
+    without fusion.
+    """
+    try:
+        table = to_table(inputs.get('data'))
+        # The last step's batches, and enough of every other step's for its preview
+        parts = [[] for _ in steps]
+        counts = [0] * len(steps)
+        for batch in slices(table, batch_rows) if table.num_rows else [table]:
+            for index, (node_type, data) in enumerate(steps):
+                batch = get_operator(node_type)({'data': batch}, data)['table']
+                counts[index] += batch.num_rows
+                if index == len(steps) - 1 or sum(part.num_rows for part in parts[index]) < preview_rows:
+                    parts[index].append(batch)
+    except Exception:
+        return _run_unfused(steps, inputs)
+    results = [({'table': {**concat(part).to_json(preview_rows), 'num_rows': count}}, None)
+               for part, count in zip(parts[:-1], counts)]
+    return results + [({'table': concat(parts[-1])}, None)]
+
+
+def _run_unfused(steps, inputs):
+    results = []
+    for node_type, data in steps:
+        try:
+            outputs = run_node(node_type, data, inputs)
+        except Exception as e:
+            return results + [(None, str(e))]
+        results.append((outputs, None))
+        inputs = {'data': outputs.get('table')}
+    return results
+
+
+def node_data(node):
+    return {item['name']: item.get('value') for item in node.get('data', [])}
+
+
+def node_keys(plan, node_map):
+    """Content hash of every node: its type, data and the hashes of its upstream results"""
+    keys = {}
+    for node_id in plan.order:
+        node = node_map[node_id]
+        sources = sorted((wire.target_port, keys[wire.source_node], wire.source_port)
+                         for wire in plan.wiring[node_id])
+        payload = json.dumps([node.get('type'), sorted(node_data(node).items()), sources],
+                             sort_keys=True, default=str)
+        keys[node_id] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return keys
+
+
+def _gather_inputs(node_id, plan, outputs):
+    """Collect upstream output values keyed by this node's input port names"""
+    values = defaultdict(list)
+    for wire in plan.wiring[node_id]:
+        values[wire.target_port].append(outputs[wire.source_node].get(wire.source_port))
+    # Several connections into one port arrive as a list
+    return {name: items[0] if len(items) == 1 else items for name, items in values.items()}
+
+
+def execute_graph(nodes, connections, **options):
+    """Compile the graph (cached per shape) and execute it"""
+    return execute_plan(compile_pipeline(nodes, connections), nodes, **options)
+
+
+def execute_plan(plan, nodes, executor=None, max_workers=None, use_cache=True, cancel_event=None,
+                 on_event=None, profile=False):
+    """Execute every node of a compiled plan and return per-node outputs and errors.
+
+    Setting `cancel_event` stops new nodes from being scheduled; nodes already
+    running finish and everything not yet started is reported as cancelled.
+    `on_event` is called from the scheduling thread with node_started,
+    node_finished and partial_output events as the run progresses.
+    With `profile`, every computed node's result gets a `profile` (see
+    profiling.py) and the run a folded-stack export of them.
+    """
+    node_map = {node['id']: node for node in nodes}
+    keys = node_keys(plan, node_map)
+    pool = get_pool(executor, max_workers)
+    # first node id -> fused chain
+    fused = {group[0]: group for group in plan.fused} if settings.PIPELINE_FUSION else {}
+
+    results = {}
+    # node id -> outputs by port name, what downstream operators consume
+    outputs_by_name = {}
+    reused, recomputed = [], []
+    result_store = get_result_store()
+    # keys served from the disk store rather than memory
+    from_disk = set()
+    waiting = {node_id: len(sources) for node_id, sources in plan.upstream.items()}
+    ready = deque(plan.levels[0] if plan.levels else [])
+    running = {}
+    run_started = time.time()
+    # node id -> when its inputs were all ready, and its measurements
+    ready_at = {node_id: run_started for node_id in ready}
+    profiles = {}
+
+    def finish(node_id, outputs=None, error=None, state='success', cached=False):
+        names = plan.output_ports[node_id]
+        outputs_by_name[node_id] = outputs or {}
+        results[node_id] = {
+            'type': node_map[node_id].get('type'),
+            'status': state,
+            # Operators answer by port name, the whiteboard wires by port id.
+            # Tables stay columnar between nodes and are previewed here.
+            'outputs': {names.get(name, name): jsonable(value, settings.PIPELINE_TABLE_PREVIEW_ROWS)
+                        for name, value in (outputs or {}).items()},
+            'error': error,
+            'key': keys[node_id],
+            'cached': cached,
+        }
+        if on_event is not None:
+            result = results[node_id]
+            on_event({'event': 'node_finished', 'node_id': node_id, 'status': state,
+                      'error': error, 'cached': cached})
+            if state == 'success':
+                on_event({'event': 'partial_output', 'node_id': node_id, 'outputs': result['outputs']})
+        for child in plan.downstream[node_id]:
+            waiting[child] -= 1
+            if waiting[child] == 0:
+                ready.append(child)
+                if profile:
+                    ready_at[child] = time.time()
+
+    def schedule(node_id):
+        if node_id in results:
+            # Finished along with the fused chain it belongs to
+            return
+        failed = [source for source in plan.upstream[node_id] if results[source]['status'] != 'success']
+        if failed:
+            finish(node_id, error=f"Skipped: upstream node {sorted(failed)[0]} did not succeed", state='skipped')
+            return
+        if node_id in fused:
+            schedule_chain(fused[node_id])
+            return
+        outputs = recall(keys[node_id]) if use_cache else None
+        if outputs is not None:
+            reused.append(node_id)
+            finish(node_id, outputs=outputs, cached=True)
+            return
+        node = node_map[node_id]
+        inputs = _gather_inputs(node_id, plan, outputs_by_name)
+        if profile:
+            profiles[node_id] = {'rows_in': rows(inputs.values())}
+            future = pool.submit(run_profiled, run_node, node.get('type'), node_data(node), inputs)
+        else:
+            future = pool.submit(run_node, node.get('type'), node_data(node), inputs)
+        running[future] = node_id
+        if on_event is not None:
+            on_event({'event': 'node_started', 'node_id': node_id, 'type': node.get('type')})
+
+    def recall(key):
+        outputs = result_cache.get(key)
+        if outputs is None and result_store is not None:
+            outputs = result_store.get(key)
+            if outputs is not None:
+                from_disk.add(key)
+                result_cache.set(key, outputs)
+        return outputs
+
+    def remember(key, outputs, store=True):
+        result_cache.set(key, outputs)
+        if store and result_store is not None:
+            result_store.put(key, outputs)
+
+    def lookup(key):
+        outputs = recall(key)
+        return outputs if outputs is not None else recall(f"{key}:preview")
+
+    def schedule_chain(group):
+        if use_cache:
+            # The nodes inside a chain are cached as previews unless a fallback built them whole
+            cached = [lookup(keys[node_id]) for node_id in group[:-1]] + [recall(keys[group[-1]])]
+            if all(outputs is not None for outputs in cached):
+                for node_id, outputs in zip(group, cached):
+                    reused.append(node_id)
+                    finish(node_id, outputs=outputs, cached=True)
+                return
+        steps = [(node_map[node_id].get('type'), node_data(node_map[node_id])) for node_id in group]
+        inputs = _gather_inputs(group[0], plan, outputs_by_name)
+        arguments = (steps, inputs, settings.PIPELINE_FUSION_BATCH_ROWS, settings.PIPELINE_TABLE_PREVIEW_ROWS)
+        if profile:
+            profiles[group[0]] = {'rows_in': rows(inputs.values())}
+            future = pool.submit(run_profiled, run_fused, *arguments)
+        else:
+            future = pool.submit(run_fused, *arguments)
+        running[future] = group
+        if on_event is not None:
+            for node_id in group:
+                on_event({'event': 'node_started', 'node_id': node_id, 'type': node_map[node_id].get('type')})
+
+    def measured(node_id, measurements, outputs, **extra):
+        """Complete a node's profile from what the worker measured"""
+        started_ms = (measurements['started_at'] - run_started) * 1000
+        profiles[node_id] = {
+            **profiles.get(node_id, {}),
+            'queue_ms': round(max(measurements['started_at'] - ready_at[node_id], 0) * 1000, 3),
+            'started_ms': round(started_ms, 3),
+            'finished_ms': round(started_ms + measurements['wall_ms'], 3),
+            'wall_ms': measurements['wall_ms'],
+            'cpu_ms': measurements['cpu_ms'],
+            'peak_bytes': measurements['peak_bytes'],
+            'rows_out': rows(outputs.values()) if outputs else None,
+            **extra,
+        }
+
+    def finish_chain(group, chain_results, measurements=None):
+        if measurements is not None:
+            # The chain ran as one task, so its nodes share one measurement
+            for index, node_id in enumerate(group[:len(chain_results)]):
+                ready_at.setdefault(node_id, ready_at[group[0]])
+                rows_in = profiles.get(group[0], {}).get('rows_in') if index == 0 else \
+                    profiles[group[index - 1]]['rows_out']
+                measured(node_id, measurements, chain_results[index][0], rows_in=rows_in, fused_chain=list(group))
+        for index, node_id in enumerate(group):
+            if index >= len(chain_results):
+                finish(node_id, error=f"Skipped: upstream node {group[index - 1]} did not succeed", state='skipped')
+                continue
+            recomputed.append(node_id)
+            outputs, error = chain_results[index]
+            if error is not None:
+                finish(node_id, error=error, state='error')
+                continue
+            whole = isinstance(outputs.get('table'), Table)
+            remember(keys[node_id] if whole else f"{keys[node_id]}:preview", outputs)
+            finish(node_id, outputs=outputs)
+
+    cancelled = False
+    while ready or running:
+        cancelled = cancelled or (cancel_event is not None and cancel_event.is_set())
+        while ready and not cancelled:
+            schedule(ready.popleft())
+        if not running:
+            break
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            node_id = running.pop(future)
+            if isinstance(node_id, tuple):
+                measurements = None
+                try:
+                    chain_results = future.result()
+                    if profile:
+                        chain_results, measurements = chain_results
+                except Exception as e:
+                    chain_results = [(None, str(e))]
+                finish_chain(node_id, chain_results, measurements)
+                continue
+            recomputed.append(node_id)
+            try:
+                outputs = future.result()
+            except Exception as e:
+                profiles.pop(node_id, None)
+                finish(node_id, error=str(e), state='error')
+                continue
+            if profile:
+                outputs, measurements = outputs
+                measured(node_id, measurements, outputs)
+            # Only successful results are memoized, failures are retried next run.
+            # A source node's table is an uploaded dataset, already on disk as one.
+            dataset = not plan.upstream[node_id] and any(isinstance(value, Table) for value in outputs.values())
+            remember(keys[node_id], outputs, store=not dataset)
+            finish(node_id, outputs=outputs)
+
+    for node_id in plan.order:
+        if node_id not in results:
+            results[node_id] = {'type': node_map[node_id].get('type'), 'status': 'cancelled', 'outputs': {},
+                                'error': None, 'key': keys[node_id], 'cached': False}
+
+    if profile:
+        for node_id, measurements in profiles.items():
+            if 'wall_ms' in measurements:
+                results[node_id]['profile'] = measurements
+        for node_id in reused:
+            results[node_id]['profile'] = {'cached': True}
+
+    executed = len(reused) + len(recomputed)
+    execution = {
+        **plan.describe(),
+        'fused': [list(group) for group in fused.values()],
+        'cancelled': cancelled,
+        'results': results,
+        'cache': {
+            'reused': reused,
+            'recomputed': recomputed,
+            'hit_rate': round(len(reused) / executed, 4) if executed else 0.0,
+            'from_disk': [node_id for node_id in reused
+                          if keys[node_id] in from_disk or f"{keys[node_id]}:preview" in from_disk],
+        },
+    }
+    if profile:
+        execution['profile'] = {
+            'total_ms': round((time.time() - run_started) * 1000, 3),
+            'folded': folded(plan, node_map, {node_id: measurements for node_id, measurements in profiles.items()
+                                              if 'wall_ms' in measurements}),
+        }
+    return execution
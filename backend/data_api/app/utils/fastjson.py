@@ -0,0 +1,91 @@
+"""JSON encoding for API responses and request bodies.
+
+Uses orjson when it is installed, which renders a large board around ten
+times faster than the json module, and falls back to the json module when
+it is not. Either way ObjectId values are written as their hex string and
+datetimes in ISO 8601 (naive ones as datetime.isoformat() writes them), so
+views can return MongoDB documents' values as they are. Otherwise the
+output matches DRF's JSONRenderer: UTF-8, compact, numpy values and
+Decimals as DRF writes them.
+"""
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from bson.objectid import ObjectId
+from django.http import HttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'tolist'):
+        # numpy scalars and arrays
+        return value.tolist()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    """`data` as UTF-8 JSON bytes"""
+    if orjson is None:
+        return json.dumps(data, default=_default, ensure_ascii=False, allow_nan=False,
+                          separators=(',', ':')).encode('utf-8')
+    try:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    except orjson.JSONEncodeError:
+        # Non-string dict keys are rare and slow the common case down by
+        # half, so they only get a second attempt
+        return orjson.dumps(data, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def loads(data):
+    """Parse JSON from bytes or str, raising ValueError if it is malformed"""
+    if orjson is None:
+        return json.loads(data)
+    return orjson.loads(data)
+
+
+class FastJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
+
+
+class FastJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read() if stream is not None else b'')
+        except ValueError as e:
+            raise ParseError(f"JSON parse error - {str(e)}")
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse rendered with dumps(), for views outside DRF"""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
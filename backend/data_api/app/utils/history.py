@@ -0,0 +1,220 @@
+"""Project version history as snapshots plus deltas.
+
+Every write to a board records a version in `project_versions`, numbered by
+the board revision it produced. Most versions are deltas: the patch ops
+that lead from the previous version, so they cost as much as the edit did.
+Full uploads are diffed against the previous version to get those ops.
+Every HISTORY_SNAPSHOT_EVERY versions (or when a delta would be larger than
+the board) a full snapshot is stored instead, so rebuilding any version
+replays at most that many deltas on top of the nearest snapshot.
+
+The latest version of recently written projects is kept in memory, so
+recording a save does not have to rebuild it first. A cached version right
+before the one being recorded is used as it is. Otherwise it is checked
+against the latest stored version number, since other worker processes
+record versions too, and rebuilt when they differ. A patch recorded on top
+of a version other than the one before it is stored as a snapshot of the
+saved board, as its ops do not apply to the version we have.
+
+Saves hand their version to `defer`, which records it on a background
+thread, so diffing, sizing and writing the version stay out of the
+request. The board is only serialized to measure it when a snapshot is
+written; a delta's size is estimated from the version before it.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING
+
+from .board_ops import apply_ops, compact
+from .cache import LRUCache
+from .mongo import get_versions_collection
+
+METADATA_FIELDS = ('project_name', 'is_public', 'collaborators')
+
+
+def _size(value):
+    return len(json.dumps(value, default=str))
+
+
+def _by_id(items):
+    return {item['id']: item for item in items}
+
+
+def diff_boards(old, new):
+    """Ops that turn board `old` into board `new` (both dicts with nodes and connections)"""
+    old_nodes, new_nodes = _by_id(old.get('nodes', [])), _by_id(new.get('nodes', []))
+    old_connections, new_connections = _by_id(old.get('connections', [])), _by_id(new.get('connections', []))
+
+    deletes, adds, updates = [], [], []
+    # Ops can set fields but not remove them, so a node that lost a field is
+    # deleted and re-added, and so are the connections that deleting it drops
+    replaced = set()
+    for node_id, node in old_nodes.items():
+        if node_id not in new_nodes:
+            deletes.append({'op': 'delete_node', 'node_id': node_id})
+        elif set(node) - set(new_nodes[node_id]):
+            replaced.add(node_id)
+            deletes.append({'op': 'delete_node', 'node_id': node_id})
+            adds.append({'op': 'add_node', 'node': new_nodes[node_id]})
+        else:
+            changes = {key: value for key, value in new_nodes[node_id].items() if node.get(key) != value}
+            if changes:
+                updates.append({'op': 'update_node', 'node_id': node_id, 'changes': changes})
+    adds += [{'op': 'add_node', 'node': node} for node_id, node in new_nodes.items() if node_id not in old_nodes]
+
+    for connection_id, connection in new_connections.items():
+        old_connection = old_connections.get(connection_id)
+        dropped = connection.get('sourceNodeId') in replaced or connection.get('targetNodeId') in replaced
+        if old_connection is None or dropped:
+            adds.append({'op': 'add_connection', 'connection': connection})
+        elif set(old_connection) - set(connection):
+            deletes.append({'op': 'delete_connection', 'connection_id': connection_id})
+            adds.append({'op': 'add_connection', 'connection': connection})
+        else:
+            changes = {key: value for key, value in connection.items() if old_connection.get(key) != value}
+            if changes:
+                updates.append({'op': 'update_connection', 'connection_id': connection_id, 'changes': changes})
+    deletes += [{'op': 'delete_connection', 'connection_id': connection_id}
+                for connection_id in old_connections if connection_id not in new_connections]
+
+    return deletes + adds + updates
+
+
+class VersionHistory:
+    def __init__(self, snapshot_every, head_entries, head_max_bytes):
+        self.snapshot_every = snapshot_every
+        # project id -> latest recorded version: {'version', 'board', 'bytes', 'deltas', 'metadata'}
+        self.heads = LRUCache(head_entries, max_bytes=head_max_bytes, sizeof=lambda head: head['bytes'])
+        # Striped, so there is a fixed number however many projects are written
+        self._locks = [threading.Lock() for _ in range(max(head_entries, 1))]
+        # One thread, so versions are recorded in the order the saves handed them over
+        self._recorder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='version-history')
+        self._pending = []
+        self._pending_lock = threading.Lock()
+
+    def _lock(self, project_id):
+        return self._locks[hash(project_id) % len(self._locks)]
+
+    def defer(self, record, *args):
+        """Run `record(*args)` on the history thread; the caller handles its errors"""
+        future = self._recorder.submit(record, *args)
+        with self._pending_lock:
+            self._pending = [pending for pending in self._pending if not pending.done()] + [future]
+        return future
+
+    def flush(self):
+        """Wait for the versions handed to `defer` so far to be recorded"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.exception()
+
+    def record_state(self, project_id, version, project_data):
+        """Record a full save. `project_data` is what was written, nodes and connections included"""
+        board = {'nodes': project_data.get('nodes', []), 'connections': project_data.get('connections', [])}
+        metadata = {key: project_data[key] for key in METADATA_FIELDS if key in project_data}
+        with self._lock(project_id):
+            head = self._head(project_id, version)
+            ops = diff_boards(head['board'], board) if head else None
+            self._record(project_id, version, board, ops, metadata, head)
+
+    def record_ops(self, project_id, version, ops, load_board):
+        """Record a patch. `load_board` reads the stored board if there is no version to apply it to,
+        and returns None if the board has moved past `version` since"""
+        with self._lock(project_id):
+            head = self._head(project_id, version)
+            if head is None or version != head['version'] + 1:
+                # Nothing to apply the ops to, or revisions in between went unrecorded
+                board = load_board()
+                if board is not None:
+                    self._record(project_id, version, board, None, {}, head)
+                return
+            ops = compact(ops)
+            self._record(project_id, version, apply_ops(head['board'], ops), ops, {}, head)
+
+    def _record(self, project_id, version, board, ops, metadata, head):
+        if head is not None and version <= head['version']:
+            # Another writer already recorded this or a later version
+            return
+        document = {'project_id': project_id, 'version': version, 'created_at': datetime.now()}
+        ops_bytes = _size(ops) if ops is not None else None
+        # A delta as large as the board before it is no cheaper than a snapshot
+        if ops is None or head is None or head['deltas'] + 1 >= self.snapshot_every or ops_bytes >= head['bytes']:
+            # Snapshots carry the full metadata so a rebuild never looks further back
+            metadata = {**(head['metadata'] if head else {}), **metadata}
+            document.update({'kind': 'snapshot', 'board': board, 'deltas': 0, **metadata})
+            size = _size(board)
+        else:
+            document.update({'kind': 'delta', 'ops': ops, 'op_count': len(ops), 'deltas': head['deltas'] + 1,
+                             **metadata})
+            metadata = {**head['metadata'], **metadata}
+            # An upper bound, measured again at the next snapshot
+            size = head['bytes'] + ops_bytes
+        get_versions_collection().insert_one(document)
+        self.heads.set(project_id, {'version': version, 'deltas': document['deltas'], 'metadata': metadata,
+                                    'bytes': size,
+                                    'board': {'nodes': board['nodes'], 'connections': board['connections']}})
+
+    def _head(self, project_id, version):
+        """The latest recorded version, to record `version` on top of"""
+        head = self.heads.get(project_id)
+        if head is not None and head['version'] == version - 1:
+            # Nothing can be recorded between two consecutive revisions, so it is current
+            return head
+        latest = get_versions_collection().find_one({'project_id': project_id}, {'version': 1},
+                                                    sort=[('version', DESCENDING)])
+        if latest is None:
+            self.heads.pop(project_id)
+            return None
+        if head is not None and head['version'] == latest['version']:
+            return head
+        rebuilt = self.reconstruct(project_id)
+        if rebuilt is None:
+            self.heads.pop(project_id)
+            return None
+        board = {'nodes': rebuilt['nodes'], 'connections': rebuilt['connections']}
+        head = {'version': rebuilt['version'], 'deltas': rebuilt['deltas'], 'bytes': _size(board),
+                'metadata': {key: rebuilt[key] for key in METADATA_FIELDS if key in rebuilt}, 'board': board}
+        self.heads.set(project_id, head)
+        return head
+
+    def reconstruct(self, project_id, version=None):
+        """The board at `version` (the latest if None), or None if there is no such version"""
+        collection = get_versions_collection()
+        bound = {} if version is None else {'version': {'$lte': version}}
+        snapshot = collection.find_one({'project_id': project_id, 'kind': 'snapshot', **bound},
+                                       sort=[('version', DESCENDING)])
+        if snapshot is None:
+            return None
+        deltas = list(collection.find(
+            {'project_id': project_id, 'kind': 'delta', 'version': {'$gt': snapshot['version'], **bound.get('version', {})}},
+            sort=[('version', ASCENDING)]
+        ))
+        last = deltas[-1] if deltas else snapshot
+        if version is not None and last['version'] != version:
+            return None
+        board = snapshot['board']
+        for delta in deltas:
+            board = apply_ops(board, delta['ops'])
+        # Deltas only carry metadata that a full save wrote
+        metadata = {}
+        for document in [snapshot] + deltas:
+            metadata.update({key: document[key] for key in METADATA_FIELDS if key in document})
+        return {**metadata, 'version': last['version'], 'created_at': last['created_at'], 'deltas': last['deltas'],
+                'replayed': len(deltas), 'nodes': board['nodes'], 'connections': board['connections']}
+
+    def delete(self, project_id):
+        self.flush()
+        self.heads.pop(project_id)
+        get_versions_collection().delete_many({'project_id': project_id})
+
+
+history = VersionHistory(
+    snapshot_every=settings.HISTORY_SNAPSHOT_EVERY,
+    head_entries=settings.HISTORY_HEAD_CACHE_ENTRIES,
+    head_max_bytes=settings.HISTORY_HEAD_CACHE_MAX_BYTES,
+)
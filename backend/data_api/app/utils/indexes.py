@@ -0,0 +1,145 @@
+"""MongoDB indexes the app relies on, and a reconciler that makes them exist.
+
+Every query path the views use is declared here next to the index that
+serves it. `ensure_indexes` creates missing indexes, rebuilds ones whose
+definition drifted and reports (or drops) undeclared ones; `explain_queries`
+runs the declared query shapes through explain() and flags collection scans
+and in-memory sorts.
+"""
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from .mongo import (get_users_collection, get_projects_collection, get_jobs_collection,
+                    get_board_nodes_collection, get_board_connections_collection, get_versions_collection)
+from .permissions import read_access_filter
+
+INDEXES = {
+    'users': (get_users_collection, [
+        # LoginView / SignupView look users up by email
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+        # AllUsersView keyset pages, sorted by email or created_at
+        IndexModel([('email', ASCENDING), ('_id', ASCENDING)], name='email_id'),
+        IndexModel([('created_at', ASCENDING), ('_id', ASCENDING)], name='created_at_id'),
+    ]),
+    'projects': (get_projects_collection, [
+        # AllProjectsView keyset pages for one owner
+        IndexModel([('user_id', ASCENDING), ('created_at', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_created_at_id'),
+        IndexModel([('user_id', ASCENDING), ('project_name', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_project_name_id'),
+        # Collaborator access checks (multikey)
+        IndexModel([('collaborators.id', ASCENDING)], name='collaborators_id'),
+    ]),
+    'board_nodes': (get_board_nodes_collection, [
+        IndexModel([('project_id', ASCENDING), ('id', ASCENDING)], name='project_id_id', unique=True),
+        # Viewport loading: equality on project, sort/range on x, range on y
+        IndexModel([('project_id', ASCENDING), ('position.x', ASCENDING), ('_id', ASCENDING),
+                    ('position.y', ASCENDING)], name='project_id_position'),
+    ]),
+    'board_connections': (get_board_connections_collection, [
+        IndexModel([('project_id', ASCENDING), ('id', ASCENDING)], name='project_id_id', unique=True),
+        IndexModel([('project_id', ASCENDING), ('sourceNodeId', ASCENDING)], name='project_id_source'),
+        IndexModel([('project_id', ASCENDING), ('targetNodeId', ASCENDING)], name='project_id_target'),
+    ]),
+    'project_versions': (get_versions_collection, [
+        # Rebuilds, and version listing keyset pages (on version alone, as it is unique)
+        IndexModel([('project_id', ASCENDING), ('version', ASCENDING)], name='project_id_version', unique=True),
+    ]),
+    'pipeline_jobs': (get_jobs_collection, [
+        # JobManager recovery scan for jobs whose worker stopped heartbeating
+        IndexModel([('status', ASCENDING), ('heartbeat_at', ASCENDING)], name='status_heartbeat_at'),
+    ]),
+}
+
+# Representative query shapes: (collection, description, filter, sort)
+QUERY_SHAPES = [
+    ('users', 'login by email', {'email': 'someone@example.com'}, None),
+    ('users', 'list users by email', {}, [('email', ASCENDING), ('_id', ASCENDING)]),
+    ('users', 'collaborator picker prefix search', {'email': {'$regex': '^some'}},
+     [('email', ASCENDING), ('_id', ASCENDING)]),
+    ('projects', 'list projects by created_at', {'user_id': 'user'},
+     [('created_at', DESCENDING), ('_id', DESCENDING)]),
+    ('projects', 'list projects by name', {'user_id': 'user'},
+     [('project_name', ASCENDING), ('_id', ASCENDING)]),
+    ('projects', 'projects shared with a collaborator', {'collaborators.id': 'user'}, None),
+    ('projects', 'open board with access check', {'_id': ObjectId(), **read_access_filter('user')}, None),
+    ('board_nodes', 'nodes in a viewport',
+     {'project_id': 'project', 'position.x': {'$gte': 0, '$lte': 1000}, 'position.y': {'$gte': 0, '$lte': 1000}},
+     [('position.x', ASCENDING), ('_id', ASCENDING)]),
+    ('board_connections', 'connections touching viewport nodes',
+     {'project_id': 'project', '$or': [{'sourceNodeId': {'$in': ['a']}}, {'targetNodeId': {'$in': ['a']}}]}, None),
+    ('project_versions', 'nearest snapshot before a version',
+     {'project_id': 'project', 'kind': 'snapshot', 'version': {'$lte': 100}}, [('version', DESCENDING)]),
+    ('project_versions', 'list versions', {'project_id': 'project'}, [('version', DESCENDING)]),
+    ('pipeline_jobs', 'stale job recovery',
+     {'status': {'$in': ['queued', 'running']}, 'heartbeat_at': {'$lt': datetime(2000, 1, 1)}}, None),
+]
+
+
+def _definition(info):
+    options = {key: info[key] for key in ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+               if key in info}
+    return list(info['key'].items()), options
+
+
+def ensure_indexes(drop_extra=False):
+    """Create missing or drifted indexes; return a report of what was done"""
+    report = []
+    for name, (get_collection, models) in INDEXES.items():
+        collection = get_collection()
+        existing = {info['name']: _definition(info) for info in collection.list_indexes()}
+        declared = set()
+        for model in models:
+            document = model.document
+            index_name = document['name']
+            declared.add(index_name)
+            wanted = _definition(document)
+            if index_name in existing and existing[index_name] == wanted:
+                report.append({'collection': name, 'index': index_name, 'action': 'ok'})
+                continue
+            action = 'created'
+            if index_name in existing:
+                collection.drop_index(index_name)
+                action = 'rebuilt'
+            collection.create_indexes([model])
+            report.append({'collection': name, 'index': index_name, 'action': action})
+        for index_name in existing:
+            if index_name == '_id_' or index_name in declared:
+                continue
+            if drop_extra:
+                collection.drop_index(index_name)
+            report.append({'collection': name, 'index': index_name,
+                           'action': 'dropped' if drop_extra else 'undeclared'})
+    return report
+
+
+def _stages(plan):
+    """Flatten the stage names of an explain() winning plan"""
+    stages = [plan.get('stage')]
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            stages += _stages(plan[key])
+    for child in plan.get('inputStages', []):
+        stages += _stages(child)
+    return [stage for stage in stages if stage]
+
+
+def explain_queries():
+    """Explain every declared query shape and flag COLLSCANs and blocking sorts"""
+    report = []
+    for name, description, query, sort in QUERY_SHAPES:
+        cursor = INDEXES[name][0]().find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.limit(1).explain().get('queryPlanner', {}).get('winningPlan', {})
+        stages = _stages(plan)
+        report.append({
+            'collection': name,
+            'query': description,
+            'stages': stages,
+            'collscan': 'COLLSCAN' in stages,
+            'in_memory_sort': 'SORT' in stages,
+        })
+    return report
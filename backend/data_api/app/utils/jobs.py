@@ -0,0 +1,243 @@
+"""Background pipeline jobs.
+
+Submitting a pipeline stores a job document in MongoDB and hands it to a
+bounded per-process worker pool, so the request returns immediately with a
+job id. A monitor thread heartbeats the jobs this process owns, picks up
+cancel requests made through any process, and claims jobs whose owner
+stopped heartbeating (e.g. a worker restart) so they run again.
+"""
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from .compiler import compile_pipeline
+from .events import broker
+from .mongo import get_jobs_collection
+from .utils import pipeline_mode, process_pipeline
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATES = ('queued', 'running')
+FINAL_STATES = ('success', 'error', 'cancelled', 'failed')
+# Execution options of a submitted pipeline that are passed on to process_pipeline
+PAYLOAD_OPTIONS = ('mode', 'profile')
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _public(job):
+    return {
+        'job_id': job['_id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'started_at': job.get('started_at'),
+        'finished_at': job.get('finished_at'),
+        'attempts': job.get('attempts', 0),
+        'cancel_requested': job.get('cancel_requested', False),
+        'result': job.get('result'),
+        'error': job.get('error'),
+    }
+
+
+class JobManager:
+    def __init__(self, max_workers, max_queued, heartbeat_seconds, stale_seconds, max_attempts):
+        self.max_queued = max_queued
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline-job')
+        self._lock = threading.Lock()
+        # job id -> cancel event, for the jobs owned by this process
+        self._local = {}
+        self._stopped = threading.Event()
+        self._monitor = threading.Thread(target=self._monitor_loop, name='pipeline-job-monitor', daemon=True)
+        self._monitor.start()
+
+    def submit(self, data, user_id=None):
+        """Validate and enqueue a pipeline, returning the job id"""
+        # Reject malformed graphs now rather than in the background
+        compile_pipeline(data.get('nodes', []), data.get('connections', []))
+        pipeline_mode(data)
+        # The slot is taken in the same step as the check, so concurrent submits cannot overfill the queue
+        job_id = ObjectId()
+        event = threading.Event()
+        with self._lock:
+            if len(self._local) >= self.max_queued:
+                raise JobQueueFull(f"Pipeline job queue is full ({self.max_queued} jobs)")
+            self._local[str(job_id)] = event
+        payload = {
+            'nodes': data.get('nodes', []),
+            'connections': data.get('connections', []),
+            'use_cache': data.get('use_cache', True),
+        }
+        # Only the options that were sent, so process_pipeline falls back to the same defaults as a direct run
+        payload.update({key: data[key] for key in PAYLOAD_OPTIONS if key in data})
+        now = datetime.now()
+        try:
+            get_jobs_collection().insert_one({
+                '_id': job_id,
+                'status': 'queued',
+                'user_id': user_id,
+                'payload': payload,
+                'worker': self.worker_id,
+                'heartbeat_at': now,
+                'created_at': now,
+                'attempts': 1,
+                'cancel_requested': False,
+            })
+        except Exception:
+            with self._lock:
+                self._local.pop(str(job_id), None)
+            raise
+        self._start(job_id, event)
+        return str(job_id)
+
+    def get(self, job_id):
+        job = get_jobs_collection().find_one({'_id': ObjectId(job_id)}, {'payload': 0})
+        return _public(job) if job else None
+
+    def cancel(self, job_id):
+        """Cancel a job: queued jobs stop at once, running ones after their current nodes"""
+        jobs = get_jobs_collection()
+        job = jobs.find_one_and_update(
+            {'_id': ObjectId(job_id), 'status': {'$in': ACTIVE_STATES}},
+            {'$set': {'cancel_requested': True}},
+            projection={'payload': 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            return self.get(job_id)
+        # Jobs owned by other processes are picked up by their monitor thread
+        with self._lock:
+            event = self._local.get(str(job['_id']))
+        if event is not None:
+            event.set()
+        return _public(job)
+
+    def shutdown(self):
+        self._stopped.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _start(self, job_id, event=None):
+        if event is None:
+            event = threading.Event()
+            with self._lock:
+                self._local[str(job_id)] = event
+        broker.open(str(job_id))
+        self._pool.submit(self._run, job_id, event)
+
+    def _run(self, job_id, event):
+        jobs = get_jobs_collection()
+        try:
+            job = jobs.find_one_and_update(
+                {'_id': job_id, 'status': 'queued', 'worker': self.worker_id, 'cancel_requested': False},
+                {'$set': {'status': 'running', 'started_at': datetime.now()}},
+            )
+            if job is None:
+                # Cancelled while queued, or claimed by another process
+                cancelled = jobs.update_one({'_id': job_id, 'status': 'queued', 'cancel_requested': True},
+                                            {'$set': {'status': 'cancelled', 'finished_at': datetime.now()}})
+                if cancelled.modified_count:
+                    broker.publish(str(job_id), {'event': 'job_finished', 'job_id': str(job_id),
+                                                 'status': 'cancelled', 'error': None})
+                return
+            channel = str(job_id)
+            broker.publish(channel, {'event': 'job_started', 'job_id': channel})
+            try:
+                result = process_pipeline(job['payload'], cancel_event=event,
+                                          on_event=lambda e: broker.publish(channel, e))
+                update = {'status': result['status'], 'result': result}
+            except Exception as e:
+                update = {'status': 'error', 'error': str(e)}
+            update['finished_at'] = datetime.now()
+            try:
+                jobs.update_one({'_id': job_id, 'worker': self.worker_id}, {'$set': update})
+            except Exception as e:
+                # E.g. a result over the 16MB document limit: fail the job rather than leave it running
+                logger.exception(f"Storing the result of job {job_id} failed: {str(e)}")
+                update = {'status': 'failed', 'error': f"Failed to store job result: {str(e)}",
+                          'finished_at': datetime.now()}
+                jobs.update_one({'_id': job_id, 'worker': self.worker_id}, {'$set': update})
+            broker.publish(channel, {'event': 'job_finished', 'job_id': channel, 'status': update['status'],
+                                     'error': update.get('error')})
+        finally:
+            with self._lock:
+                self._local.pop(str(job_id), None)
+            broker.close(str(job_id))
+
+    def _monitor_loop(self):
+        while not self._stopped.wait(self.heartbeat_seconds):
+            try:
+                self._heartbeat()
+                self._recover()
+            except Exception as e:
+                # MongoDB hiccups must not kill the monitor; retry next tick
+                logger.exception(f"Pipeline job monitor tick failed: {str(e)}")
+
+    def _heartbeat(self):
+        with self._lock:
+            local = dict(self._local)
+        if not local:
+            return
+        jobs = get_jobs_collection()
+        ids = [ObjectId(job_id) for job_id in local]
+        jobs.update_many({'_id': {'$in': ids}, 'worker': self.worker_id}, {'$set': {'heartbeat_at': datetime.now()}})
+        for job in jobs.find({'_id': {'$in': ids}, 'cancel_requested': True}, {'_id': 1}):
+            local[str(job['_id'])].set()
+
+    def _recover(self):
+        """Claim jobs whose owning process stopped heartbeating"""
+        jobs = get_jobs_collection()
+        stale = datetime.now() - timedelta(seconds=self.stale_seconds)
+        while True:
+            with self._lock:
+                if len(self._local) >= self.max_queued:
+                    return
+            job = jobs.find_one_and_update(
+                {'status': {'$in': ACTIVE_STATES}, 'heartbeat_at': {'$lt': stale}},
+                {'$set': {'status': 'queued', 'worker': self.worker_id, 'heartbeat_at': datetime.now()},
+                 '$inc': {'attempts': 1}},
+                projection={'attempts': 1, 'cancel_requested': 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                return
+            if job['cancel_requested'] or job['attempts'] > self.max_attempts:
+                jobs.update_one({'_id': job['_id']}, {'$set': {
+                    'status': 'cancelled' if job['cancel_requested'] else 'failed',
+                    'error': None if job['cancel_requested'] else 'Worker lost too many times',
+                    'finished_at': datetime.now(),
+                }})
+                continue
+            self._start(job['_id'])
+
+
+_manager_lock = threading.Lock()
+_manager = None
+_manager_pid = None
+
+
+def get_job_manager() -> JobManager:
+    """Return this process's job manager, starting it on first use"""
+    global _manager, _manager_pid
+    with _manager_lock:
+        if _manager is None or _manager_pid != os.getpid():
+            _manager = JobManager(
+                max_workers=settings.PIPELINE_JOB_WORKERS,
+                max_queued=settings.PIPELINE_JOB_MAX_QUEUED,
+                heartbeat_seconds=settings.PIPELINE_JOB_HEARTBEAT_SECONDS,
+                stale_seconds=settings.PIPELINE_JOB_STALE_SECONDS,
+                max_attempts=settings.PIPELINE_JOB_MAX_ATTEMPTS,
+            )
+            _manager_pid = os.getpid()
+        return _manager
@@ -0,0 +1,174 @@
+"""In-process request and MongoDB metrics, served at /metrics in Prometheus text format.
+
+MetricsMiddleware times every request and records its size, labelled by
+route pattern (not path, so ids do not multiply the series). The pymongo
+command listener times every command, labelled by collection and command
+name. Both record into histograms.
+
+Recording takes no lock: each thread updates its own shard of every metric,
+and /metrics adds the shards up when scraped. Counts only ever grow, as
+Prometheus expects, so a shard outlives its thread.
+"""
+import bisect
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            # label values -> [count per bucket..., +Inf count, sum]
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            series = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        # Buckets are stored non-cumulative and summed when rendered
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def collect(self):
+        """label values -> (cumulative bucket counts, sum)"""
+        with self._shards_lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            for labels, series in list(shard.items()):
+                total = totals.setdefault(labels, [0] * len(series))
+                for index, value in enumerate(series):
+                    total[index] += value
+        collected = {}
+        for labels, total in totals.items():
+            cumulative, running = [], 0
+            for count in total[:-1]:
+                running += count
+                cumulative.append(running)
+            collected[labels] = (cumulative, total[-1])
+        return collected
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (cumulative, total) in sorted(self.collect().items()):
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, labels)]
+            for bound, count in zip([*map(_number, self.buckets), '+Inf'], cumulative):
+                bucket = ','.join(pairs + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket}}} {count}")
+            labelled = ','.join(pairs)
+            lines.append(f"{self.name}_sum{{{labelled}}} {_number(total)}")
+            lines.append(f"{self.name}_count{{{labelled}}} {cumulative[-1]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Time spent handling requests',
+                            ('method', 'route', 'status'), LATENCY_BUCKETS)
+REQUEST_SIZE = Histogram('http_request_size_bytes', 'Request body sizes', ('method', 'route'), SIZE_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body sizes, streamed responses excluded',
+                          ('method', 'route'), SIZE_BUCKETS)
+MONGO_LATENCY = Histogram('mongodb_command_duration_seconds', 'MongoDB command round trips',
+                          ('collection', 'command', 'outcome'), LATENCY_BUCKETS)
+
+HISTOGRAMS = (REQUEST_LATENCY, REQUEST_SIZE, RESPONSE_SIZE, MONGO_LATENCY)
+
+
+def render():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """Sync and async capable, so async views are not pushed onto a thread for it"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - started)
+        return response
+
+    async def _acall(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, elapsed):
+        route = _route(request)
+        REQUEST_LATENCY.observe(elapsed, request.method, route, str(response.status_code))
+        try:
+            REQUEST_SIZE.observe(int(request.META.get('CONTENT_LENGTH') or 0), request.method, route)
+        except ValueError:
+            pass
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), request.method, route)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Times MongoDB commands; pass it to MongoClient(event_listeners=[...])"""
+
+    def __init__(self):
+        # (connection, request id) -> collection, from started to finished
+        self._collections = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            target = event.command.get('collection')
+        self._collections[(event.connection_id, event.request_id)] = \
+            target if isinstance(target, str) else event.database_name
+
+    def _finished(self, event, outcome):
+        collection = self._collections.pop((event.connection_id, event.request_id), 'unknown')
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, collection, event.command_name, outcome)
+
+    def succeeded(self, event):
+        self._finished(event, 'success')
+
+    def failed(self, event):
+        self._finished(event, 'failure')
+
+
+command_metrics = CommandMetrics()
@@ -0,0 +1,146 @@
+"""Process-wide MongoDB client shared by every view.
+
+MongoClient keeps its own connection pool and monitor threads, so one
+client per process is enough. Views should use the accessors below instead
+of building a new client on every request.
+
+Async views (app/async_views.py) use AsyncMongoClient through the
+get_async_* accessors. An async client belongs to the event loop it first
+ran on, so there is one per loop; under ASGI that is one per process.
+"""
+import asyncio
+import atexit
+import os
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.collection import Collection
+
+from .metrics import command_metrics
+
+_lock = threading.Lock()
+_client = None
+_client_pid = None
+# event loop -> AsyncMongoClient
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _build_client(client_class=MongoClient):
+    # connect=False so a client created in a pre-fork master does not start
+    # monitor threads or open sockets that the forked workers would inherit
+    return client_class(
+        settings.MONGODB_URI,
+        maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGODB_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=settings.MONGODB_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=settings.MONGODB_SOCKET_TIMEOUT_MS,
+        event_listeners=[command_metrics],
+        connect=False,
+    )
+
+
+def get_client() -> MongoClient:
+    """Return the shared client, creating it on first use in this process"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            # A client inherited across fork() is not safe to use, so the
+            # child drops the reference and builds its own pool
+            _client = _build_client()
+            _client_pid = pid
+        return _client
+
+
+def get_users_collection() -> Collection:
+    return get_client().get_database(settings.MONGODB_USERS_DB).users
+
+
+def get_projects_collection() -> Collection:
+    return get_client().get_database(settings.MONGODB_PROJECTS_DB).projects
+
+
+def get_jobs_collection() -> Collection:
+    return get_client().get_database(settings.MONGODB_PROJECTS_DB).pipeline_jobs
+
+
+def get_board_nodes_collection() -> Collection:
+    return get_client().get_database(settings.MONGODB_PROJECTS_DB).board_nodes
+
+
+def get_board_connections_collection() -> Collection:
+    return get_client().get_database(settings.MONGODB_PROJECTS_DB).board_connections
+
+
+def get_versions_collection() -> Collection:
+    return get_client().get_database(settings.MONGODB_PROJECTS_DB).project_versions
+
+
+def get_async_client() -> AsyncMongoClient:
+    """Return the async client of the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        # Only ever touched from its own loop's thread, so no lock
+        client = _async_clients[loop] = _build_client(AsyncMongoClient)
+    return client
+
+
+def get_async_projects_collection() -> AsyncCollection:
+    return get_async_client().get_database(settings.MONGODB_PROJECTS_DB).projects
+
+
+def get_async_board_nodes_collection() -> AsyncCollection:
+    return get_async_client().get_database(settings.MONGODB_PROJECTS_DB).board_nodes
+
+
+def get_async_board_connections_collection() -> AsyncCollection:
+    return get_async_client().get_database(settings.MONGODB_PROJECTS_DB).board_connections
+
+
+def get_async_versions_collection() -> AsyncCollection:
+    return get_async_client().get_database(settings.MONGODB_PROJECTS_DB).project_versions
+
+
+def close_client():
+    """Close the shared client (pool sockets and monitor threads)"""
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def ping():
+    """Health probe: round-trip a ping command and report the latency"""
+    started = time.perf_counter()
+    try:
+        get_client().admin.command('ping')
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+    return {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 2)}
+
+
+def _reset_after_fork():
+    # The parent's lock may have been held at fork time, so replace it too
+    global _lock, _client, _client_pid, _async_clients
+    _lock = threading.Lock()
+    _client = None
+    _client_pid = None
+    _async_clients = weakref.WeakKeyDictionary()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+atexit.register(close_client)
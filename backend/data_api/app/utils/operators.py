@@ -0,0 +1,90 @@
+"""Node operators, registered by the node `type` used in the frontend nodeTemplates.
+
+An operator takes the values arriving on its input ports and the node's
+`data` fields (both keyed by name) and returns a dict of output port name
+to value.
+"""
+from .datasets import is_dataset_id, load as load_dataset
+
+OPERATORS = {}
+# Operators that map a `data` table to a `table` row by row, so running them
+# on slices of the input and concatenating gives the same table. Chains of
+# them are fused into one pass (see compiler.fuse_chains).
+FUSIBLE = set()
+
+
+def register(node_type, fusible=False):
+    def decorator(func):
+        OPERATORS[node_type] = func
+        if fusible:
+            FUSIBLE.add(node_type)
+        return func
+    return decorator
+
+
+def get_operator(node_type):
+    try:
+        return OPERATORS[node_type]
+    except KeyError:
+        raise ValueError(f"Unknown node type: {node_type}")
+
+
+def _as_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return '\n'.join(_as_text(v) for v in value)
+    return str(value)
+
+
+@register('inputManager')
+def input_manager(inputs, data):
+    # A connected input wins over the text typed into the node
+    if 'input text' not in inputs and not data.get('text') and is_dataset_id(data.get('csv file')):
+        # An uploaded dataset (app/utils/datasets.py), already parsed into columns
+        table = load_dataset(data['csv file'])
+        return {'output': table, 'output number': str(table.num_rows)}
+    text = _as_text(inputs['input text']) if 'input text' in inputs else data.get('text') or data.get('csv file') or ''
+    return {
+        'output': text,
+        'output number': str(len(text.split()))
+    }
+
+
+TEXT_OPERATIONS = {
+    'strip': str.strip,
+    'lower': str.lower,
+    'upper': str.upper,
+    'title': str.title,
+    'reverse': lambda s: s[::-1],
+}
+
+
+@register('textProcessor')
+def text_processor(inputs, data):
+    """Apply the comma separated operations in the `text` field, in order"""
+    text = _as_text(inputs.get('input'))
+    operations = [op.strip() for op in (data.get('text') or 'strip').split(',') if op.strip()]
+    for operation in operations:
+        if operation not in TEXT_OPERATIONS:
+            raise ValueError(f"Unknown text operation: {operation}")
+        text = TEXT_OPERATIONS[operation](text)
+    return {'output': text}
+
+
+@register('dataClassifier')
+def data_classifier(inputs, data):
+    """Label each input line with the first class name it contains"""
+    value = inputs.get('data')
+    items = value if isinstance(value, list) else _as_text(value).splitlines()
+    classes = [c.strip() for c in (data.get('classes') or '').split(',') if c.strip()]
+    classified = []
+    for item in items:
+        text = _as_text(item)
+        label = next((c for c in classes if c.lower() in text.lower()), 'unclassified')
+        classified.append({'item': text, 'class': label})
+    return {'classes': classified}
+
+
+# The data-cleaning operators register themselves on import
+from . import cleaning  # noqa: E402,F401
@@ -0,0 +1,119 @@
+"""Keyset (cursor) pagination over MongoDB collections.
+
+A page is fetched with a range query on (sort field, _id) starting after the
+last document of the previous page, so every page costs the same no matter
+how deep it is, unlike skip/offset. The cursor handed to clients is an
+opaque token holding that position.
+"""
+import base64
+import json
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(sort_field, direction, value, document_id):
+    if isinstance(value, datetime):
+        value = {'$date': value.isoformat()}
+    raw = json.dumps({'s': sort_field, 'd': direction, 'v': value, 'id': str(document_id)})
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, sort_field, direction):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        value = data['v']
+        if isinstance(value, dict) and '$date' in value:
+            value = datetime.fromisoformat(value['$date'])
+        position = (value, ObjectId(data['id']))
+    except Exception:
+        raise PaginationError('Invalid cursor')
+    if data['s'] != sort_field or data['d'] != direction:
+        raise PaginationError('Cursor was issued for a different sort order')
+    return position
+
+
+def page_params(query_params, sort_fields, default_sort, default_direction):
+    """Read limit, sort, order and cursor from the query string.
+
+    `sort_fields` maps the public sort names to document fields. Without a
+    limit a page holds PAGINATION_DEFAULT_LIMIT documents, and no request
+    gets more than PAGINATION_MAX_LIMIT.
+    """
+    sort = query_params.get('sort', default_sort)
+    if sort not in sort_fields:
+        raise PaginationError(f"sort must be one of {', '.join(sorted(sort_fields))}")
+    order = query_params.get('order', default_direction)
+    if order not in ('asc', 'desc'):
+        raise PaginationError('order must be asc or desc')
+    field = sort_fields[sort]
+    cursor = query_params.get('cursor')
+    try:
+        limit = int(query_params.get('limit', settings.PAGINATION_DEFAULT_LIMIT))
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    limit = min(limit, settings.PAGINATION_MAX_LIMIT)
+    position = decode_cursor(cursor, field, order) if cursor else None
+    return field, order, limit, position
+
+
+def _value(document, field):
+    # Sort fields may be dotted paths into subdocuments, e.g. position.x
+    for part in field.split('.'):
+        document = document.get(part) if isinstance(document, dict) else None
+    return document
+
+
+def _page_query(query, sort_field, order, position):
+    if position is None:
+        return query
+    comparison = '$gt' if order == 'asc' else '$lt'
+    value, document_id = position
+    after = [{sort_field: value, '_id': {comparison: document_id}}]
+    # Null and missing values sort before all others, and a range on null
+    # matches nothing, so they need clauses of their own
+    if value is None:
+        if order == 'asc':
+            after.append({sort_field: {'$ne': None}})
+    else:
+        after.append({sort_field: {comparison: value}})
+        if order == 'desc':
+            after.append({sort_field: None})
+    return {'$and': [query, {'$or': after}]}
+
+
+def _page(documents, sort_field, order, limit):
+    if len(documents) <= limit:
+        return documents, None
+    documents = documents[:limit]
+    last = documents[-1]
+    return documents, encode_cursor(sort_field, order, _value(last, sort_field), last['_id'])
+
+
+def _find(collection, query, projection, sort_field, order, limit, position, unique):
+    direction = ASCENDING if order == 'asc' else DESCENDING
+    # A field unique within `query` orders the page by itself, so an index on it needs no _id
+    sort = [(sort_field, direction)] if unique else [(sort_field, direction), ('_id', direction)]
+    cursor = collection.find(_page_query(query, sort_field, order, position), projection).sort(sort)
+    # One extra document tells whether another page exists
+    return cursor.limit(limit + 1)
+
+
+def paginate(collection, query, projection, sort_field, order, limit, position=None, unique=False):
+    """Return (documents, next cursor or None) for one page"""
+    documents = list(_find(collection, query, projection, sort_field, order, limit, position, unique))
+    return _page(documents, sort_field, order, limit)
+
+
+async def apaginate(collection, query, projection, sort_field, order, limit, position=None, unique=False):
+    """paginate for an AsyncCollection"""
+    documents = await _find(collection, query, projection, sort_field, order, limit, position, unique).to_list()
+    return _page(documents, sort_field, order, limit)
@@ -0,0 +1,18 @@
+"""Project access rules expressed as MongoDB filters.
+
+Putting the rule in the query means a denied request matches nothing, so
+it never reads or transfers the board itself.
+"""
+
+# Everything but the board contents, for permission checks and listings
+METADATA_PROJECTION = {'nodes': 0, 'connections': 0}
+
+
+def read_access_filter(user_id):
+    """Owner, collaborator, or anyone for a public project"""
+    return {'$or': [{'user_id': user_id}, {'collaborators.id': user_id}, {'is_public': True}]}
+
+
+def write_access_filter(user_id):
+    """Owner or collaborator"""
+    return {'$or': [{'user_id': user_id}, {'collaborators.id': user_id}]}
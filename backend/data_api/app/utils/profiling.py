@@ -0,0 +1,105 @@
+"""Opt-in per-node profiling for pipeline runs ("profile": true).
+
+Workers measure each node's wall and CPU time and the peak memory traced
+by tracemalloc while it ran. The scheduler adds how long the node waited
+for a worker after its inputs were ready, and rows in and out. tracemalloc
+is only on while a profiled node runs, so runs without profiling pay
+nothing. Nodes running at the same time share the process heap, so their
+peaks include each other's allocations. Stream mode interleaves its nodes
+batch by batch and is measured as one run.
+
+`folded` turns a profiled run into the folded stack format flame graph
+tools read (flamegraph.pl, speedscope, inferno). Each node is stacked on
+the input that finished last, so the widest tower is the critical path.
+"""
+import threading
+import time
+import tracemalloc
+
+from .table import Table
+
+_lock = threading.Lock()
+# Profiled nodes running in this process; tracemalloc is on while there are any
+_running = 0
+
+
+def _start():
+    global _running
+    with _lock:
+        if _running == 0:
+            tracemalloc.start()
+        _running += 1
+        if _running == 1:
+            tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _stop():
+    global _running
+    with _lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _running -= 1
+        if _running == 0:
+            tracemalloc.stop()
+        return peak
+
+
+def run_profiled(func, *args):
+    """Call func(*args) and return (result, measurements); module level for process pools"""
+    base = _start()
+    started_at = time.time()
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        result = func(*args)
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+        peak = _stop()
+    return result, {
+        'started_at': started_at,
+        'wall_ms': round(wall * 1000, 3),
+        'cpu_ms': round(cpu * 1000, 3),
+        'peak_bytes': max(peak - base, 0),
+    }
+
+
+def rows(values):
+    """Rows in the tables (or items in the lists) among `values`, None if there are none"""
+    counts = []
+    for value in values:
+        if isinstance(value, Table):
+            counts.append(value.num_rows)
+        elif isinstance(value, list):
+            counts.append(len(value))
+        elif isinstance(value, dict) and 'num_rows' in value:
+            # A table inside a fused chain, of which only the preview was kept
+            counts.append(value['num_rows'])
+    return sum(counts) if counts else None
+
+
+def folded(plan, node_map, profiles):
+    """Folded stacks, one line per profiled node: pipeline;upstream;...;node microseconds"""
+    def frame(node_id):
+        return f"{node_map[node_id].get('type')}:{node_id}"
+
+    stacks = {}
+    lines = []
+    for node_id in plan.order:
+        profile = profiles.get(node_id)
+        if profile is None:
+            continue
+        chain = profile.get('fused_chain') or [node_id]
+        if node_id != chain[0]:
+            # A fused chain is one frame, written out with its last node
+            stacks[node_id] = stacks[chain[0]]
+            if node_id != chain[-1]:
+                continue
+        else:
+            inputs = [source for source in plan.upstream[node_id] if source in profiles]
+            parent = max(inputs, key=lambda source: profiles[source]['finished_ms'], default=None)
+            stacks[node_id] = (stacks[parent] if parent else 'pipeline') + ';' + '+'.join(map(frame, chain))
+            if node_id != chain[-1]:
+                continue
+        if profile.get('queue_ms'):
+            lines.append(f"{stacks[node_id]};[queued] {int(profile['queue_ms'] * 1000)}")
+        lines.append(f"{stacks[node_id]} {int(profile['wall_ms'] * 1000)}")
+    return '\n'.join(lines)
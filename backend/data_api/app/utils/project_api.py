@@ -0,0 +1,324 @@
+"""Request parsing and responses of the project and whiteboard views.
+
+views.py serves these endpoints with pymongo and async_views.py with
+AsyncMongoClient. Everything but the MongoDB calls lives here, so both
+answer a request the same way: a view reads its parameters with the
+functions below, does its I/O, and renders the Reply it gets back.
+A RequestError carries the 4xx answer to a malformed request.
+"""
+from datetime import datetime
+
+from django.conf import settings
+
+from .autosave import COALESCED, WRITTEN
+from .board_cache import board_cache, etag, matches
+from .board_ops import PatchError, RevisionConflict
+from .board_storage import filter_viewport
+from .pagination import page_params, decode_cursor, PaginationError
+
+PROJECT_SORTS = {'created_at': 'created_at', 'name': 'project_name'}
+# Only the listing fields, never the nodes/connections arrays
+PROJECT_LISTING_PROJECTION = {'project_name': 1, 'created_at': 1, 'is_public': 1, 'collaborators': 1}
+VIEWPORT_PROJECTION = {'storage': 1, 'revision': 1, 'nodes': 1, 'connections': 1}
+VERSION_LISTING_PROJECTION = {'version': 1, 'kind': 1, 'created_at': 1, 'op_count': 1, 'project_name': 1}
+
+
+class RequestError(Exception):
+    """A request answered with {'error': message} and `status`"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+    def reply(self):
+        return Reply({'error': str(self)}, self.status)
+
+
+class Reply:
+    """A JSON body (None for none), status and headers for a view to render"""
+
+    def __init__(self, body=None, status=200, headers=None):
+        self.body = body
+        self.status = status
+        self.headers = headers
+
+
+def failed(action, e, status=500):
+    return Reply({'error': f"{action}: {str(e)}"}, status)
+
+
+def json_object(data):
+    """A parsed request body, if it is a JSON object"""
+    if not isinstance(data, dict):
+        raise RequestError('Request body must be a JSON object')
+    return data
+
+
+def required_user(user_id):
+    if not user_id:
+        raise RequestError('User ID is required')
+    return user_id
+
+
+def _page_params(query_params, *args, **kwargs):
+    try:
+        return page_params(query_params, *args, **kwargs)
+    except PaginationError as e:
+        raise RequestError(str(e))
+
+
+def missing_or_forbidden(exists):
+    """The reply to a project query the access filter matched nothing for"""
+    if not exists:
+        return Reply({'error': 'Project not found'}, 404)
+    return Reply({'error': 'No permission to access this project'}, 403)
+
+
+# new-project
+
+def new_project(data):
+    """The document a new-project request inserts"""
+    user_id = data.get('user_id')
+    project_name = data.get('project_name')
+    if not user_id or not project_name:
+        raise RequestError('User ID and project name are required')
+    return {
+        'user_id': user_id,
+        'project_name': project_name,
+        'created_at': datetime.now(),
+        'nodes': [],
+        'connections': [],
+        'collaborators': data.get('collaborators'),
+        'is_public': data.get('is_public'),
+        'revision': 0
+    }
+
+
+def created(project_id):
+    return Reply({'project_id': project_id}, 201)
+
+
+# all-projects
+
+def project_list_params(query_params):
+    """(user id, sort field, order, limit, position) of an all-projects request"""
+    user_id = required_user(query_params.get('user_id'))
+    return (user_id, *_page_params(query_params, PROJECT_SORTS, 'created_at', 'desc'))
+
+
+def project_list(projects, next_cursor):
+    return Reply({'projects': [{
+        'id': project['_id'],
+        'name': project['project_name'],
+        'created_at': project['created_at'],
+        'is_public': project.get('is_public', False),
+        'collaborators': project.get('collaborators', [])
+    } for project in projects], 'next_cursor': next_cursor})
+
+
+# delete-project
+
+def required_project(project_id):
+    if not project_id:
+        raise RequestError('Project ID is required')
+    return project_id
+
+
+def deleted(deleted_count):
+    if deleted_count == 1:
+        return Reply(status=204)
+    return Reply({'error': 'Project not found'}, 404)
+
+
+# open-whiteboard
+
+def open_request(params, from_body):
+    """(user id, metadata only) from the query string, or from a POST body"""
+    user_id = required_user(params.get('user_id'))
+    if from_body:
+        return user_id, bool(params.get('metadata_only'))
+    return user_id, params.get('metadata_only') in ('1', 'true')
+
+
+def open_from_cache(project_id, user_id, metadata_only, if_none_match):
+    """The reply for a board this process knows the revision of, or None to read it.
+
+    A conditional request for a known revision costs no database read, and
+    hot public boards are served from memory.
+    """
+    known = board_cache.known(project_id, user_id)
+    if known is None:
+        return None
+    tag = etag(project_id, known['revision'], metadata_only)
+    if matches(if_none_match, tag):
+        return Reply(status=304, headers={'ETag': tag})
+    cached = None if metadata_only else board_cache.document(project_id, known['revision'])
+    if cached is not None:
+        return Reply({'project': cached, 'permissions': True}, headers={'ETag': tag})
+    return None
+
+
+def open_not_modified(project_id, project, metadata_only, if_none_match):
+    """Record the revision just read; the 304 reply if the client has it, else None"""
+    revision = project.get('revision', 0)
+    board_cache.remember(project_id, revision, project.get('user_id'), project.get('collaborators'),
+                         project.get('is_public', False))
+    tag = etag(project_id, revision, metadata_only)
+    if matches(if_none_match, tag):
+        return Reply(status=304, headers={'ETag': tag})
+    return None
+
+
+def opened(project_id, project, metadata_only, board):
+    """The open-whiteboard reply; `board` is (nodes, connections), None for metadata only"""
+    revision = project.get('revision', 0)
+    project_client_data = {
+        'id': project['_id'],
+        'name': project['project_name'],
+        'created_at': project['created_at'],
+        'is_public': project.get('is_public', False),
+        'collaborators': project.get('collaborators', []),
+        'revision': revision
+    }
+    if board is not None:
+        project_client_data['nodes'], project_client_data['connections'] = board
+        # Hot boards that anyone may open are served from memory until the next write
+        if project.get('is_public', False):
+            board_cache.store_document(project_id, revision, project_client_data)
+    return Reply({'project': project_client_data, 'permissions': True},
+                 headers={'ETag': etag(project_id, revision, metadata_only)})
+
+
+def embedded_board(project):
+    return project.get('nodes', []), project.get('connections', [])
+
+
+# upload-whiteboard
+
+def upload_request(data):
+    """(project id, user id, project_data in MongoDB format, buffered) of an upload"""
+    project = data.get('project')
+    user_id = data.get('user_id')
+    if not project or not user_id:
+        raise RequestError('Project and user ID are required')
+    project_data = {
+        'project_name': project['name'],
+        'is_public': project.get('is_public', False),
+        'collaborators': project.get('collaborators', []),
+        'nodes': project.get('nodes', []),
+        'connections': project.get('connections', []),
+        'user_id': user_id,
+        'updated_at': datetime.now()
+    }
+    # Rapid autosaves are coalesced and written once per window
+    buffered = settings.AUTOSAVE_WINDOW_SECONDS > 0 and not data.get('flush')
+    return project['id'], user_id, project_data, buffered
+
+
+def upload_missing():
+    return Reply({'error': 'Project not found'}, 404)
+
+
+def upload_buffered(saved):
+    """The reply to an autosave, given what WriteBehindBuffer.put did with it"""
+    if saved == WRITTEN:
+        return Reply({'message': 'Project saved successfully', 'coalesced': False})
+    return Reply({'message': 'Project save queued', 'coalesced': saved == COALESCED}, 202)
+
+
+def uploaded(project_id, user_id, project_data, revision):
+    board_cache.invalidate(project_id)
+    if revision is None:
+        return Reply({'error': 'Project not found or no changes made'}, 404)
+    board_cache.remember(project_id, revision, user_id, project_data['collaborators'], project_data['is_public'])
+    return Reply({'message': 'Project saved successfully', 'revision': revision})
+
+
+# patch-whiteboard
+
+def patch_request(data):
+    """(user id, base revision, ops) of a patch"""
+    user_id = data.get('user_id')
+    revision = data.get('revision')
+    if not user_id or not isinstance(revision, int):
+        raise RequestError('User ID and base revision are required')
+    return user_id, revision, data.get('ops')
+
+
+def patched(project_id, revision):
+    board_cache.bump(project_id, revision)
+    return Reply({'message': 'Project patched successfully', 'revision': revision})
+
+
+def patch_failed(project_id, e):
+    """The reply to a PatchError, RevisionConflict or LookupError from patch_board"""
+    if isinstance(e, PatchError):
+        return Reply({'error': str(e)}, 400)
+    if isinstance(e, RevisionConflict):
+        # The stored board moved on without this process seeing it
+        board_cache.invalidate(project_id)
+        return Reply({'error': str(e), 'revision': e.revision}, 409)
+    return Reply({'error': 'Project not found or no permission to edit it'}, 404)
+
+
+# whiteboard-viewport
+
+def viewport_request(query_params):
+    """(user id, (x0, y0, x1, y1), limit, position) of a viewport request"""
+    user_id = required_user(query_params.get('user_id'))
+    try:
+        box = tuple(float(query_params[key]) for key in ('x0', 'y0', 'x1', 'y1'))
+        limit = int(query_params.get('limit', settings.WHITEBOARD_VIEWPORT_DEFAULT_LIMIT))
+    except (KeyError, ValueError):
+        raise RequestError('x0, y0, x1 and y1 must be numbers and limit an integer')
+    if limit < 1:
+        raise RequestError('limit must be positive')
+    limit = min(limit, settings.WHITEBOARD_VIEWPORT_MAX_LIMIT)
+    cursor = query_params.get('cursor')
+    try:
+        position = decode_cursor(cursor, 'position.x', 'asc') if cursor else None
+    except PaginationError as e:
+        raise RequestError(str(e))
+    return user_id, box, limit, position
+
+
+def embedded_viewport(project, box):
+    # Embedded boards are small enough to answer in one page
+    return (*filter_viewport(project.get('nodes', []), project.get('connections', []), *box), None)
+
+
+def viewport(project, nodes, connections, next_cursor):
+    return Reply({'nodes': nodes, 'connections': connections, 'next_cursor': next_cursor,
+                  'revision': project.get('revision', 0)})
+
+
+# project-versions and project-version
+
+def version_list_params(query_params):
+    """(user id, sort field, order, limit, position) of a project-versions request"""
+    user_id = required_user(query_params.get('user_id'))
+    return (user_id, *_page_params(query_params, {'version': 'version'}, 'version', 'desc'))
+
+
+def version_list(versions, next_cursor):
+    return Reply({'versions': [{
+        'version': version['version'],
+        'kind': version['kind'],
+        'created_at': version['created_at'],
+        'op_count': version.get('op_count'),
+        'name': version.get('project_name'),
+    } for version in versions], 'next_cursor': next_cursor})
+
+
+def version(project_id, board):
+    """The project-version reply for history.reconstruct's result"""
+    if board is None:
+        return Reply({'error': 'Version not found'}, 404)
+    return Reply({'project': {
+        'id': project_id,
+        'name': board.get('project_name'),
+        'version': board['version'],
+        'created_at': board['created_at'],
+        'nodes': board['nodes'],
+        'connections': board['connections'],
+    }, 'replayed_deltas': board['replayed']})
@@ -0,0 +1,247 @@
+"""Node results kept on disk, shared by worker processes and across restarts.
+
+Results are stored under the same content hash the in-process cache uses
+(node type, `data` and the hashes of the results feeding it), salted with a
+hash of the operator source files so a deploy that changes an operator does
+not serve results computed by the old code. Each entry is one pickle file,
+written to a temporary name and renamed into place, so a reader sees a
+whole entry or none.
+
+Entries whose pickle would exceed RESULT_STORE_MAX_ENTRY_BYTES are not
+stored. The in-memory size undercounts object columns, so the pickle is
+measured as it is written, and abandoned once it passes the limit.
+
+The total size is capped at RESULT_STORE_MAX_BYTES. A usage file, updated
+under an exclusive file lock, tracks it across processes. When a write
+takes it over budget, the least recently used entries (by modification
+time, refreshed on every hit) are deleted until the store is back under
+RESULT_STORE_EVICT_TO of the budget.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .operators import OPERATORS
+from .table import sizeof
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: threads are still coordinated, processes are not
+    fcntl = None
+
+
+class EntryTooLarge(Exception):
+    pass
+
+
+class _BoundedFile:
+    """Writes through to `file`, raising EntryTooLarge past `limit` bytes"""
+
+    def __init__(self, file, limit):
+        self.file = file
+        self.limit = limit
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise EntryTooLarge()
+        return self.file.write(data)
+
+
+def code_version():
+    """Hash of the source of every module that registers operators"""
+    digest = hashlib.sha256()
+    paths = {sys.modules[func.__module__].__file__ for func in OPERATORS.values()}
+    paths.add(sys.modules[sizeof.__module__].__file__)
+    for path in sorted(paths):
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class ResultStore:
+    def __init__(self, directory, max_bytes, max_entry_bytes, evict_to=0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.evict_to = evict_to
+        self.salt = code_version()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'writes': 0, 'bytes_written': 0, 'skipped': 0,
+                         'evictions': 0, 'bytes_evicted': 0, 'errors': 0}
+
+    def _path(self, key):
+        name = hashlib.sha256(f"{self.salt}:{key}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name[:2], f"{name}.pkl")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                outputs = pickle.load(file)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        except Exception as e:
+            # A corrupt entry is a miss; the next write replaces it
+            logger.warning(f"Result store read of {path} failed: {str(e)}")
+            self._count('errors')
+            self._count('misses')
+            return None
+        try:
+            # Recently used entries are the last to be evicted
+            os.utime(path)
+        except OSError:
+            pass
+        self._count('hits')
+        return outputs
+
+    def put(self, key, outputs):
+        # sizeof is a lower bound, enough to turn away the obviously too large
+        if sizeof(outputs) > self.max_entry_bytes:
+            self._count('skipped')
+            return
+        path = self._path(key)
+        temporary = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(handle, 'wb') as file:
+                pickle.dump(outputs, _BoundedFile(file, self.max_entry_bytes), protocol=pickle.HIGHEST_PROTOCOL)
+                size = file.tell()
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(temporary, path)
+            temporary = None
+        except EntryTooLarge:
+            self._count('skipped')
+            return
+        except Exception as e:
+            logger.warning(f"Result store write of {path} failed: {str(e)}")
+            self._count('errors')
+            return
+        finally:
+            # A write that did not reach os.replace leaves nothing behind
+            if temporary is not None:
+                try:
+                    os.remove(temporary)
+                except OSError:
+                    pass
+        self._count('writes')
+        self._count('bytes_written', size)
+        with self._locked() as usage:
+            if not usage.get('scanned'):
+                usage['bytes'] += size - replaced
+            if usage['bytes'] > self.max_bytes:
+                usage['bytes'] = self._evict()
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive access to the usage file, across threads and processes"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(os.path.join(self.directory, 'usage'), 'a+') as file:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                text = file.read().strip()
+                # A missing usage file is rebuilt from the entries on disk
+                usage = {'bytes': int(text)} if text else {'bytes': self._scan_bytes(), 'scanned': True}
+                yield usage
+                file.seek(0)
+                file.truncate()
+                file.write(str(max(usage['bytes'], 0)))
+                file.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.pkl'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def _scan_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Delete least recently used entries down to the target; returns the bytes left"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.evict_to
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.counters['evictions'] += 1
+            self.counters['bytes_evicted'] += size
+        return total
+
+    def clear(self):
+        with self._locked() as usage:
+            for path, _, _ in list(self._entries()):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            usage['bytes'] = 0
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters['hits'] + counters['misses']
+        try:
+            with open(os.path.join(self.directory, 'usage')) as file:
+                stored = int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            stored = None
+        return {**counters, 'hit_rate': round(counters['hits'] / lookups, 4) if lookups else 0.0,
+                'bytes_stored': stored, 'max_bytes': self.max_bytes}
+
+
+_store_lock = threading.Lock()
+_store = None
+_store_settings = None
+
+
+def get_result_store():
+    """Return the store for the current settings, or None when it is disabled"""
+    global _store, _store_settings
+    current = (settings.RESULT_STORE_ENABLED, settings.RESULT_STORE_DIR, settings.RESULT_STORE_MAX_BYTES,
+               settings.RESULT_STORE_MAX_ENTRY_BYTES, settings.RESULT_STORE_EVICT_TO)
+    with _store_lock:
+        # Rebuilt when the settings change, so override_settings points it elsewhere
+        if current != _store_settings:
+            enabled, directory, max_bytes, max_entry_bytes, evict_to = current
+            _store = ResultStore(directory, max_bytes=max_bytes, max_entry_bytes=max_entry_bytes,
+                                 evict_to=evict_to) if enabled else None
+            _store_settings = current
+        return _store
@@ -0,0 +1,678 @@
+"""Streaming execution for pipelines whose data does not fit in memory.
+
+In stream mode (`"mode": "stream"` in the request, or PIPELINE_MODE) a
+table never exists whole. Sources cut their input into Tables of at most
+STREAM_BATCH_ROWS rows, and every data-cleaning node is a generator pulling
+batches from its inputs. A node only produces a batch when the node
+downstream asks for one, so nothing runs ahead and the rows in flight are a
+few batches per node, whatever the input size.
+
+Row-local nodes (filterRows, typeCast, textTransform, fillMissing with a
+value or ffill) transform batch by batch. Nodes that need to see everything
+spill to disk under STREAM_SPILL_DIR. Sorting is an external merge sort. dedupe,
+groupAggregate and join hash-partition their rows into spill files and
+process one partition at a time, re-partitioning any partition bigger than
+STREAM_MEMORY_LIMIT_BYTES. normalize and fillMissing mean/mode make two
+passes over a spill. Only a single key value with more rows than the limit
+can exceed it.
+
+A node output feeding several consumers is not buffered for the slowest
+one. Each consumer re-runs the upstream generators instead, trading
+compute for bounded memory. Node types without a streaming version (text
+nodes) get their inputs materialized, up to the same limit.
+"""
+import csv
+import io
+import os
+import pickle
+import tempfile
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import chain, islice
+
+import numpy as np
+from django.conf import settings
+
+from .cleaning import _names, sort_order
+from .executor import node_data
+from .operators import get_operator
+from .profiling import run_profiled
+from .table import Table, to_table, is_missing, infer_column, jsonable, concat, empty_like, slices
+
+STREAM_OPERATORS = {}
+
+# Re-partitioning a still too large partition uses the next bits of the hash
+MAX_PARTITION_DEPTH = 3
+
+
+def register_stream(node_type):
+    def decorator(func):
+        STREAM_OPERATORS[node_type] = func
+        return func
+    return decorator
+
+
+class StreamCancelled(Exception):
+    pass
+
+
+class StreamNodeError(Exception):
+    def __init__(self, node_id, error):
+        self.node_id = node_id
+        super().__init__(str(error))
+
+
+def _text_column(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return np.where(np.equal(array, ''), None, array)
+
+
+def csv_batches(text, rows):
+    """CSV text as Tables of `rows` rows.
+
+    A column is numeric until a batch holds text in it, and text from then
+    on, numbers included, so a column that is empty or numeric at the top
+    of a file widens instead of failing. Batches already yielded keep their
+    numbers; concat makes a mix of them an object column.
+    """
+    reader = csv.reader(io.StringIO(text.strip()))
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [name.strip() for name in header]
+    width = len(header)
+    text_columns = set()
+    while True:
+        chunk = [row[:width] + [''] * (width - len(row)) for row in islice(reader, rows) if row]
+        if not chunk:
+            return
+        columns = {}
+        for name, values in zip(header, zip(*chunk)):
+            columns[name] = _text_column(values) if name in text_columns else infer_column(values)
+            if columns[name].dtype == object:
+                text_columns.add(name)
+        yield Table(columns)
+
+
+def batches(value, rows):
+    """Cut any value a node can take as a table into batches"""
+    if isinstance(value, str):
+        return csv_batches(value, rows)
+    return slices(to_table(value), rows)
+
+
+class SpillFile:
+    """Tables appended to a temporary file and read back in the same order"""
+
+    def __init__(self, directory):
+        handle, self.path = tempfile.mkstemp(dir=directory, suffix='.spill')
+        self.file = os.fdopen(handle, 'wb')
+        self.rows = 0
+        self.bytes = 0
+
+    def write(self, table):
+        pickle.dump(table, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.rows += table.num_rows
+        self.bytes = self.file.tell()
+
+    def read(self):
+        if not self.file.closed:
+            self.file.close()
+        with open(self.path, 'rb') as file:
+            while True:
+                try:
+                    yield pickle.load(file)
+                except EOFError:
+                    return
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+@contextmanager
+def spill_directory():
+    directory = settings.STREAM_SPILL_DIR or None
+    with tempfile.TemporaryDirectory(prefix='pipeline-spill-', dir=directory) as path:
+        yield path
+
+
+def _key_hash(table, keys):
+    """64-bit hash of each row's key columns, equal for equal keys in any batch"""
+    hashed = np.zeros(table.num_rows, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for key in keys:
+            values = table.column(key)
+            missing = is_missing(values)
+            if values.dtype.kind in 'fiub':
+                # 1 and 1.0 must agree, and -0.0 with 0.0
+                bits = (np.where(missing, 0.0, values.astype(np.float64)) + 0.0).view(np.uint64)
+            else:
+                bits = np.fromiter(map(hash, np.where(missing, None, values)), dtype=np.int64,
+                                   count=len(values)).view(np.uint64)
+            hashed = (hashed ^ bits ^ missing.astype(np.uint64)) * np.uint64(0x9E3779B97F4A7C15)
+            hashed ^= hashed >> np.uint64(29)
+    return hashed
+
+
+def partition(stream, keys, directory, depth=0):
+    """Spill a stream into STREAM_SPILL_PARTITIONS files by key hash.
+
+    Returns the files and an empty table with the stream's columns.
+    """
+    count = settings.STREAM_SPILL_PARTITIONS
+    files = [SpillFile(directory) for _ in range(count)]
+    schema = None
+    for table in stream:
+        schema = schema or empty_like(table)
+        if not table.num_rows:
+            continue
+        parts = (_key_hash(table, keys) >> np.uint64(16 * depth)) % np.uint64(count)
+        order = np.argsort(parts, kind='stable')
+        bounds = np.searchsorted(parts[order], np.arange(count + 1))
+        for index in range(count):
+            if bounds[index + 1] > bounds[index]:
+                files[index].write(table.take(order[bounds[index]:bounds[index + 1]]))
+    return files, schema
+
+
+def bounded_partitions(stream, keys, directory, depth=0):
+    """Yield every row of `stream` once, as whole-key partitions that fit in memory"""
+    files, _ = partition(stream, keys, directory, depth)
+    for spill in files:
+        if spill.bytes > settings.STREAM_MEMORY_LIMIT_BYTES and depth < MAX_PARTITION_DEPTH:
+            yield from bounded_partitions(spill.read(), keys, directory, depth + 1)
+        elif spill.rows:
+            yield concat(spill.read())
+        spill.close()
+
+
+def _run(operator, table, data):
+    return get_operator(operator)({'data': table}, data)['table']
+
+
+@register_stream('filterRows')
+@register_stream('typeCast')
+@register_stream('textTransform')
+def row_local(node_type, inputs, data):
+    for table in inputs['data']:
+        yield _run(node_type, table, data)
+
+
+def _spill_all(stream, directory, observe):
+    """Write a stream to one spill file, showing each batch to `observe` first"""
+    spill = SpillFile(directory)
+    for table in stream:
+        observe(table)
+        spill.write(table)
+    return spill
+
+
+@register_stream('fillMissing')
+def fill_missing(node_type, inputs, data):
+    strategy = (data.get('strategy') or 'value').strip()
+    if strategy == 'value':
+        yield from row_local(node_type, inputs, data)
+    elif strategy == 'ffill':
+        # Each batch is filled with the previous batch's last row in front of it
+        carry = None
+        for table in inputs['data']:
+            filled = _run(node_type, concat([carry, table]) if carry else table, data)
+            if carry:
+                filled = filled.take(slice(1, None))
+            if filled.num_rows:
+                carry = filled.take(slice(-1, None))
+                yield filled
+    elif strategy in ('mean', 'mode'):
+        # As in batch mode only columns with a missing value are filled, so only
+        # those have to be numeric for a mean, and the rest keep their dtype
+        missing_seen, numeric = {}, {}
+        totals = defaultdict(lambda: [0.0, 0])
+        counts = defaultdict(lambda: defaultdict(int))
+        originals = defaultdict(dict)
+
+        def observe(table):
+            listed = _names(data.get('columns'))
+            for name in listed or table.names:
+                values = table.column(name)
+                missing = is_missing(values)
+                missing_seen[name] = missing_seen.get(name, False) or bool(missing.any())
+                numeric[name] = numeric.get(name, True) and values.dtype.kind in 'fiub'
+                present = values[~missing]
+                if strategy == 'mean':
+                    if numeric[name]:
+                        totals[name][0] += float(present.astype(np.float64).sum())
+                        totals[name][1] += len(present)
+                elif len(present):
+                    keys = present.astype(str) if values.dtype == object else present
+                    uniques, first, frequencies = np.unique(keys, return_index=True, return_counts=True)
+                    for key, index, frequency in zip(uniques.tolist(), first.tolist(), frequencies.tolist()):
+                        counts[name][key] += frequency
+                        originals[name].setdefault(key, present[index])
+
+        with spill_directory() as directory:
+            spill = _spill_all(inputs['data'], directory, observe)
+            filled = [name for name, seen in missing_seen.items() if seen]
+            fills = {}
+            for name in filled:
+                if strategy == 'mean':
+                    if not numeric[name]:
+                        raise ValueError(f"Column {name} is not numeric")
+                    if totals[name][1]:
+                        fills[name] = totals[name][0] / totals[name][1]
+                elif counts[name]:
+                    frequencies, values = counts[name], originals[name]
+                    if not numeric[name]:
+                        # Numbers from batches before the column turned to text compare as text
+                        frequencies, values = defaultdict(int), {}
+                        for key, frequency in counts[name].items():
+                            frequencies[str(key)] += frequency
+                            values.setdefault(str(key), originals[name][key])
+                    # Ties go to the smallest value, as in batch mode
+                    most = max(frequencies.values())
+                    fills[name] = values[min(key for key, frequency in frequencies.items() if frequency == most)]
+            for table in spill.read():
+                columns = {}
+                for name, fill in fills.items():
+                    values = table.column(name)
+                    missing = is_missing(values)
+                    if numeric[name]:
+                        columns[name] = np.where(missing, fill, values.astype(np.float64))
+                    else:
+                        columns[name] = values.astype(object)
+                        columns[name][missing] = fill
+                yield table.with_columns(**columns)
+    elif strategy == 'median':
+        raise ValueError('fillMissing median needs the whole column in memory; use mean or mode in stream mode')
+    else:
+        raise ValueError(f"Unknown fill strategy: {strategy}")
+
+
+@register_stream('normalize')
+def normalize(node_type, inputs, data):
+    """Two passes: running min/max/mean/variance over a spill, then scale it"""
+    method = (data.get('method') or 'minmax').strip()
+    if method not in ('minmax', 'zscore'):
+        raise ValueError(f"Unknown normalization method: {method}")
+    # column -> [count, mean, M2, min, max], merged batch by batch (Chan et al.)
+    stats = {}
+
+    def observe(table):
+        names = _names(data.get('columns')) or [name for name in table.names
+                                                if table.columns[name].dtype.kind in 'fiu']
+        for name in names:
+            values = table.column(name)
+            if values.dtype.kind not in 'fiub':
+                raise ValueError(f"Column {name} is not numeric")
+            values = values.astype(np.float64)
+            values = values[~np.isnan(values)]
+            if not len(values):
+                stats.setdefault(name, [0, 0.0, 0.0, np.inf, -np.inf])
+                continue
+            count, mean, m2, low, high = stats.get(name, [0, 0.0, 0.0, np.inf, -np.inf])
+            batch_count, batch_mean = len(values), float(values.mean())
+            batch_m2 = float(((values - batch_mean) ** 2).sum())
+            total = count + batch_count
+            delta = batch_mean - mean
+            stats[name] = [total, mean + delta * batch_count / total,
+                           m2 + batch_m2 + delta ** 2 * count * batch_count / total,
+                           min(low, float(values.min())), max(high, float(values.max()))]
+
+    with spill_directory() as directory:
+        spill = _spill_all(inputs['data'], directory, observe)
+        for table in spill.read():
+            columns = {}
+            for name, (count, mean, m2, low, high) in stats.items():
+                if not count:
+                    continue
+                values = table.column(name).astype(np.float64)
+                if method == 'minmax':
+                    span = high - low
+                    columns[name] = (values - low) / span if span else np.where(np.isnan(values), np.nan, 0.0)
+                else:
+                    std = (m2 / count) ** 0.5
+                    columns[name] = (values - mean) / std if std else np.where(np.isnan(values), np.nan, 0.0)
+            yield table.with_columns(**columns)
+
+
+@register_stream('dedupe')
+def dedupe(node_type, inputs, data):
+    """Partitions hold every copy of a key, so each is deduplicated on its own.
+
+    Output comes partition by partition, so rows are not in input order.
+    """
+    with spill_directory() as directory:
+        stream = inputs['data']
+        first = next(stream, None)
+        if first is None:
+            return
+        keys = _names(data.get('columns')) or first.names
+        for table in bounded_partitions(chain([first], stream), keys, directory):
+            yield from slices(_run(node_type, table, data), settings.STREAM_BATCH_ROWS)
+
+
+@register_stream('groupAggregate')
+def group_aggregate(node_type, inputs, data):
+    keys = _names(data.get('by'))
+    if not keys:
+        # One group: aggregate the batches' partial results instead
+        yield from _global_aggregate(inputs['data'], data)
+        return
+    with spill_directory() as directory:
+        for table in bounded_partitions(inputs['data'], keys, directory):
+            yield _run(node_type, table, data)
+
+
+def _global_aggregate(stream, data):
+    specs = [[part.strip() for part in spec.split(':')] for spec in _names(data.get('aggregations')) or ['*:count']]
+    # (column, function) -> running value; means keep (sum, count)
+    state = {}
+    for table in stream:
+        for spec in specs:
+            if len(spec) != 2:
+                raise ValueError(f"Aggregation must look like column:function, got {':'.join(spec)}")
+            name, function = spec
+            if name == '*':
+                state[('*', 'count')] = state.get(('*', 'count'), 0) + table.num_rows
+                continue
+            values = table.column(name)
+            present = ~is_missing(values)
+            if function == 'count':
+                state[(name, function)] = state.get((name, function), 0) + int(present.sum())
+                continue
+            if values.dtype.kind not in 'fiub':
+                raise ValueError(f"Column {name} is not numeric")
+            numbers = values[present].astype(np.float64)
+            if function in ('sum', 'mean'):
+                total, seen = state.get((name, function), (0.0, 0))
+                state[(name, function)] = (total + float(numbers.sum()), seen + len(numbers))
+            elif function in ('min', 'max') and len(numbers):
+                reduce = min if function == 'min' else max
+                current = state.get((name, function))
+                value = float(numbers.min() if function == 'min' else numbers.max())
+                state[(name, function)] = value if current is None else reduce(current, value)
+            elif function not in ('min', 'max'):
+                raise ValueError(f"Unknown aggregation: {function}")
+    columns = {}
+    for name, function in (tuple(spec) for spec in specs):
+        value = state.get((name, function))
+        if function == 'sum':
+            value = value[0] if value else 0.0
+        elif function == 'mean':
+            value = value[0] / value[1] if value and value[1] else np.nan
+        elif value is None:
+            value = 0 if function == 'count' else np.nan
+        columns['count' if name == '*' else f"{name}_{function}"] = np.array([value])
+    yield Table(columns)
+
+
+@register_stream('join')
+def join(node_type, inputs, data):
+    """Grace hash join: both sides are partitioned alike and joined partition by partition"""
+    keys = _names(data.get('on'))
+    if not keys:
+        raise ValueError('Join needs at least one column in on')
+    with spill_directory() as directory:
+        yield from _grace_join(inputs['left'], inputs['right'], keys, data, directory, 0)
+
+
+def _grace_join(left, right, keys, data, directory, depth):
+    how = (data.get('how') or 'inner').strip()
+    left_files, _ = partition(left, keys, directory, depth)
+    right_files, right_schema = partition(right, keys, directory, depth)
+    operator = get_operator('join')
+    for left_spill, right_spill in zip(left_files, right_files):
+        if left_spill.rows and right_spill.bytes > settings.STREAM_MEMORY_LIMIT_BYTES \
+                and depth < MAX_PARTITION_DEPTH:
+            yield from _grace_join(left_spill.read(), right_spill.read(), keys, data, directory, depth + 1)
+        elif left_spill.rows and (right_spill.rows or how == 'left'):
+            built = concat(right_spill.read()) if right_spill.rows else right_schema
+            if built is None:
+                raise ValueError('The right side of the join has no columns')
+            for table in left_spill.read():
+                yield operator({'left': table, 'right': built}, data)['table']
+        left_spill.close()
+        right_spill.close()
+
+
+@register_stream('sortRows')
+def sort_rows(node_type, inputs, data):
+    """External merge sort: sorted runs of up to half the memory limit, merged a block at a time"""
+    name = (data.get('column') or '').strip()
+    descending = (data.get('order') or 'asc').strip() == 'desc'
+    rows = settings.STREAM_BATCH_ROWS
+    with spill_directory() as directory:
+        runs, missing = [], SpillFile(directory)
+        buffered, size = [], 0
+
+        def flush():
+            table = concat(buffered)
+            values = table.column(name)
+            absent = is_missing(values)
+            if absent.any():
+                missing.write(table.take(absent))
+            table = table.take(~absent)
+            run = SpillFile(directory)
+            for part in slices(table.take(sort_order(table.column(name), descending)), rows):
+                run.write(part)
+            runs.append(run)
+
+        for table in inputs['data']:
+            buffered.append(table)
+            size += table.nbytes
+            if size >= settings.STREAM_MEMORY_LIMIT_BYTES // 2:
+                flush()
+                buffered, size = [], 0
+        if buffered:
+            flush()
+
+        # Merge fan-in is bounded too: too many runs are merged into fewer first
+        while len(runs) > settings.STREAM_MERGE_FANIN:
+            merged = []
+            for start in range(0, len(runs), settings.STREAM_MERGE_FANIN):
+                group = runs[start:start + settings.STREAM_MERGE_FANIN]
+                run = SpillFile(directory)
+                for part in _merge(group, name, descending, rows):
+                    run.write(part)
+                for old in group:
+                    old.close()
+                merged.append(run)
+            runs = merged
+
+        yield from _merge(runs, name, descending, rows)
+        yield from missing.read()
+
+
+def _merge(runs, name, descending, rows):
+    """Merge sorted runs: everything up to the smallest block end is safe to emit"""
+    readers = [run.read() for run in runs]
+    blocks = []
+    for reader in readers:
+        block = next(reader, None)
+        if block is not None and block.num_rows:
+            blocks.append([block, reader])
+    while blocks:
+        ends = [block.column(name)[-1] for block, _ in blocks]
+        bound = max(ends) if descending else min(ends)
+        ready = []
+        for entry in blocks:
+            block, reader = entry
+            values = block.column(name)
+            cut = int(np.count_nonzero(values >= bound if descending else values <= bound))
+            ready.append(block.take(slice(0, cut)))
+            entry[0] = block.take(slice(cut, None))
+            while entry[0].num_rows == 0:
+                following = next(reader, None)
+                if following is None:
+                    break
+                entry[0] = following
+        blocks = [entry for entry in blocks if entry[0].num_rows]
+        table = concat(ready)
+        yield from slices(table.take(sort_order(table.column(name), descending)), rows)
+
+
+def _materialize(stream, node_id):
+    tables, size = [], 0
+    for table in stream:
+        size += table.nbytes
+        if size > settings.STREAM_MEMORY_LIMIT_BYTES:
+            raise ValueError(f"Node {node_id} has no streaming version and its input exceeds "
+                             f"STREAM_MEMORY_LIMIT_BYTES")
+        tables.append(table)
+    return concat(tables)
+
+
+def execute_stream(plan, nodes, cancel_event=None, on_event=None, profile=False):
+    """Stream-mode counterpart of executor.execute_plan, with the same result shape.
+
+    With `profile` the run is measured as a whole: its nodes take turns
+    batch by batch, so there is no per-node profile to give.
+    """
+    if not profile:
+        return _execute_stream(plan, nodes, cancel_event, on_event)
+    execution, measurements = run_profiled(_execute_stream, plan, nodes, cancel_event, on_event)
+    execution['profile'] = {
+        'total_ms': measurements['wall_ms'],
+        'cpu_ms': measurements['cpu_ms'],
+        'peak_bytes': measurements['peak_bytes'],
+        'per_node': False,
+        'folded': f"pipeline;[stream] {int(measurements['wall_ms'] * 1000)}",
+    }
+    return execution
+
+
+def _execute_stream(plan, nodes, cancel_event, on_event):
+    node_map = {node['id']: node for node in nodes}
+    rows = settings.STREAM_BATCH_ROWS
+    preview_rows = settings.PIPELINE_TABLE_PREVIEW_ROWS
+    # node id -> {port name: callable returning a fresh batch iterator}
+    factories = {}
+    # Outputs of the nodes that ran whole, by node id and port name
+    values = {}
+    # node id -> counters and preview of the first time the node streamed
+    stats = {}
+    results = {}
+
+    def track(node_id, stream):
+        first_run = node_id not in stats
+        if first_run:
+            stats[node_id] = {'rows': 0, 'batches': 0, 'preview': [], 'done': False}
+            if on_event is not None:
+                on_event({'event': 'node_started', 'node_id': node_id, 'type': node_map[node_id].get('type')})
+        entry = stats[node_id]
+        try:
+            for table in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise StreamCancelled()
+                if first_run:
+                    entry['rows'] += table.num_rows
+                    entry['batches'] += 1
+                    if sum(part.num_rows for part in entry['preview']) < preview_rows:
+                        entry['preview'].append(table.take(slice(0, preview_rows)))
+                yield table
+        except (StreamCancelled, StreamNodeError):
+            raise
+        except Exception as e:
+            raise StreamNodeError(node_id, e) from e
+        entry['done'] = True
+
+    def stream_factory(node_id, inputs):
+        node_type = node_map[node_id].get('type')
+        data = node_data(node_map[node_id])
+        return lambda: track(node_id, STREAM_OPERATORS[node_type](
+            node_type, {port: iter(factory()) for port, factory in inputs.items()}, data
+        ))
+
+    def stream_inputs(node_id):
+        by_port = defaultdict(list)
+        for wire in plan.wiring[node_id]:
+            by_port[wire.target_port].append(factories[wire.source_node][wire.source_port])
+        # Several connections into one port are read one after another
+        return {port: (lambda items=items: chain.from_iterable(factory() for factory in items))
+                for port, items in by_port.items()}
+
+    def whole_inputs(node_id):
+        by_port = defaultdict(list)
+        for wire in plan.wiring[node_id]:
+            if wire.source_node in values:
+                by_port[wire.target_port].append(values[wire.source_node].get(wire.source_port))
+            else:
+                by_port[wire.target_port].append(
+                    _materialize(factories[wire.source_node][wire.source_port](), node_id))
+        return {port: items[0] if len(items) == 1 else items for port, items in by_port.items()}
+
+    def fail(node_id, error):
+        results[node_id] = {'status': 'error', 'error': error}
+        pending = list(plan.downstream[node_id])
+        while pending:
+            child = pending.pop()
+            if child not in results:
+                results[child] = {'status': 'skipped', 'error': f"Skipped: upstream node {node_id} did not succeed"}
+                pending.extend(plan.downstream[child])
+
+    cancelled = False
+    for node_id in plan.order:
+        if node_id in results:
+            continue
+        node = node_map[node_id]
+        try:
+            if cancel_event is not None and cancel_event.is_set():
+                raise StreamCancelled()
+            if node.get('type') in STREAM_OPERATORS:
+                factory = stream_factory(node_id, stream_inputs(node_id))
+                factories[node_id] = {name: factory for name in plan.output_ports[node_id]}
+                if not plan.downstream[node_id]:
+                    # A sink: pulling its batches is what runs the pipeline behind it
+                    for _ in factory():
+                        pass
+            else:
+                if on_event is not None:
+                    on_event({'event': 'node_started', 'node_id': node_id, 'type': node.get('type')})
+                outputs = get_operator(node.get('type'))(whole_inputs(node_id), node_data(node))
+                values[node_id] = outputs
+                factories[node_id] = {name: (lambda value=value: batches(value, rows))
+                                      for name, value in outputs.items()}
+                results[node_id] = {'status': 'success', 'error': None, 'outputs': outputs}
+        except StreamCancelled:
+            cancelled = True
+            break
+        except StreamNodeError as e:
+            fail(e.node_id, str(e))
+        except Exception as e:
+            fail(node_id, str(e))
+
+    final = {}
+    for node_id in plan.order:
+        names = plan.output_ports[node_id]
+        result = results.get(node_id)
+        if result is None and stats.get(node_id, {}).get('done'):
+            entry = stats[node_id]
+            summary = {**jsonable(concat(entry['preview']).take(slice(0, preview_rows)), preview_rows),
+                       'num_rows': entry['rows'], 'batches': entry['batches']}
+            result = {'status': 'success', 'error': None, 'outputs': {port: summary for port in names.values()}}
+        elif result is not None and 'outputs' in result:
+            result = {**result, 'outputs': {names.get(name, name): jsonable(value, preview_rows)
+                                            for name, value in result['outputs'].items()}}
+        elif result is None:
+            # Never finished: the run was cancelled or stopped by a failure downstream
+            result = {'status': 'cancelled' if cancelled else 'skipped', 'error': None}
+        final[node_id] = {'type': node_map[node_id].get('type'), 'outputs': {}, 'key': None, 'cached': False,
+                          **result}
+        if on_event is not None and final[node_id]['status'] != 'cancelled':
+            on_event({'event': 'node_finished', 'node_id': node_id, 'status': result['status'],
+                      'error': result['error'], 'cached': False})
+            if result['status'] == 'success':
+                on_event({'event': 'partial_output', 'node_id': node_id, 'outputs': final[node_id]['outputs']})
+
+    return {
+        **plan.describe(),
+        # Row-local nodes already share each batch here, there is nothing to fuse
+        'fused': [],
+        'mode': 'stream',
+        'cancelled': cancelled,
+        'results': final,
+        'cache': {'reused': [], 'recomputed': list(plan.order), 'hit_rate': 0.0, 'from_disk': []},
+    }
@@ -0,0 +1,172 @@
+"""Columnar tables passed between data-cleaning nodes.
+
+A Table is an ordered mapping of column name to a 1-D NumPy array, all of
+the same length. Numeric columns are float64 or int64 with NaN marking a
+missing float; everything else is an object array with None for missing.
+Operators work on whole columns at a time, never row by row.
+"""
+import csv
+import io
+import sys
+
+import numpy as np
+
+
+class Table:
+    def __init__(self, columns):
+        self.columns = dict(columns)
+        lengths = {len(values) for values in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+        self.num_rows = lengths.pop() if lengths else 0
+
+    @property
+    def names(self):
+        return list(self.columns)
+
+    @property
+    def nbytes(self):
+        # Object columns count their pointers only, a lower bound
+        return sum(values.nbytes for values in self.columns.values())
+
+    def column(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise ValueError(f"Unknown column: {name}")
+
+    def take(self, indices):
+        """Rows by index array or boolean mask"""
+        return Table({name: values[indices] for name, values in self.columns.items()})
+
+    def with_columns(self, **columns):
+        return Table({**self.columns, **columns})
+
+    def to_json(self, limit=None):
+        """Summary and leading rows, for API responses and events"""
+        rows = self.num_rows if limit is None else min(limit, self.num_rows)
+        columns = [[None if _is_missing_scalar(v) else v for v in values[:rows].tolist()]
+                   for values in self.columns.values()]
+        return {
+            'columns': self.names,
+            'dtypes': {name: str(values.dtype) for name, values in self.columns.items()},
+            'num_rows': self.num_rows,
+            'rows': [dict(zip(self.names, row)) for row in zip(*columns)],
+        }
+
+    def __repr__(self):
+        return f"Table({self.num_rows} rows: {', '.join(self.names)})"
+
+
+def _is_missing_scalar(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def infer_column(values):
+    """Build the best-typed array for a list of raw values ('' and None are missing)"""
+    values = list(values)
+    # Assigning into an empty object array keeps nested values as elements
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    missing = np.equal(array, None) | np.equal(array, '')
+    try:
+        floats = np.where(missing, 'nan', array).astype(np.float64)
+    except (TypeError, ValueError):
+        return np.where(missing, None, array)
+    if not missing.any() and np.array_equal(floats, np.floor(floats)) and np.all(np.abs(floats) < 2 ** 53):
+        return floats.astype(np.int64)
+    return floats
+
+
+def is_missing(values):
+    if values.dtype.kind == 'f':
+        return np.isnan(values)
+    if values.dtype == object:
+        # Elementwise in C; NaN is the only value not equal to itself
+        return np.equal(values, None) | np.not_equal(values, values)
+    return np.zeros(len(values), dtype=bool)
+
+
+def from_csv(text):
+    reader = csv.reader(io.StringIO(text.strip()))
+    header = next(reader, None)
+    if header is None:
+        return Table({})
+    header = [name.strip() for name in header]
+    rows = [row for row in reader if row]
+    width = len(header)
+    # Short rows are padded, long rows truncated
+    rows = [row[:width] + [''] * (width - len(row)) for row in rows]
+    columns = zip(*rows) if rows else [()] * width
+    return Table({name: infer_column(values) for name, values in zip(header, columns)})
+
+
+def to_table(value):
+    """Accept a Table, CSV text, a dict of columns or a list of row dicts"""
+    if isinstance(value, Table):
+        return value
+    if isinstance(value, str):
+        return from_csv(value)
+    if isinstance(value, dict):
+        if value.keys() >= {'columns', 'rows'} and isinstance(value['rows'], list):
+            value = value['rows']
+        else:
+            return Table({name: values if isinstance(values, np.ndarray) else infer_column(values)
+                          for name, values in value.items()})
+    if isinstance(value, list):
+        names = list(dict.fromkeys(name for row in value if isinstance(row, dict) for name in row))
+        return Table({name: infer_column([row.get(name) for row in value]) for name in names})
+    raise ValueError(f"Expected a table, got {type(value).__name__}")
+
+
+def factorize(values):
+    """Integer codes such that equal values (and all missing values) share a code"""
+    missing = is_missing(values)
+    if values.dtype == object:
+        values = np.where(missing, '', values).astype(str)
+    elif values.dtype.kind == 'f':
+        values = np.where(missing, 0.0, values)
+    _, codes = np.unique(values, return_inverse=True)
+    # Missing gets its own code, separate from '' or 0
+    return np.where(missing, -1, codes).astype(np.int64) + 1
+
+
+def factorize_rows(columns):
+    """One code per distinct combination of values across several columns"""
+    if not columns:
+        raise ValueError('At least one key column is required')
+    combined = np.zeros(len(columns[0]), dtype=np.int64)
+    for values in columns:
+        codes = factorize(values)
+        # Re-densify after each step so the mixed radix never overflows
+        combined = np.unique(combined * (int(codes.max(initial=0)) + 1) + codes, return_inverse=True)[1]
+    return combined.astype(np.int64)
+
+
+def concat(tables):
+    tables = [table for table in tables if table.names]
+    if not tables:
+        return Table({})
+    names = tables[0].names
+    return Table({name: np.concatenate([table.column(name) for table in tables]) for name in names})
+
+
+def empty_like(table):
+    return Table({name: values[:0] for name, values in table.columns.items()})
+
+
+def slices(table, rows):
+    for start in range(0, table.num_rows, rows):
+        yield table.take(slice(start, start + rows))
+
+
+def sizeof(outputs):
+    """Approximate size of a node's outputs, for the result cache byte budget"""
+    return sum(value.nbytes if isinstance(value, Table) else sys.getsizeof(value) for value in outputs.values())
+
+
+def jsonable(value, limit):
+    """Tables in node outputs become a summary plus the first `limit` rows"""
+    if isinstance(value, Table):
+        return value.to_json(limit)
+    return value
@@ -1,19 +1,51 @@
-def process_pipeline(data):
-    """Process the pipeline data and return counts"""
+from django.conf import settings
+
+from .compiler import PipelineValidationError, compile_pipeline
+from .executor import execute_plan
+from .streaming import execute_stream
+
+MODES = ('batch', 'stream')
+
+
+def pipeline_mode(data):
+    """The execution mode a request asks for; raises PipelineValidationError for an unknown one"""
+    mode = data.get('mode') or settings.PIPELINE_MODE
+    if mode not in MODES:
+        raise PipelineValidationError([{'code': 'invalid_mode',
+                                        'message': f"mode must be one of {', '.join(MODES)}, got {mode!r}"}])
+    return mode
+
+
+def process_pipeline(data, cancel_event=None, on_event=None):
+    """Execute the pipeline graph and return per-node results.
+
+    Raises PipelineValidationError before anything runs if the graph or the mode is invalid.
+    """
+    nodes = data.get('nodes', [])
+    connections = data.get('connections', [])
+    plan = compile_pipeline(nodes, connections)
+    mode = pipeline_mode(data)
+    profile = bool(data.get('profile', settings.PIPELINE_PROFILE))
     try:
-        nodes = data.get('nodes', [])
-        connections = data.get('connections', [])
-        print(nodes, connections)
+        if mode == 'stream':
+            execution = execute_stream(plan, nodes, cancel_event=cancel_event, on_event=on_event, profile=profile)
+        else:
+            execution = execute_plan(plan, nodes, use_cache=data.get('use_cache', True),
+                                     cancel_event=cancel_event, on_event=on_event, profile=profile)
+        failed = [node_id for node_id, result in execution['results'].items()
+                  if result['status'] in ('error', 'skipped')]
         return {
-            'status': 'success',
+            'status': 'cancelled' if execution['cancelled'] else 'error' if failed else 'success',
             'counts': {
                 'nodes': len(nodes),
-                'connections': len(connections)
+                'connections': len(connections),
+                'failed': len(failed)
             },
-            'message': f'Received {len(nodes)} nodes and {len(connections)} connections'
+            'message': f'Executed {len(nodes)} nodes and {len(connections)} connections',
+            **execution
         }
     except Exception as e:
         return {
             'status': 'error',
             'message': str(e)
-        }
\ No newline at end of file
+        }
@@ -1,35 +1,153 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .utils.utils import process_pipeline
-from pymongo import MongoClient
+from rest_framework.exceptions import ParseError
+from django.views import View
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.conf import settings
+from asgiref.sync import sync_to_async
+import asyncio
+import logging
+from .utils.utils import process_pipeline
+from .utils.compiler import PipelineValidationError
+from .utils.jobs import get_job_manager, JobQueueFull, FINAL_STATES
+from .utils.events import broker, with_keepalive
+from .utils.mongo import get_users_collection, get_projects_collection, get_versions_collection, ping
+from .utils.board_ops import PatchError, RevisionConflict
+from .utils.board_storage import (is_documents, load_board, query_viewport, save_board, patch_board,
+                                  delete_documents)
+from .utils.autosave import autosave_buffer
+from .utils.pagination import page_params, paginate, PaginationError
+from .utils.permissions import read_access_filter, write_access_filter, METADATA_PROJECTION
+from .utils.board_cache import board_cache
+from .utils.collab import hub
+from .utils.history import history
+from .utils import datasets, project_api
+from .utils.result_store import get_result_store
+from .utils.metrics import render as render_metrics
 from .models import User
 import jwt
+import re
 from datetime import datetime, timedelta
 from bcrypt import hashpw, gensalt
 from bson.objectid import ObjectId
 
+logger = logging.getLogger(__name__)
+
+
+def _render(reply):
+    return Response(reply.body, status=reply.status, headers=reply.headers)
+
+
+def _data(request):
+    """The parsed body; a malformed one is a bad request like any other"""
+    try:
+        return project_api.json_object(request.data)
+    except ParseError as e:
+        raise project_api.RequestError(str(e.detail))
+
+
+def _missing_or_forbidden(projects_collection, project_id):
+    # Tell "missing" from "forbidden" with an _id-only lookup
+    return project_api.missing_or_forbidden(
+        projects_collection.count_documents({'_id': ObjectId(project_id)}, limit=1) > 0
+    )
+
+
 class ExecutePipelineView(APIView):
     def post(self, request):
         try:
             result = process_pipeline(request.data)
             return Response(result, status=status.HTTP_200_OK)
+        except PipelineValidationError as e:
+            return Response(
+                {'status': 'error', 'message': str(e), 'errors': e.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             return Response(
                 {'status': 'error', 'message': str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
             ) 
-class SignupView(APIView):
+class SubmitPipelineJobView(APIView):
     def post(self, request):
         try:
-            # MongoClient inside the method to ensure it works during the post request
-            client = MongoClient(
-                settings.MONGODB_URI,
-                serverSelectionTimeoutMS=5000  # Timeout after 5 seconds
+            job_id = get_job_manager().submit(request.data, user_id=request.data.get('user_id'))
+            return Response({'job_id': job_id, 'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
+        except PipelineValidationError as e:
+            return Response(
+                {'status': 'error', 'message': str(e), 'errors': e.errors},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            db = client.get_database('users')
-            users_collection = db.users
+        except JobQueueFull as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except Exception as e:
+            return Response({'error': f"Failed to submit pipeline job: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+class PipelineJobView(APIView):
+    def get(self, request, job_id):
+        try:
+            job = get_job_manager().get(job_id)
+            if not job:
+                return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(job)
+        except Exception as e:
+            return Response({'error': f"Failed to fetch job: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+class CancelPipelineJobView(APIView):
+    def post(self, request, job_id):
+        try:
+            job = get_job_manager().cancel(job_id)
+            if not job:
+                return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(job, status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            return Response({'error': f"Failed to cancel job: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+class PipelineJobEventsView(View):
+    """Server-Sent Events stream of a job's progress.
+
+    Async so that, served through data_api/asgi.py, each subscriber is a
+    coroutine rather than a blocked worker thread.
+    """
+    async def get(self, request, job_id):
+        try:
+            job = await sync_to_async(get_job_manager().get)(job_id)
+        except Exception as e:
+            return JsonResponse({'error': f"Failed to fetch job: {str(e)}"}, status=400)
+        if not job:
+            return JsonResponse({'error': 'Job not found'}, status=404)
+
+        if broker.is_local(job_id):
+            events = broker.subscribe(job_id)
+        else:
+            # The job runs in another worker process: fall back to polling its status
+            events = self._poll(job_id, job)
+        response = StreamingHttpResponse(
+            with_keepalive(events, settings.PIPELINE_EVENT_KEEPALIVE_SECONDS),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def _poll(self, job_id, job):
+        last_status = None
+        while True:
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield {'event': 'job_status', 'job_id': job_id, 'status': last_status}
+            if last_status in FINAL_STATES:
+                yield {'event': 'job_finished', 'job_id': job_id, 'status': last_status,
+                       'error': job.get('error'), 'result': job.get('result')}
+                return
+            await asyncio.sleep(1)
+            job = await sync_to_async(get_job_manager().get)(job_id)
+
+class SignupView(APIView):
+    def post(self, request):
+        try:
+            users_collection = get_users_collection()
 
             email = request.data.get('email')
             password = request.data.get('password')
@@ -78,20 +196,13 @@ class LoginView(APIView):
             if not email or not password:
                 return Response({'error': 'Email and password are required'}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Connect to MongoDB
-            client = MongoClient(
-                settings.MONGODB_URI,
-                serverSelectionTimeoutMS=5000
-            )
-            db = client.get_database('users')
-            users_collection = db.users
+            users_collection = get_users_collection()
 
             # Find user in MongoDB
             user_data = users_collection.find_one({'email': email})
             
             if not user_data:
                 return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
-            print(user_data)
             # Return user data
             
             token = jwt.encode({'user_id': str(user_data['_id']), 'exp': datetime.utcnow() + timedelta(days=1)},
@@ -101,7 +212,7 @@ class LoginView(APIView):
                 'token': token,
                 'user': {
                     'email': user_data['email'],
-                    'id': str(user_data['_id']),
+                    'id': user_data['_id'],
                     'password': user_data['password']
                 }
             });
@@ -112,52 +223,39 @@ class LoginView(APIView):
 class NewProjectView(APIView):
     def post(self, request):
         try:
-            user_id = request.data.get('user_id')
-            project_name = request.data.get('project_name')
-            collaborators = request.data.get('collaborators')
-            is_public = request.data.get('is_public')
-
-            if not user_id or not project_name:
-                return Response({'error': 'User ID and project name are required'}, status=status.HTTP_400_BAD_REQUEST)
-
-            client = MongoClient(
-                settings.MONGODB_URI,
-                serverSelectionTimeoutMS=5000
-            )
-            db = client.get_database('projects')
-            projects_collection = db.projects
-
-            project_id = projects_collection.insert_one({
-                'user_id': user_id,
-                'project_name': project_name,
-                'created_at': datetime.now(),
-                'nodes': [],
-                'connections': [],
-                'collaborators': collaborators,
-                'is_public': is_public
-            })
-
-            return Response({'project_id': str(project_id.inserted_id)}, status=status.HTTP_201_CREATED)
+            document = project_api.new_project(_data(request))
+            result = get_projects_collection().insert_one(document)
+            return _render(project_api.created(result.inserted_id))
 
+        except project_api.RequestError as e:
+            return _render(e.reply())
         except Exception as e:
-            return Response({'error': f"New project failed: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+            return _render(project_api.failed('New project failed', e, status.HTTP_400_BAD_REQUEST))
 
 class AllUsersView(APIView):
     def get(self, request):
         try:
-            client = MongoClient(settings.MONGODB_URI)
-            db = client.get_database('users')
-            users_collection = db.users
-
-            # Get all users but only return email and id
-            users = users_collection.find(
-                {},
-                {'email': 1}  # Only return email field
+            users_collection = get_users_collection()
+
+            field, order, limit, position = page_params(
+                request.query_params, {'email': 'email', 'created_at': 'created_at'}, 'email', 'asc'
+            )
+            query = {}
+            # Prefix search for the collaborator picker, anchored so it can use the email index
+            search = request.query_params.get('q')
+            if search:
+                query['email'] = {'$regex': '^' + re.escape(search)}
+
+            # Only return email and id
+            users, next_cursor = paginate(
+                users_collection, query, {'email': 1, field: 1}, field, order, limit, position
             )
 
-            users_list = [{'email': user['email'], 'id': str(user['_id'])} for user in users]
-            return Response({'users': users_list})
+            users_list = [{'email': user['email'], 'id': user['_id']} for user in users]
+            return Response({'users': users_list, 'next_cursor': next_cursor})
 
+        except PaginationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {'error': f"Failed to fetch users: {str(e)}"}, 
@@ -167,139 +265,268 @@ class AllUsersView(APIView):
 class AllProjectsView(APIView):
     def get(self, request):
         try:
-            client = MongoClient(settings.MONGODB_URI)
-            db = client.get_database('projects')
-            projects_collection = db.projects
-
-            user_id = request.query_params.get('user_id')
-            if not user_id:
-                return Response({'error': 'User ID is required'}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Find projects and convert cursor to list
-            projects = list(projects_collection.find({'user_id': user_id}))
-            
-            # Convert ObjectId to string and format the response
-            projects_list = [{
-                'id': str(project['_id']),
-                'name': project['project_name'],
-                'created_at': project['created_at'].isoformat(),
-                'is_public': project.get('is_public', False),
-                'collaborators': project.get('collaborators', [])
-            } for project in projects]
-
-            return Response({'projects': projects_list})
+            user_id, field, order, limit, position = project_api.project_list_params(request.query_params)
+            projects, next_cursor = paginate(
+                get_projects_collection(), {'user_id': user_id}, project_api.PROJECT_LISTING_PROJECTION,
+                field, order, limit, position
+            )
+            return _render(project_api.project_list(projects, next_cursor))
 
+        except project_api.RequestError as e:
+            return _render(e.reply())
         except Exception as e:
-            return Response(
-                {'error': f"Failed to fetch projects: {str(e)}"}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+            return _render(project_api.failed('Failed to fetch projects', e))
 
 class DeleteProjectView(APIView):
     def delete(self, request):
         try:
-            project_id = request.query_params.get('project_id')
-            if not project_id:
-                return Response({'error': 'Project ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+            project_id = project_api.required_project(request.query_params.get('project_id'))
 
-            client = MongoClient(settings.MONGODB_URI)
-            db = client.get_database('projects')
-            projects_collection = db.projects
-
-            result = projects_collection.delete_one({'_id': ObjectId(project_id)})
-            if result.deleted_count == 1:
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            else:
-                return Response({'error': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
+            autosave_buffer.discard(project_id)
+            board_cache.invalidate(project_id)
+            result = get_projects_collection().delete_one({'_id': ObjectId(project_id)})
+            delete_documents(project_id)
+            history.delete(project_id)
+            return _render(project_api.deleted(result.deleted_count))
 
+        except project_api.RequestError as e:
+            return _render(e.reply())
         except Exception as e:
-            return Response(
-                {'error': f"Failed to delete project: {str(e)}"}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+            return _render(project_api.failed('Failed to delete project', e))
 
 class OpenWhiteBoardView(APIView):
+    """Open a board. GET (query params) and POST (body) both honour If-None-Match"""
+    def get(self, request, project_id):
+        return self._open(request, project_id, from_body=False)
+
     def post(self, request, project_id):
+        return self._open(request, project_id, from_body=True)
+
+    def _open(self, request, project_id, from_body):
         try:
-            user_id = request.data.get('user_id')
-            if not project_id or not user_id:
-                return Response({'error': 'User ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+            user_id, metadata_only = project_api.open_request(
+                _data(request) if from_body else request.query_params, from_body
+            )
 
-            client = MongoClient(settings.MONGODB_URI)
-            db = client.get_database('projects')
-            projects_collection = db.projects
+            # Read your own writes: a save still sitting in the autosave buffer goes first
+            autosave_buffer.flush(project_id)
+            if_none_match = request.headers.get('If-None-Match')
+            reply = project_api.open_from_cache(project_id, user_id, metadata_only, if_none_match)
+            if reply is not None:
+                return _render(reply)
 
-            project = projects_collection.find_one({'_id': ObjectId(project_id)})
-           
+            projects_collection = get_projects_collection()
+
+            # The permission check is part of the query, so a denied request reads nothing
+            project = projects_collection.find_one(
+                {'_id': ObjectId(project_id), **read_access_filter(user_id)},
+                METADATA_PROJECTION if metadata_only else None
+            )
             if not project:
-                return Response({'error': 'Project not found'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Check if user has permission
-            permissions = (
-                user_id in [collaborator['id'] for collaborator in project.get('collaborators', [])] or 
-                user_id == project.get('user_id') or 
-                project.get('is_public', False)
+                return _render(_missing_or_forbidden(projects_collection, project_id))
+
+            reply = project_api.open_not_modified(project_id, project, metadata_only, if_none_match)
+            if reply is not None:
+                return _render(reply)
+            board = None
+            if not metadata_only:
+                board = load_board(project_id) if is_documents(project) else project_api.embedded_board(project)
+            return _render(project_api.opened(project_id, project, metadata_only, board))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            logger.exception(f"Error in OpenWhiteBoardView: {str(e)}")
+            return _render(project_api.failed('Failed to open whiteboard', e))
+
+class UploadWhiteBoardView(APIView):
+    def post(self, request):
+        try:
+            project_id, user_id, project_data, buffered = project_api.upload_request(_data(request))
+            projects_collection = get_projects_collection()
+
+            if buffered:
+                # A pending save means an earlier request already found the project
+                if (not autosave_buffer.pending(project_id)
+                        and not projects_collection.find_one({'_id': ObjectId(project_id)}, {'_id': 1})):
+                    return _render(project_api.upload_missing())
+                return _render(project_api.upload_buffered(autosave_buffer.put(project_id, project_data)))
+
+            autosave_buffer.discard(project_id)
+            revision = save_board(projects_collection, project_id, {'_id': ObjectId(project_id)}, project_data)
+            return _render(project_api.uploaded(project_id, user_id, project_data, revision))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            logger.exception(f"Error in UploadWhiteBoardView: {str(e)}")
+            return _render(project_api.failed('Failed to save project', e))
+
+
+class PatchWhiteBoardView(APIView):
+    """Apply a list of node/connection operations instead of re-uploading the whole board"""
+    def patch(self, request, project_id):
+        try:
+            user_id, revision, ops = project_api.patch_request(_data(request))
+
+            autosave_buffer.flush(project_id)
+            query = {'_id': ObjectId(project_id), **write_access_filter(user_id)}
+            try:
+                new_revision = patch_board(get_projects_collection(), project_id, query, revision, ops)
+            except (PatchError, RevisionConflict, LookupError) as e:
+                return _render(project_api.patch_failed(project_id, e))
+            return _render(project_api.patched(project_id, new_revision))
+
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            logger.exception(f"Error in PatchWhiteBoardView: {str(e)}")
+            return _render(project_api.failed('Failed to patch project', e))
+
+class WhiteBoardViewportView(APIView):
+    """Nodes inside a rectangle (x0, y0)-(x1, y1) and the connections touching them, a page at a time"""
+    def get(self, request, project_id):
+        try:
+            user_id, box, limit, position = project_api.viewport_request(request.query_params)
+
+            autosave_buffer.flush(project_id)
+            projects_collection = get_projects_collection()
+            project = projects_collection.find_one(
+                {'_id': ObjectId(project_id), **read_access_filter(user_id)}, project_api.VIEWPORT_PROJECTION
             )
+            if not project:
+                return _render(_missing_or_forbidden(projects_collection, project_id))
 
-            if not permissions:
-                return Response({'error': 'No permission to access this project'}, status=status.HTTP_403_FORBIDDEN)
-            
-            project_client_data = {
-                'id': str(project['_id']),
-                'name': project['project_name'],
-                'created_at': project['created_at'].isoformat(),
-                'is_public': project.get('is_public', False),
-                'collaborators': project.get('collaborators', []),
-                'nodes': project.get('nodes', []),
-                'connections': project.get('connections', [])
-            }
-            return Response({'project': project_client_data, 'permissions': permissions})
+            if is_documents(project):
+                nodes, connections, next_cursor = query_viewport(project_id, *box, limit, position)
+            else:
+                nodes, connections, next_cursor = project_api.embedded_viewport(project, box)
+            return _render(project_api.viewport(project, nodes, connections, next_cursor))
 
+        except project_api.RequestError as e:
+            return _render(e.reply())
         except Exception as e:
-            print(f"Error in OpenWhiteBoardView: {str(e)}")
-            return Response(
-                {'error': f"Failed to open whiteboard: {str(e)}"}, 
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            logger.exception(f"Error in WhiteBoardViewportView: {str(e)}")
+            return _render(project_api.failed('Failed to load viewport', e))
+
+def _readable(project_id, user_id):
+    """None if `user_id` may read the project, else the error Reply"""
+    projects_collection = get_projects_collection()
+    if projects_collection.count_documents({'_id': ObjectId(project_id), **read_access_filter(user_id)}, limit=1):
+        return None
+    return _missing_or_forbidden(projects_collection, project_id)
+
+class ProjectVersionsView(APIView):
+    """Newest-first list of a project's recorded versions"""
+    def get(self, request, project_id):
+        try:
+            user_id, field, order, limit, position = project_api.version_list_params(request.query_params)
+            denied = _readable(project_id, user_id)
+            if denied is not None:
+                return _render(denied)
+
+            versions, next_cursor = paginate(
+                get_versions_collection(), {'project_id': project_id}, project_api.VERSION_LISTING_PROJECTION,
+                field, order, limit, position, unique=True
             )
+            return _render(project_api.version_list(versions, next_cursor))
 
-class UploadWhiteBoardView(APIView):
-    def post(self, request):
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            return _render(project_api.failed('Failed to fetch versions', e))
+
+class ProjectVersionView(APIView):
+    """A past version of the board, rebuilt from its snapshot and deltas"""
+    def get(self, request, project_id, version):
         try:
-            client = MongoClient(settings.MONGODB_URI)
-            db = client.get_database('projects')
-            projects_collection = db.projects
+            user_id = project_api.required_user(request.query_params.get('user_id'))
+            denied = _readable(project_id, user_id)
+            if denied is not None:
+                return _render(denied)
 
-            project = request.data.get('project')
-            user_id = request.data.get('user_id')
-            
-            if not project or not user_id:
-                return Response({'error': 'Project and user ID are required'}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Convert project data to MongoDB format
-            project_data = {
-                'project_name': project['name'],
-                'is_public': project.get('is_public', False),
-                'collaborators': project.get('collaborators', []),
-                'nodes': project.get('nodes', []),
-                'connections': project.get('connections', []),
-                'user_id': user_id,
-                'updated_at': datetime.now()
-            }
-            
-            # Update the project in MongoDB
-            result = projects_collection.update_one(
-                {'_id': ObjectId(project['id'])}, 
-                {'$set': project_data}
-            )
+            return _render(project_api.version(project_id, history.reconstruct(project_id, version)))
 
-            if result.modified_count == 0:
-                return Response({'error': 'Project not found or no changes made'}, status=status.HTTP_404_NOT_FOUND)
+        except project_api.RequestError as e:
+            return _render(e.reply())
+        except Exception as e:
+            logger.exception(f"Error in ProjectVersionView: {str(e)}")
+            return _render(project_api.failed('Failed to load version', e))
 
-            return Response({'message': 'Project saved successfully'}, status=status.HTTP_200_OK)
+class DatasetsView(APIView):
+    """Upload a CSV (multipart `file`, or `csv` text) to reference from input nodes by id"""
+    def post(self, request):
+        try:
+            upload = request.FILES.get('file')
+            if upload is not None:
+                size = upload.size
+                name = request.data.get('name') or upload.name
+            else:
+                text = request.data.get('csv')
+                if not isinstance(text, str) or not text.strip():
+                    return Response({'error': 'A file or csv text is required'}, status=status.HTTP_400_BAD_REQUEST)
+                size = len(text.encode('utf-8'))
+                name = request.data.get('name')
+            if size > settings.DATASET_MAX_UPLOAD_BYTES:
+                return Response(
+                    {'error': f"Datasets are limited to {settings.DATASET_MAX_UPLOAD_BYTES} bytes"},
+                    status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                )
+            content = b''.join(upload.chunks()) if upload is not None else text.encode('utf-8')
+            meta = datasets.ingest(content, name)
+            return Response({'dataset': meta}, status=status.HTTP_201_CREATED)
+
+        except UnicodeDecodeError:
+            return Response({'error': 'Datasets must be UTF-8 CSV'}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception(f"Error in DatasetsView: {str(e)}")
+            return Response(
+                {'error': f"Failed to store dataset: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
+class DatasetView(APIView):
+    def get(self, request, dataset_id):
+        try:
+            meta = datasets.describe(dataset_id)
+            preview = datasets.load(dataset_id).to_json(settings.PIPELINE_TABLE_PREVIEW_ROWS)
+            return Response({'dataset': meta, 'rows': preview['rows']})
+        except LookupError as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
-            print(f"Error in UploadWhiteBoardView: {str(e)}")
+            logger.exception(f"Error in DatasetView: {str(e)}")
             return Response(
-                {'error': f"Failed to save project: {str(e)}"}, 
+                {'error': f"Failed to load dataset: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+class AutosaveMetricsView(APIView):
+    def get(self, request):
+        return Response(autosave_buffer.metrics())
+
+class WhiteBoardCacheStatsView(APIView):
+    def get(self, request):
+        return Response(board_cache.stats())
+
+class ResultStoreStatsView(APIView):
+    def get(self, request):
+        result_store = get_result_store()
+        if result_store is None:
+            return Response({'enabled': False})
+        return Response({'enabled': True, **result_store.stats()})
+
+class CollabStatsView(APIView):
+    def get(self, request):
+        return Response(hub.stats())
+
+class HealthView(APIView):
+    def get(self, request):
+        result = ping()
+        if not result['ok']:
+            return Response({'status': 'unavailable', 'mongodb': result}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'status': 'ok', 'mongodb': result})
+
+class MetricsView(View):
+    """Prometheus scrape target (app/utils/metrics.py)"""
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,80 @@
+"""Throughput of the data-cleaning operators (app/utils/cleaning.py).
+
+    python benchmarks/cleaning_operators.py --rows 1000000
+
+Builds a synthetic table with numeric, categorical and missing values, runs
+every operator on it a few times and prints the best time and rows/second.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.operators import get_operator  # noqa: E402
+from app.utils.table import Table  # noqa: E402
+
+
+def make_table(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    price = rng.gamma(2.0, 10.0, rows)
+    price[rng.random(rows) < 0.05] = np.nan
+    cities = np.array(['paris', 'lima', 'oslo', 'kyiv', 'quito', 'baku', 'doha', 'riga'], dtype=object)
+    city = cities[rng.integers(0, len(cities), rows)]
+    city[rng.random(rows) < 0.02] = None
+    return Table({
+        'id': rng.integers(0, rows // 2, rows),
+        'city': city,
+        'price': price,
+        'qty': rng.integers(0, 100, rows).astype(np.float64),
+        'flag': np.where(rng.random(rows) < 0.5, 'yes', 'no').astype(object),
+    })
+
+
+CASES = [
+    ('filterRows', {'column': 'price', 'operator': '>', 'value': '20'}),
+    ('filterRows', {'column': 'city', 'operator': 'contains', 'value': 'i'}),
+    ('fillMissing', {'columns': 'price', 'strategy': 'median'}),
+    ('fillMissing', {'columns': 'city', 'strategy': 'ffill'}),
+    ('dedupe', {'columns': 'id'}),
+    ('dedupe', {'columns': 'city,qty'}),
+    ('typeCast', {'columns': 'flag', 'type': 'bool'}),
+    ('typeCast', {'columns': 'qty', 'type': 'int'}),
+    ('normalize', {'method': 'zscore'}),
+    ('groupAggregate', {'by': 'city', 'aggregations': 'price:mean,qty:sum,price:max,*:count'}),
+]
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    table = make_table(args.rows)
+    lookup = Table({'id': np.arange(args.rows // 2), 'segment': np.arange(args.rows // 2) % 7})
+    cases = [(name, data, {'data': table}) for name, data in CASES]
+    cases.append(('join', {'on': 'id', 'how': 'left'}, {'left': table, 'right': lookup}))
+
+    print(f"{'operator':<16}{'data':<58}{'seconds':>9}{'Mrows/s':>9}")
+    for name, data, inputs in cases:
+        operator = get_operator(name)
+        seconds = best_of(args.repeat, lambda: operator(inputs, data))
+        described = ', '.join(f"{key}={value}" for key, value in data.items())
+        print(f"{name:<16}{described:<58}{seconds:>9.3f}{args.rows / seconds / 1e6:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
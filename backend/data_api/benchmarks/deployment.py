@@ -0,0 +1,233 @@
+"""The API served by uvicorn (ASGI, async views) against gunicorn (WSGI, threads).
+
+    python benchmarks/deployment.py --mongodb-uri mongodb://localhost:27017 --concurrency 10,100,1000
+
+Seeds a throwaway database on the given server with projects and boards,
+starts each server in turn on that database, and holds --concurrency
+keep-alive connections open against it, each sending its next request as
+soon as the last one is answered, for --duration seconds per level. The
+requests cycle through opening a board, listing projects and a viewport of
+a --board-nodes board. Prints requests/s, p50/p99 latency and failures per
+mode and level, and writes them as JSON with --output.
+
+It needs a real MongoDB server: AsyncMongoClient cannot run on mongomock.
+Both servers get --workers processes; gunicorn gets --threads threads in
+each, which bounds its requests in flight, while uvicorn is bounded by the
+MongoDB pool (MONGODB_MAX_POOL_SIZE and the other settings are passed on
+from the environment). Raise the open file limit (ulimit -n) for a few
+thousand connections.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongodb-uri', required=True)
+    parser.add_argument('--concurrency', default='10,100,1000', help='comma separated connection counts')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per level')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn threads per worker')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--board-nodes', type=int, default=10_000)
+    parser.add_argument('--paths', help='comma separated paths to request instead of the seeded ones')
+    parser.add_argument('--output')
+    return parser.parse_args()
+
+
+args = parse_args()
+database = f"bench_deployment_{os.getpid()}"
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'data_api.settings')
+os.environ['MONGODB_URI'] = args.mongodb_uri
+os.environ['MONGODB_PROJECTS_DB'] = database
+os.environ['MONGODB_ENSURE_INDEXES_ON_STARTUP'] = 'false'
+
+import django  # noqa: E402
+
+django.setup()
+
+from bson.objectid import ObjectId  # noqa: E402
+
+from app.utils import mongo  # noqa: E402
+from app.utils.board_storage import save_board  # noqa: E402
+from app.utils.indexes import ensure_indexes  # noqa: E402
+
+SERVERS = {
+    'asgi': lambda port: ['uvicorn', 'data_api.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+                          '--workers', str(args.workers), '--no-access-log', '--log-level', 'warning'],
+    'wsgi': lambda port: ['gunicorn', 'data_api.wsgi:application', '--bind', f"127.0.0.1:{port}",
+                          '--workers', str(args.workers), '--worker-class', 'gthread',
+                          '--threads', str(args.threads), '--log-level', 'warning'],
+}
+
+
+def make_board(nodes, rng):
+    board_nodes, connections = [], []
+    columns = max(int(nodes ** 0.5), 1)
+    for index in range(nodes):
+        node_id = f"n{index}"
+        board_nodes.append({
+            'id': node_id, 'type': 'textProcessor', 'title': 'textProcessor',
+            'position': {'x': (index % columns) * 300 + rng.randint(0, 40),
+                         'y': (index // columns) * 200 + rng.randint(0, 40), 'z': 0},
+            'inputs': [{'id': f"{node_id}-input-input", 'type': 'input', 'name': 'input', 'dataType': 'text'}],
+            'outputs': [{'id': f"{node_id}-output-output", 'type': 'output', 'name': 'output', 'dataType': 'text'}],
+            'data': [{'name': 'text', 'dataType': 'text', 'value': rng.choice(['upper', 'lower'])}],
+        })
+        if index % 10:
+            connections.append({'id': f"n{index - 1}->{node_id}", 'sourceNodeId': f"n{index - 1}",
+                                'sourcePortId': f"n{index - 1}-output-output", 'targetNodeId': node_id,
+                                'targetPortId': f"{node_id}-input-input", 'z': 0})
+    return board_nodes, connections
+
+
+def seed():
+    """Paths to request: a 200 node board, its owner's project list and a viewport of the big board"""
+    rng = random.Random(0)
+    ensure_indexes()
+    projects = mongo.get_projects_collection()
+    ids = projects.insert_many([{
+        'user_id': f"user{index % 50}", 'project_name': f"Project {index}", 'created_at': datetime.now(),
+        'nodes': [], 'connections': [], 'collaborators': [], 'is_public': False, 'revision': 0,
+    } for index in range(1000)]).inserted_ids
+    small, big = str(ids[0]), str(ids[1])
+    for project_id, nodes in ((small, 200), (big, args.board_nodes)):
+        board_nodes, connections = make_board(nodes, rng)
+        save_board(projects, project_id, {'_id': ObjectId(project_id)},
+                   {'project_name': 'Board', 'nodes': board_nodes, 'connections': connections,
+                    'user_id': 'user0', 'collaborators': [], 'is_public': False})
+    return [
+        f"/api/whiteboard/{small}/?user_id=user0",
+        '/api/all-projects/?user_id=user0',
+        f"/api/whiteboard/{big}/viewport/?user_id=user0&x0=3000&y0=2000&x1=5000&y1=3200",
+    ]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start(mode, port):
+    env = {**os.environ, 'API_ASYNC_VIEWS': 'true' if mode == 'asgi' else 'false'}
+    server = subprocess.Popen(SERVERS[mode](port), cwd=ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"{mode} server exited with {server.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    sys.exit(f"{mode} server did not start listening on port {port}")
+
+
+async def request(reader, writer, path):
+    """One GET on a keep-alive connection; returns the status code"""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: keep-alive\r\n\r\n".encode('ascii'))
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+    headers = {name.strip().lower(): value.strip() for name, value in headers.items()}
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).strip(), 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    return status
+
+
+async def connection(port, paths, offset, deadline, latencies, failures):
+    reader = writer = None
+    index = offset
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=2 ** 24)
+            status = await request(reader, writer, paths[index % len(paths)])
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            failures['connection'] = failures.get('connection', 0) + 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.01)
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status >= 400:
+            failures[str(status)] = failures.get(str(status), 0) + 1
+        index += 1
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, paths, concurrency):
+    latencies, failures = [], {}
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(*(connection(port, paths, offset, deadline, latencies, failures)
+                           for offset in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000 if latencies else (0.0, 0.0)
+    return {'requests': len(latencies), 'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(float(p50), 2), 'p99_ms': round(float(p99), 2), 'failures': failures}
+
+
+async def warm_up(port, paths):
+    """A second of light load, so pools and caches are filled before measuring"""
+    deadline = time.perf_counter() + 1
+    await asyncio.gather(*(connection(port, paths, offset, deadline, [], {}) for offset in range(4)))
+
+
+def main():
+    levels = [int(level) for level in args.concurrency.split(',')]
+    results = {'meta': {'workers': args.workers, 'threads': args.threads, 'duration': args.duration,
+                        'board_nodes': args.board_nodes, 'created_at': datetime.now().isoformat(timespec='seconds')},
+               'modes': {}}
+    try:
+        paths = args.paths.split(',') if args.paths else seed()
+        print(f"{'mode':<6}{'conns':>7}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}  failures")
+        for mode in args.modes.split(','):
+            port = free_port()
+            server = start(mode, port)
+            try:
+                asyncio.run(warm_up(port, paths))
+                for level in levels:
+                    result = asyncio.run(load(port, paths, level))
+                    results['modes'].setdefault(mode, {})[str(level)] = result
+                    print(f"{mode:<6}{level:>7}{result['rps']:>10.1f}{result['p50_ms']:>10.2f}"
+                          f"{result['p99_ms']:>10.2f}  {result['failures'] or '-'}")
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        mongo.get_client().drop_database(database)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+            file.write('\n')
+
+
+if __name__ == '__main__':
+    main()
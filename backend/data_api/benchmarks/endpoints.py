@@ -0,0 +1,517 @@
+"""Load test of every route in app/urls.py against a seeded stand-in for MongoDB.
+
+    python benchmarks/endpoints.py --concurrency 8 --duration 5 --output run.json
+    python benchmarks/endpoints.py --baseline benchmarks/endpoints_baseline.json --threshold 0.25
+
+Seeds mongomock (pip install mongomock), or with --mongodb-uri a throwaway
+database on a local mongod, with users, projects, version history, a
+dataset and one board of --board-nodes nodes. Each route is then driven on
+its own for --duration seconds from --concurrency threads through Django's
+test client, so the whole request path from middleware to MongoDB runs but
+no server is needed. The Django user table lives in a temporary SQLite
+file, and datasets and stored results in a temporary directory.
+
+Prints a table and writes JSON with requests/s and p50/p95/p99 latency per
+route. Routes in SKIPPED are not run, for the reason given there. With
+--baseline, exits 1 if any route's p95 grew, or its throughput fell, by more
+than --threshold, or if either run got an unexpected status from it. Latencies under --floor-ms are rounded up
+to it for the comparison: the client threads share the GIL, so the tail of
+a fast route is mostly threads waiting their turn and moves between runs.
+Absolute numbers depend on the machine and on mongomock being far slower
+than a server at queries, so compare runs from the same setup.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from bson.objectid import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongodb-uri', help='benchmark a real server instead of mongomock')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=3.0, help='seconds per route')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per route first')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--projects', type=int, default=1000)
+    parser.add_argument('--board-nodes', type=int, default=10_000)
+    parser.add_argument('--routes', help='comma separated route names, default all')
+    parser.add_argument('--output', help='write the results here as JSON')
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed regression, 0.25 = 25%%')
+    parser.add_argument('--floor-ms', type=float, default=25.0)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+args = parse_args()
+scratch = tempfile.mkdtemp(prefix='endpoint-bench-')
+# Everything the run writes goes to throwaway places, set before settings load
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'data_api.settings')
+os.environ['MONGODB_URI'] = args.mongodb_uri or 'mongodb://stand-in'
+os.environ['MONGODB_USERS_DB'] = f"bench_users_{os.getpid()}"
+os.environ['MONGODB_PROJECTS_DB'] = f"bench_projects_{os.getpid()}"
+os.environ['MONGODB_ENSURE_INDEXES_ON_STARTUP'] = 'false'
+os.environ['DATASET_DIR'] = os.path.join(scratch, 'datasets')
+os.environ['RESULT_STORE_DIR'] = os.path.join(scratch, 'result_store')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import AsyncClient, Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.urls import URLPattern  # noqa: E402
+
+from app import urls as app_urls  # noqa: E402
+from app.utils import mongo  # noqa: E402
+from app.utils.board_storage import DOCUMENTS, save_board  # noqa: E402
+from app.utils.indexes import ensure_indexes  # noqa: E402
+from app.utils.jobs import FINAL_STATES  # noqa: E402
+
+
+# Seed data
+
+def port(node_id, kind, name, data_type):
+    return {'id': f"{node_id}-{kind}-{name}", 'type': kind, 'name': name, 'dataType': data_type, 'label': name}
+
+
+def make_node(node_id, node_type, data, inputs=(), outputs=(), position=(0, 0)):
+    return {
+        'id': node_id,
+        'type': node_type,
+        'title': node_type,
+        'position': {'x': position[0], 'y': position[1], 'z': 0},
+        'inputs': [port(node_id, 'input', name, data_type) for name, data_type in inputs],
+        'outputs': [port(node_id, 'output', name, data_type) for name, data_type in outputs],
+        'data': [{'name': name, 'dataType': 'text', 'value': value} for name, value in data.items()],
+    }
+
+
+def connect(source, source_port, target, target_port):
+    return {
+        'id': f"{source}->{target}",
+        'sourceNodeId': source, 'sourcePortId': f"{source}-output-{source_port}",
+        'targetNodeId': target, 'targetPortId': f"{target}-input-{target_port}",
+        'z': 0,
+    }
+
+
+def make_board(nodes, rng):
+    """A grid of text processors in chains of ten, as a big hand-built board would look"""
+    board_nodes, connections = [], []
+    columns = max(int(nodes ** 0.5), 1)
+    for index in range(nodes):
+        node_id = f"n{index}"
+        position = ((index % columns) * 300 + rng.randint(0, 40), (index // columns) * 200 + rng.randint(0, 40))
+        board_nodes.append(make_node(node_id, 'textProcessor', {'text': rng.choice(['upper', 'lower', 'reverse'])},
+                                     [('input', 'text')], [('output', 'text')], position))
+        if index % 10:
+            connections.append(connect(f"n{index - 1}", 'output', node_id, 'input'))
+    return board_nodes, connections
+
+
+def pipeline(rows=200):
+    """input -> typeCast -> filterRows -> textTransform over a small CSV, with the frontend's port types"""
+    csv = 'id,city,qty\n' + '\n'.join(f"{index},{['Paris', 'Lima', 'Oslo'][index % 3]},{index % 50}"
+                                      for index in range(rows))
+    nodes = [
+        make_node('input', 'inputManager', {'text': csv, 'csv file': ''}, [('input text', 'text')],
+                  [('output', 'text'), ('output number', 'text')]),
+        make_node('cast', 'typeCast', {'columns': 'qty', 'type': 'int'}, [('data', 'data')], [('table', 'table')]),
+        make_node('filter', 'filterRows', {'column': 'qty', 'operator': '>', 'value': '10'},
+                  [('data', 'data')], [('table', 'table')]),
+        make_node('text', 'textTransform', {'columns': 'city', 'operations': 'lower'},
+                  [('data', 'data')], [('table', 'table')]),
+    ]
+    connections = [connect('input', 'output', 'cast', 'data'), connect('cast', 'table', 'filter', 'data'),
+                   connect('filter', 'table', 'text', 'data')]
+    return {'nodes': nodes, 'connections': connections, 'use_cache': False}
+
+
+def insert_documents(projects, project_id, nodes, connections):
+    """save_board of a new board in the documents layout, as bulk inserts.
+
+    Its per-node upserts are quadratic in the board size without indexes,
+    so with mongomock a 10k node board would take many minutes to seed.
+    """
+    mongo.get_board_nodes_collection().insert_many([{**node, 'project_id': project_id} for node in nodes])
+    mongo.get_board_connections_collection().insert_many(
+        [{**connection, 'project_id': project_id} for connection in connections])
+    projects.update_one({'_id': ObjectId(project_id)},
+                        {'$set': {'storage': DOCUMENTS, 'node_count': len(nodes)},
+                         '$unset': {'nodes': '', 'connections': ''}, '$inc': {'revision': 1}})
+
+
+def check(response, expected=200):
+    if response.status_code != expected:
+        raise RuntimeError(f"Seeding got {response.status_code}: {getattr(response, 'data', response.content)}")
+    return response
+
+
+class Context:
+    """Ids the scenarios need, created through the API where the API can create them"""
+
+    def __init__(self, client, rng):
+        self.rng = rng
+        self.counter = itertools.count()
+        # worker -> its last submitted pipeline job
+        self.submitted = {}
+        self.client = client
+        users = mongo.get_users_collection()
+        users.insert_many([{'email': f"user{index}@example.com", 'password': b'', 'created_at': datetime.now()}
+                           for index in range(args.users)])
+        self.user_ids = [str(user['_id']) for user in users.find({}, {'_id': 1})]
+        self.owner = self.user_ids[0]
+
+        projects = mongo.get_projects_collection()
+        projects.insert_many([{
+            'user_id': rng.choice(self.user_ids),
+            'project_name': f"Project {index}",
+            'created_at': datetime.now(),
+            'nodes': [], 'connections': [],
+            'collaborators': [], 'is_public': index % 5 == 0,
+            'revision': 0,
+        } for index in range(args.projects)])
+
+        # A board with history, saved repeatedly with nodes moving between saves
+        self.small_board = make_board(200, rng)
+        self.versioned = self.new_project('Versioned board')
+        nodes, connections = make_board(200, rng)
+        for _ in range(20):
+            for node in rng.sample(nodes, 5):
+                node['position'] = {'x': rng.randint(0, 5000), 'y': rng.randint(0, 5000), 'z': 0}
+            check(self.upload(self.versioned, nodes, connections, flush=True))
+        self.versions = mongo.get_versions_collection().count_documents({'project_id': self.versioned})
+
+        # Projects per worker for the writing routes, so workers do not conflict with each other
+        self.upload_boards = [self.new_project(f"Upload {worker}") for worker in range(args.concurrency)]
+        self.patch_boards = [self.new_project(f"Patch {worker}") for worker in range(args.concurrency)]
+        for project_id in self.upload_boards + self.patch_boards:
+            check(self.upload(project_id, *self.small_board, flush=True))
+
+        # Last, as mongomock has no indexes and every later write would scan its nodes
+        nodes, connections = make_board(args.board_nodes, rng)
+        self.big_board = self.new_project('Big board')
+        if args.mongodb_uri is None:
+            insert_documents(projects, self.big_board, nodes, connections)
+        else:
+            # Through save_board, so it gets the layout a save would give it
+            save_board(projects, self.big_board, {'_id': ObjectId(self.big_board)},
+                       {'project_name': 'Big board', 'nodes': nodes, 'connections': connections,
+                        'user_id': self.owner, 'collaborators': [], 'is_public': False})
+        self.big_board_size = (max(node['position']['x'] for node in nodes),
+                               max(node['position']['y'] for node in nodes))
+
+        self.dataset = check(client.post('/api/datasets/', {'csv': pipeline(2000)['nodes'][0]['data'][0]['value'],
+                                                            'name': 'bench.csv'}), 201).json()['dataset']['id']
+        self.job = check(client.post('/api/pipeline-jobs/', pipeline(), content_type='application/json'),
+                         202).json()['job_id']
+        self.wait_for(self.job)
+
+    def new_project(self, name):
+        response = self.client.post('/api/new-project/', {'user_id': self.owner, 'project_name': name,
+                                                          'collaborators': [], 'is_public': False},
+                                    content_type='application/json')
+        return check(response, 201).json()['project_id']
+
+    def upload(self, project_id, nodes, connections, flush=False, client=None):
+        return (client or self.client).post('/api/upload-whiteboard/', {
+            'user_id': self.owner, 'flush': flush,
+            'project': {'id': project_id, 'name': 'Board', 'nodes': nodes, 'connections': connections},
+        }, content_type='application/json')
+
+    def revision(self, project_id):
+        return mongo.get_projects_collection().find_one({'_id': ObjectId(project_id)},
+                                                        {'revision': 1})['revision']
+
+    def patch(self, project_id, node_id, client=None):
+        position = {'x': self.rng.randint(0, 5000), 'y': self.rng.randint(0, 5000), 'z': 0}
+        return (client or self.client).patch(f"/api/whiteboard/{project_id}/patch/", {
+            'user_id': self.owner, 'revision': self.revision(project_id),
+            'ops': [{'op': 'move_node', 'node_id': node_id, 'position': position}],
+        }, content_type='application/json')
+
+    def wait_for(self, job_id, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = mongo.get_jobs_collection().find_one({'_id': ObjectId(job_id)}, {'status': 1})
+            if job['status'] in FINAL_STATES:
+                return
+            time.sleep(0.05)
+        raise RuntimeError(f"Pipeline job {job_id} did not finish")
+
+
+# Scenarios: route name -> (expected status, prepare(ctx, worker) -> request(client)).
+# Only request(client) is timed; prepare does untimed setup such as creating what a request deletes.
+
+def fixed(method, path, expected=200, **kwargs):
+    def prepare(ctx, worker):
+        url = path(ctx) if callable(path) else path
+        return lambda client: getattr(client, method)(url, **kwargs)
+    return expected, prepare
+
+
+def submit_job(ctx, worker):
+    # One job in flight per worker; submitting faster than jobs run only measures the queue-full rejection
+    if worker in ctx.submitted:
+        ctx.wait_for(ctx.submitted[worker])
+
+    def request(client):
+        response = client.post('/api/pipeline-jobs/', pipeline(), content_type='application/json')
+        if response.status_code == 202:
+            ctx.submitted[worker] = response.json()['job_id']
+        return response
+    return request
+
+
+def job_events(ctx, worker):
+    async def stream():
+        response = await AsyncClient().get(f"/api/pipeline-jobs/{ctx.job}/events/")
+        # The view is async and so is its stream; reading all of it is part of serving it
+        async for _ in response.streaming_content:
+            pass
+        return response
+    return lambda client: asyncio.run(stream())
+
+
+def delete_project(ctx, worker):
+    project_id = str(mongo.get_projects_collection().insert_one({
+        'user_id': ctx.owner, 'project_name': 'Doomed', 'created_at': datetime.now(),
+        'nodes': [], 'connections': [], 'collaborators': [], 'is_public': False, 'revision': 0,
+    }).inserted_id)
+    return lambda client: client.delete(f"/api/delete-project/?project_id={project_id}")
+
+
+def patch_board(ctx, worker):
+    node_id = f"n{ctx.rng.randrange(200)}"
+    return lambda client: ctx.patch(ctx.patch_boards[worker], node_id, client)
+
+
+def upload_board(ctx, worker):
+    return lambda client: ctx.upload(ctx.upload_boards[worker], *ctx.small_board, client=client)
+
+
+def viewport(ctx, worker):
+    width, height = ctx.big_board_size
+    x0, y0 = ctx.rng.uniform(0, width * 0.8), ctx.rng.uniform(0, height * 0.8)
+    return lambda client: client.get(f"/api/whiteboard/{ctx.big_board}/viewport/", {
+        'user_id': ctx.owner, 'x0': x0, 'y0': y0, 'x1': x0 + 2000, 'y1': y0 + 1200,
+    })
+
+
+def upload_dataset(ctx, worker):
+    # A row of its own makes every upload a new dataset, so this times ingestion rather than deduplication
+    csv = pipeline(2000)['nodes'][0]['data'][0]['value'] + f"\n{next(ctx.counter) + 10_000},Quito,{worker}"
+    return lambda client: client.post('/api/datasets/', {'csv': csv}, content_type='application/json')
+
+
+SCENARIOS = {
+    'execute-pipeline': fixed('post', '/api/execute-pipeline/', data=pipeline(), content_type='application/json'),
+    'submit-pipeline-job': (202, submit_job),
+    'pipeline-job': fixed('get', lambda ctx: f"/api/pipeline-jobs/{ctx.job}/"),
+    'cancel-pipeline-job': fixed('post', lambda ctx: f"/api/pipeline-jobs/{ctx.job}/cancel/", 202),
+    'pipeline-job-events': (200, job_events),
+    'login': fixed('post', '/api/login/', data={'email': 'user1@example.com', 'password': 'x'},
+                   content_type='application/json'),
+    'new-project': fixed('post', '/api/new-project/', 201, content_type='application/json',
+                         data={'user_id': 'bench', 'project_name': 'New', 'collaborators': [], 'is_public': False}),
+    'all-users': fixed('get', '/api/all-users/?q=user1&limit=50'),
+    'all-projects': fixed('get', lambda ctx: f"/api/all-projects/?user_id={ctx.user_ids[1]}"),
+    'delete-project': (204, delete_project),
+    'open-whiteboard': fixed('get', lambda ctx: f"/api/whiteboard/{ctx.big_board}/?user_id={ctx.owner}"),
+    'patch-whiteboard': (200, patch_board),
+    'whiteboard-viewport': (200, viewport),
+    'project-versions': fixed('get', lambda ctx: f"/api/whiteboard/{ctx.versioned}/versions/?user_id={ctx.owner}"),
+    'project-version': fixed('get', lambda ctx: (f"/api/whiteboard/{ctx.versioned}/versions/"
+                                                 f"{ctx.versions}/?user_id={ctx.owner}")),
+    'datasets': (201, upload_dataset),
+    'dataset': fixed('get', lambda ctx: f"/api/datasets/{ctx.dataset}/"),
+    'upload-whiteboard': (202, upload_board),
+    'autosave-metrics': fixed('get', '/api/autosave-metrics/'),
+    'whiteboard-cache-stats': fixed('get', '/api/whiteboard-cache-stats/'),
+    'result-store-stats': fixed('get', '/api/result-store-stats/'),
+    'collab-stats': fixed('get', '/api/collab-stats/'),
+    'health': fixed('get', '/api/health/'),
+}
+
+# Routes that cannot be measured as they stand: route name -> why
+SKIPPED = {
+    # models.User declares itself swappable for AUTH_USER_MODEL, which settings
+    # leave unset, so User.objects raises "Manager isn't available" every time
+    'signup': 'fails on every request until AUTH_USER_MODEL is set to app.User',
+}
+
+
+# Measurement
+
+def run_route(ctx, name):
+    expected, prepare = SCENARIOS[name]
+    for _ in range(args.warmup):
+        prepare(ctx, 0)(ctx.client)
+
+    latencies, statuses, lock = [], {}, threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker(index):
+        client = Client()
+        mine, seen = [], {}
+        while time.perf_counter() < deadline:
+            request = prepare(ctx, index)
+            started = time.perf_counter()
+            status = request(client).status_code
+            mine.append(time.perf_counter() - started)
+            seen[status] = seen.get(status, 0) + 1
+        with lock:
+            latencies.extend(mine)
+            for status, count in seen.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status != expected),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(p95, 3),
+        'p99_ms': round(p99, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+    }
+
+
+def compare(results, baseline):
+    """Routes that regressed past the threshold, as printable lines"""
+    regressions = []
+    for name, current in results['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        p95_before, p95_now = max(before['p95_ms'], args.floor_ms), max(current['p95_ms'], args.floor_ms)
+        if p95_now > p95_before * (1 + args.threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} -> {current['p95_ms']:.2f} ms")
+        # Throughput is bounded by the latency floor too
+        rps_floor = args.concurrency * 1000 / args.floor_ms
+        if min(current['rps'], rps_floor) < min(before['rps'], rps_floor) * (1 - args.threshold):
+            regressions.append(f"{name}: {before['rps']:.1f} -> {current['rps']:.1f} requests/s")
+        # A route answering with errors is not measured, so neither run says anything about it
+        if before['errors']:
+            regressions.append(f"{name}: baseline has {before['errors']} unexpected responses {before['statuses']}")
+        if current['errors']:
+            regressions.append(f"{name}: {current['errors']} unexpected responses {current['statuses']}")
+    return regressions
+
+
+def allow_sort(builder):
+    """pymongo 4.11+ passes bulk ReplaceOne/UpdateOne a `sort`, which mongomock 4.3 does not take"""
+    for name in ('add_replace', 'add_update'):
+        method = getattr(builder, name)
+        if 'sort' not in method.__code__.co_varnames:
+            def without_sort(self, *args, _method=method, sort=None, **kwargs):
+                return _method(self, *args, **kwargs)
+            setattr(builder, name, without_sort)
+
+
+def main():
+    routes = [pattern.name for pattern in app_urls.urlpatterns if isinstance(pattern, URLPattern)]
+    missing = [name for name in routes if name not in SCENARIOS and name not in SKIPPED]
+    if missing:
+        # A new route needs a scenario before the suite can claim to cover the API
+        sys.exit(f"No benchmark scenario for: {', '.join(missing)}")
+    for name in routes:
+        if name in SKIPPED:
+            print(f"Skipping {name}: {SKIPPED[name]}")
+    routes = [name for name in routes if name not in SKIPPED]
+    if args.routes:
+        routes = [name for name in routes if name in args.routes.split(',')]
+
+    if args.mongodb_uri is None:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit('pip install mongomock, or pass --mongodb-uri of a local mongod')
+        mongo._client, mongo._client_pid = mongomock.MongoClient(), os.getpid()
+        allow_sort(mongomock.collection.BulkOperationBuilder)
+    else:
+        # mongomock answers queries by scanning either way, and checks unique indexes by scanning on every insert
+        ensure_indexes()
+
+    # Expected 4xx responses are not worth a log line each
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+
+    # The Django user table (signup) in a throwaway SQLite file
+    setup_test_environment()
+    connection.settings_dict['TEST']['NAME'] = os.path.join(scratch, 'auth.sqlite3')
+    connection.creation.create_test_db(verbosity=0)
+
+    rng = random.Random(args.seed)
+    try:
+        print(f"Seeding {args.users} users, {args.projects} projects and a {args.board_nodes}-node board...")
+        ctx = Context(Client(), rng)
+        results = {
+            'meta': {
+                'mongodb': 'server' if args.mongodb_uri else 'mongomock',
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'board_nodes': args.board_nodes,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+            },
+            'routes': {},
+            'skipped': SKIPPED,
+        }
+        print(f"{'route':<24}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for name in routes:
+            result = results['routes'][name] = run_route(ctx, name)
+            print(f"{name:<24}{result['rps']:>9.1f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                  f"{result['p99_ms']:>9.2f}{result['errors']:>8}")
+        for name, result in results['routes'].items():
+            if result['errors']:
+                print(f"{name}: expected {SCENARIOS[name][0]}, got {result['statuses']}")
+    finally:
+        if args.mongodb_uri:
+            mongo.get_client().drop_database(settings.MONGODB_USERS_DB)
+            mongo.get_client().drop_database(settings.MONGODB_PROJECTS_DB)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+            file.write('\n')
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline)
+        if regressions:
+            print(f"\nRegressed by more than {args.threshold:.0%} against {args.baseline}:")
+            print('\n'.join(f"  {line}" for line in regressions))
+            sys.exit(1)
+        print(f"\nNo route regressed by more than {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
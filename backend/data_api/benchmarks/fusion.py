@@ -0,0 +1,84 @@
+"""Fused against node-by-node execution of a chain of row-by-row nodes.
+
+    python benchmarks/fusion.py --rows 1000000
+
+Runs cast -> trim -> lowercase -> filter over a synthetic table both ways,
+checks the final tables match and prints the best time and peak traced
+memory of each. Loads the Django settings, so MONGODB_URI must be set
+(nothing connects to it).
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'data_api.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from app.utils.executor import run_fused, _run_unfused  # noqa: E402
+from app.utils.table import Table  # noqa: E402
+
+STEPS = [
+    ('typeCast', {'columns': 'qty', 'type': 'float'}),
+    ('textTransform', {'columns': 'city', 'operations': 'strip'}),
+    ('textTransform', {'columns': 'city', 'operations': 'lower'}),
+    ('filterRows', {'column': 'city', 'operator': 'contains', 'value': 'a'}),
+]
+
+
+def make_table(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    cities = np.array([' Paris', 'LIMA ', 'Oslo', ' kyiv ', 'Quito', 'BAKU', 'Doha ', 'riga'], dtype=object)
+    city = cities[rng.integers(0, len(cities), rows)]
+    city[rng.random(rows) < 0.02] = None
+    return Table({
+        'id': np.arange(rows),
+        'city': city,
+        'qty': rng.integers(0, 100, rows).astype(str).astype(object),
+        'price': rng.gamma(2.0, 10.0, rows),
+    })
+
+
+def measure(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, min(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--batch-rows', type=int, default=65536)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    inputs = {'data': make_table(args.rows)}
+    unfused, unfused_seconds, unfused_peak = measure(args.repeat, lambda: _run_unfused(STEPS, inputs))
+    fused, fused_seconds, fused_peak = measure(args.repeat, lambda: run_fused(STEPS, inputs, args.batch_rows, 20))
+
+    expected, actual = unfused[-1][0]['table'], fused[-1][0]['table']
+    same = expected.names == actual.names and all(
+        np.array_equal(expected.column(name), actual.column(name)) for name in expected.names
+    )
+    print(f"{'execution':<12}{'seconds':>9}{'Mrows/s':>9}{'peak MB':>9}")
+    print(f"{'unfused':<12}{unfused_seconds:>9.3f}{args.rows / unfused_seconds / 1e6:>9.2f}{unfused_peak / 1e6:>9.1f}")
+    print(f"{'fused':<12}{fused_seconds:>9.3f}{args.rows / fused_seconds / 1e6:>9.2f}{fused_peak / 1e6:>9.1f}")
+    print(f"results identical: {same}")
+
+
+if __name__ == '__main__':
+    main()
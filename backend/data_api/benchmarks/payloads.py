@@ -0,0 +1,144 @@
+"""Rendering, parsing and compressing whiteboard payloads of several sizes.
+
+    python benchmarks/payloads.py --nodes 100,1000,10000
+
+Builds an open-whiteboard response for boards of mixed node types and
+times DRF's JSONRenderer and JSONParser (on the response as the views used
+to build it, ids and dates already strings) against FastJSONRenderer and
+FastJSONParser, with orjson and with the json module fallback. Then prints
+the size and time of each compression the middleware can pick. Loads the
+Django settings, so MONGODB_URI must be set (nothing connects to it).
+"""
+import argparse
+import gzip
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'data_api.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from bson.objectid import ObjectId  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from app.utils import fastjson  # noqa: E402
+from app.utils.compression import brotli  # noqa: E402
+
+NODE_DATA = {
+    'inputManager': lambda rng: [{'name': 'file', 'dataType': 'file', 'value': f"upload_{rng.randint(0, 999)}.csv"}],
+    'typeCast': lambda rng: [{'name': 'columns', 'dataType': 'text', 'value': 'qty,price'},
+                             {'name': 'type', 'dataType': 'text', 'value': rng.choice(['int', 'float'])}],
+    'filterRows': lambda rng: [{'name': 'column', 'dataType': 'text', 'value': 'city'},
+                               {'name': 'operator', 'dataType': 'text', 'value': 'contains'},
+                               {'name': 'value', 'dataType': 'text', 'value': rng.choice('aeiou')}],
+    'textTransform': lambda rng: [{'name': 'columns', 'dataType': 'text', 'value': 'city'},
+                                  {'name': 'operations', 'dataType': 'text', 'value': 'strip,lower'}],
+    'groupAggregate': lambda rng: [{'name': 'by', 'dataType': 'text', 'value': 'city'},
+                                   {'name': 'aggregations', 'dataType': 'text', 'value': 'price:sum,qty:mean'}],
+}
+
+
+def make_board(nodes, rng):
+    """The project part of an open-whiteboard response, as read from MongoDB"""
+    types = list(NODE_DATA)
+    board_nodes, connections = [], []
+    for index in range(nodes):
+        node_type = types[index % len(types)]
+        node_id = f"{node_type}-{index}-{rng.getrandbits(32):08x}"
+        board_nodes.append({
+            'id': node_id, 'type': node_type, 'title': f"{node_type} {index}",
+            'position': {'x': rng.uniform(0, 40_000), 'y': rng.uniform(0, 40_000), 'z': index},
+            'inputs': [] if node_type == 'inputManager' else [
+                {'id': f"{node_id}-input-data", 'type': 'input', 'name': 'data', 'dataType': 'table'}],
+            'outputs': [{'id': f"{node_id}-output-data", 'type': 'output', 'name': 'data', 'dataType': 'table'}],
+            'data': NODE_DATA[node_type](rng),
+        })
+        if index % len(types):
+            source = board_nodes[index - 1]['id']
+            connections.append({'id': f"{source}->{node_id}", 'sourceNodeId': source,
+                                'sourcePortId': f"{source}-output-data", 'targetNodeId': node_id,
+                                'targetPortId': f"{node_id}-input-data", 'z': index})
+    return {
+        'id': ObjectId(), 'name': f"Board of {nodes} nodes", 'created_at': datetime(2024, 5, 17, 9, 30, 12, 345000),
+        'is_public': False, 'collaborators': ['user1', 'user2'], 'revision': 42,
+        'nodes': board_nodes, 'connections': connections,
+    }
+
+
+def best(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return result, min(timings) * 1000
+
+
+def fallback(func):
+    """Run `func` with fastjson on the json module"""
+    def run():
+        orjson, fastjson.orjson = fastjson.orjson, None
+        try:
+            return func()
+        finally:
+            fastjson.orjson = orjson
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--nodes', default='100,1000,10000', help='comma separated board sizes')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    boards = {int(nodes): make_board(int(nodes), rng) for nodes in args.nodes.split(',')}
+    drf_renderer, drf_parser = JSONRenderer(), JSONParser()
+    fast_renderer, fast_parser = fastjson.FastJSONRenderer(), fastjson.FastJSONParser()
+
+    print(f"{'nodes':>6}{'KB':>9}  {'render ms':>27}  {'parse ms':>27}")
+    print(f"{'':>15}  {'drf':>9}{'orjson':>9}{'json':>9}  {'drf':>9}{'orjson':>9}{'json':>9}")
+    bodies = {}
+    for nodes, board in boards.items():
+        # What the views built before: ids and dates converted by hand
+        converted = {'project': {**board, 'id': str(board['id']), 'created_at': board['created_at'].isoformat()},
+                     'permissions': True}
+        response = {'project': board, 'permissions': True}
+        drf_body, drf_render = best(args.repeat, lambda: drf_renderer.render(converted))
+        body, fast_render = best(args.repeat, lambda: fast_renderer.render(response))
+        _, json_render = best(args.repeat, fallback(lambda: fast_renderer.render(response)))
+        if fastjson.loads(body) != fastjson.loads(drf_body):
+            sys.exit(f"{nodes} nodes: FastJSONRenderer output differs from JSONRenderer's")
+        _, drf_parse = best(args.repeat, lambda: drf_parser.parse(io.BytesIO(body)))
+        _, fast_parse = best(args.repeat, lambda: fast_parser.parse(io.BytesIO(body)))
+        _, json_parse = best(args.repeat, fallback(lambda: fast_parser.parse(io.BytesIO(body))))
+        bodies[nodes] = body
+        print(f"{nodes:>6}{len(body) / 1024:>9.1f}  {drf_render:>9.2f}{fast_render:>9.2f}{json_render:>9.2f}"
+              f"  {drf_parse:>9.2f}{fast_parse:>9.2f}{json_parse:>9.2f}")
+
+    encodings = {f"gzip {level}": lambda body, level=level: gzip.compress(body, compresslevel=level, mtime=0)
+                 for level in (1, 3, 6)}
+    if brotli is not None:
+        for quality in (1, 4, 6):
+            encodings[f"br {quality}"] = lambda body, quality=quality: brotli.compress(body, quality=quality)
+    print()
+    print(f"{'nodes':>6}{'encoding':>10}{'KB':>9}{'ratio':>8}{'ms':>9}")
+    for nodes, body in bodies.items():
+        for name, encode in encodings.items():
+            compressed, elapsed = best(args.repeat, lambda: encode(body))
+            print(f"{nodes:>6}{name:>10}{len(compressed) / 1024:>9.1f}{len(body) / len(compressed):>8.1f}"
+                  f"{elapsed:>9.2f}")
+    if brotli is None:
+        print('brotli is not installed: pip install brotli to compare it')
+
+
+if __name__ == '__main__':
+    main()
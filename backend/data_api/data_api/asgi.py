@@ -13,7 +13,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "data_api.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from app.utils.collab import websocket_application  # noqa: E402 (needs the app registry ready)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
 
 #asynchronous server gateway interface that transfers request from websocket to django application
 #used for real time features like chat, notifications, etc.
+#run with: uvicorn data_api.asgi:application
+#the pipeline job event stream (/api/pipeline-jobs/<job_id>/events/) is an async view, so under
+#ASGI each open stream is a coroutine on the event loop instead of a blocked worker thread
+#set API_ASYNC_VIEWS=true to serve the project and whiteboard views async too, so a request
+#waiting on MongoDB holds no thread; compare with WSGI using benchmarks/deployment.py
+#collaborative editing connects to ws/whiteboard/<project_id>/?user_id=... (see app/utils/collab.py);
+#websockets need uvicorn[standard] or another server with websocket support
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from corsheaders.defaults import default_headers
 
 # Load environment variables from .env file
 load_dotenv()
@@ -47,6 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware too
+    'app.utils.metrics.MetricsMiddleware',
+    # Before anything else touches the body, so the sizes above are what goes over the wire
+    'app.utils.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -61,10 +66,24 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
 ]
 
+# Conditional whiteboard loads send If-None-Match and read the ETag back
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match')
+CORS_EXPOSE_HEADERS = ['ETag']
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [ 
         'rest_framework.permissions.AllowAny',
     ],
+    # orjson when installed; writes ObjectId and datetime values as they come out of MongoDB
+    'DEFAULT_RENDERER_CLASSES': [
+        'app.utils.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'app.utils.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 ROOT_URLCONF = "data_api.urls"
@@ -146,3 +165,131 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 MONGODB_URI = os.getenv('MONGODB_URI')
 if not MONGODB_URI:
     raise ValueError("No MONGODB_URI set in environment variables")
+
+# Shared MongoDB client (app/utils/mongo.py), one pool per worker process
+MONGODB_USERS_DB = os.getenv('MONGODB_USERS_DB', 'users')
+MONGODB_PROJECTS_DB = os.getenv('MONGODB_PROJECTS_DB', 'projects')
+MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', 50))
+MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', 0))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', 60000))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 2000))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', 5000))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv('MONGODB_SOCKET_TIMEOUT_MS', 30000))
+
+# Pipeline execution engine (app/utils/executor.py): 'thread' or 'process' pool
+PIPELINE_EXECUTOR = os.getenv('PIPELINE_EXECUTOR', 'thread')
+PIPELINE_MAX_WORKERS = int(os.getenv('PIPELINE_MAX_WORKERS', min(32, (os.cpu_count() or 1) + 4)))
+# Max node results memoized per process, evicted least recently used first
+PIPELINE_CACHE_SIZE = int(os.getenv('PIPELINE_CACHE_SIZE', 1024))
+# ...and their total size, which data-cleaning tables make matter
+PIPELINE_CACHE_MAX_BYTES = int(os.getenv('PIPELINE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+# Rows of each output table included in pipeline results and events
+PIPELINE_TABLE_PREVIEW_ROWS = int(os.getenv('PIPELINE_TABLE_PREVIEW_ROWS', 20))
+# Profile every run (app/utils/profiling.py); a request can also ask with "profile"
+PIPELINE_PROFILE = os.getenv('PIPELINE_PROFILE', 'false').lower() == 'true'
+# Node results on disk (app/utils/result_store.py), shared by every worker
+# process and kept across restarts. Least recently used entries go first.
+# Off unless enabled, so nothing is written under the source tree by default.
+RESULT_STORE_ENABLED = os.getenv('RESULT_STORE_ENABLED', 'false').lower() == 'true'
+RESULT_STORE_DIR = os.getenv('RESULT_STORE_DIR', str(BASE_DIR / 'result_store'))
+RESULT_STORE_MAX_BYTES = int(os.getenv('RESULT_STORE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+# Larger results are not stored, and eviction stops at this share of the budget
+RESULT_STORE_MAX_ENTRY_BYTES = int(os.getenv('RESULT_STORE_MAX_ENTRY_BYTES', 256 * 1024 * 1024))
+RESULT_STORE_EVICT_TO = float(os.getenv('RESULT_STORE_EVICT_TO', 0.9))
+# Run chains of row-by-row table nodes as one pass over slices of this many rows
+PIPELINE_FUSION = os.getenv('PIPELINE_FUSION', 'true').lower() == 'true'
+PIPELINE_FUSION_BATCH_ROWS = int(os.getenv('PIPELINE_FUSION_BATCH_ROWS', 65536))
+# 'batch' runs each node on whole tables; 'stream' (app/utils/streaming.py)
+# passes bounded batches between nodes and spills to disk. A request can
+# choose with "mode".
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'batch')
+STREAM_BATCH_ROWS = int(os.getenv('STREAM_BATCH_ROWS', 65536))
+# Most a blocking stream node (sort, group, join, dedupe) holds in memory at once
+STREAM_MEMORY_LIMIT_BYTES = int(os.getenv('STREAM_MEMORY_LIMIT_BYTES', 256 * 1024 * 1024))
+STREAM_SPILL_PARTITIONS = int(os.getenv('STREAM_SPILL_PARTITIONS', 32))
+STREAM_MERGE_FANIN = int(os.getenv('STREAM_MERGE_FANIN', 32))
+# Spill files go to the system temporary directory unless set
+STREAM_SPILL_DIR = os.getenv('STREAM_SPILL_DIR')
+# Compiled execution plans cached per graph topology (app/utils/compiler.py)
+PIPELINE_PLAN_CACHE_SIZE = int(os.getenv('PIPELINE_PLAN_CACHE_SIZE', 256))
+# Uploaded datasets (app/utils/datasets.py), memory-mapped from this directory
+DATASET_DIR = os.getenv('DATASET_DIR', str(BASE_DIR / 'datasets'))
+DATASET_MAX_UPLOAD_BYTES = int(os.getenv('DATASET_MAX_UPLOAD_BYTES', 1024 * 1024 * 1024))
+# Datasets kept open per process
+DATASET_CACHE_ENTRIES = int(os.getenv('DATASET_CACHE_ENTRIES', 32))
+
+# Background pipeline jobs (app/utils/jobs.py), state kept in MongoDB
+PIPELINE_JOB_WORKERS = int(os.getenv('PIPELINE_JOB_WORKERS', 2))
+PIPELINE_JOB_MAX_QUEUED = int(os.getenv('PIPELINE_JOB_MAX_QUEUED', 32))
+PIPELINE_JOB_HEARTBEAT_SECONDS = float(os.getenv('PIPELINE_JOB_HEARTBEAT_SECONDS', 5))
+# A job whose worker has not heartbeated for this long is re-run elsewhere
+PIPELINE_JOB_STALE_SECONDS = float(os.getenv('PIPELINE_JOB_STALE_SECONDS', 30))
+PIPELINE_JOB_MAX_ATTEMPTS = int(os.getenv('PIPELINE_JOB_MAX_ATTEMPTS', 3))
+# Progress events for running jobs (app/utils/events.py)
+PIPELINE_EVENT_HISTORY = int(os.getenv('PIPELINE_EVENT_HISTORY', 1000))
+PIPELINE_EVENT_CHANNELS = int(os.getenv('PIPELINE_EVENT_CHANNELS', 256))
+PIPELINE_EVENT_QUEUE_SIZE = int(os.getenv('PIPELINE_EVENT_QUEUE_SIZE', 256))
+PIPELINE_EVENT_KEEPALIVE_SECONDS = float(os.getenv('PIPELINE_EVENT_KEEPALIVE_SECONDS', 15))
+
+# Write-behind autosave (app/utils/autosave.py): saves to one project within
+# the window are merged into a single write. 0 writes every save through.
+AUTOSAVE_WINDOW_SECONDS = float(os.getenv('AUTOSAVE_WINDOW_SECONDS', 2))
+AUTOSAVE_MAX_PENDING = int(os.getenv('AUTOSAVE_MAX_PENDING', 1000))
+
+# Cursor pagination for list endpoints (app/utils/pagination.py)
+PAGINATION_DEFAULT_LIMIT = int(os.getenv('PAGINATION_DEFAULT_LIMIT', 50))
+PAGINATION_MAX_LIMIT = int(os.getenv('PAGINATION_MAX_LIMIT', 200))
+
+# Reconcile the indexes in app/utils/indexes.py when the app starts
+# (otherwise run: python manage.py ensure_indexes --explain)
+MONGODB_ENSURE_INDEXES_ON_STARTUP = os.getenv('MONGODB_ENSURE_INDEXES_ON_STARTUP', 'false').lower() == 'true'
+
+# Whiteboard revision registry and public board cache (app/utils/board_cache.py).
+# The TTL bounds how stale a 304 can be after a write made by another worker process.
+WHITEBOARD_CACHE_ENTRIES = int(os.getenv('WHITEBOARD_CACHE_ENTRIES', 1000))
+WHITEBOARD_CACHE_MAX_BYTES = int(os.getenv('WHITEBOARD_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+WHITEBOARD_CACHE_TTL_SECONDS = float(os.getenv('WHITEBOARD_CACHE_TTL_SECONDS', 5))
+
+# Whiteboard storage layout (app/utils/board_storage.py): boards with this many
+# nodes move from arrays in the project document to one document per node.
+WHITEBOARD_DOCUMENT_LAYOUT_THRESHOLD = int(os.getenv('WHITEBOARD_DOCUMENT_LAYOUT_THRESHOLD', 5000))
+WHITEBOARD_VIEWPORT_DEFAULT_LIMIT = int(os.getenv('WHITEBOARD_VIEWPORT_DEFAULT_LIMIT', 500))
+WHITEBOARD_VIEWPORT_MAX_LIMIT = int(os.getenv('WHITEBOARD_VIEWPORT_MAX_LIMIT', 2000))
+
+# Collaborative editing over WebSockets (app/utils/collab.py): ops are batched
+# per tick and the board is written to MongoDB per snapshot, not per op.
+COLLAB_TICK_SECONDS = float(os.getenv('COLLAB_TICK_SECONDS', 0.05))
+COLLAB_SNAPSHOT_SECONDS = float(os.getenv('COLLAB_SNAPSHOT_SECONDS', 5))
+COLLAB_SNAPSHOT_MAX_OPS = int(os.getenv('COLLAB_SNAPSHOT_MAX_OPS', 1000))
+COLLAB_MAX_OPS_PER_MESSAGE = int(os.getenv('COLLAB_MAX_OPS_PER_MESSAGE', 1000))
+COLLAB_QUEUE_SIZE = int(os.getenv('COLLAB_QUEUE_SIZE', 1024))
+
+# Project version history (app/utils/history.py): a full snapshot every N
+# versions bounds how many deltas rebuilding a version replays.
+HISTORY_SNAPSHOT_EVERY = int(os.getenv('HISTORY_SNAPSHOT_EVERY', 50))
+HISTORY_HEAD_CACHE_ENTRIES = int(os.getenv('HISTORY_HEAD_CACHE_ENTRIES', 256))
+HISTORY_HEAD_CACHE_MAX_BYTES = int(os.getenv('HISTORY_HEAD_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Errors logged by the app go to stderr, with tracebacks
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'app': {'handlers': ['console'], 'level': os.getenv('LOG_LEVEL', 'INFO')},
+    },
+}
+
+# Serve the project and whiteboard endpoints from app/async_views.py on
+# AsyncMongoClient. Only worth it under ASGI; keep it off under WSGI.
+API_ASYNC_VIEWS = os.getenv('API_ASYNC_VIEWS', 'false').lower() == 'true'
+
+# Responses at least this large are compressed with brotli (if installed) or gzip, as the client accepts.
+# Low levels by default: on board JSON, brotli 1 compresses better than gzip 6 in a fifth of the time
+# (benchmarks/payloads.py)
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+RESPONSE_GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', 3))
+RESPONSE_BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', 1))
@@ -17,8 +17,11 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
+from app.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('app.urls')),  
+    # Prometheus scrapes /metrics by default
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
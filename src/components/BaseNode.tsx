@@ -4,6 +4,7 @@ import { useGlobalZIndex } from '../contexts/GlobalZIndexContext';
 import { useConnections } from '../contexts/ConnectionContext';
 import { useBoardSize } from '../contexts/BoardSizeContext';
 import { useProject } from '../contexts/ProjectContext';
+import { uploadDataset } from '../services/api';
 
 export const BaseNode: React.FC<NodeComponentProps> = ({ node, onPortConnect, isSelected, onClick, handleDelete }) => {
     const [position, setPosition] = useState(node.position);
@@ -16,6 +17,12 @@ export const BaseNode: React.FC<NodeComponentProps> = ({ node, onPortConnect, is
 
     const [showContextMenu, setShowContextMenu] = useState<{ x: number; y: number } | null>(null);
 
+    const attachFile = async (data: any, file: File) => {
+        // Pipelines reference the stored dataset by id; keep the name if the upload failed
+        const dataset = await uploadDataset(file);
+        data.value = dataset ? dataset.id : file.name;
+    };
+
     const handleMouseDown = (e: React.MouseEvent) => {
         if ((e.target as HTMLElement).classList.contains('port')) return;
         setIsDragging(true);
@@ -337,7 +344,7 @@ export const BaseNode: React.FC<NodeComponentProps> = ({ node, onPortConnect, is
                                             e.currentTarget.classList.remove('border-blue-500', 'bg-blue-50/50');
                                             const file = e.dataTransfer.files[0];
                                             if (file) {
-                                                data.value = file.name;
+                                                attachFile(data, file);
                                             }
                                         }}
                                         onClick={() => {
@@ -346,7 +353,7 @@ export const BaseNode: React.FC<NodeComponentProps> = ({ node, onPortConnect, is
                                             input.onchange = (e) => {
                                                 const file = (e.target as HTMLInputElement).files?.[0];
                                                 if (file) {
-                                                    data.value = file.name;
+                                                    attachFile(data, file);
                                                 }
                                             };
                                             input.click();
@@ -1,7 +1,7 @@
 import React, { useState, useEffect, useRef, useMemo } from 'react';
 import { X, Search, Plus, Globe, Lock } from 'lucide-react';
 import { useUser } from '../contexts/UserContext';
-import { fetchAllUsers } from '../services/api';
+import { searchUsers } from '../services/api';
 import router from 'next/router';
 
 interface Collaborator {
@@ -27,22 +27,50 @@ const NewProjectModal: React.FC<NewProjectModalProps> = ({ isOpen, onClose, onCr
     const inputRef = useRef<HTMLDivElement>(null);
     const [isPublic, setIsPublic] = useState(false);
 
-    // Fetch all users when modal opens
-    useEffect(() => {
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
 
-        if (isOpen) {
-            fetchAllUsers().then(users => setAllUsers(users));
+    // Ask the server for users matching the search, one page at a time
+    useEffect(() => {
+        const query = searchEmail.trim();
+        if (!isOpen || query.length < 2) {
+            setAllUsers([]);
+            setNextCursor(null);
+            return;
         }
-    }, [isOpen]);
+        let cancelled = false;
+        const timer = setTimeout(() => {
+            searchUsers(query).then(page => {
+                if (!cancelled) {
+                    setAllUsers(page.users);
+                    setNextCursor(page.next_cursor);
+                }
+            });
+        }, 200);
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    }, [isOpen, searchEmail]);
+
+    // Load the next page when the dropdown is scrolled to the bottom
+    const handleSuggestionsScroll = (event: React.UIEvent<HTMLDivElement>) => {
+        const target = event.currentTarget;
+        if (!nextCursor || target.scrollTop + target.clientHeight < target.scrollHeight - 20) return;
+        const cursor = nextCursor;
+        setNextCursor(null);
+        searchUsers(searchEmail.trim(), cursor).then(page => {
+            setAllUsers(prev => [...prev, ...page.users]);
+            setNextCursor(page.next_cursor);
+        });
+    };
 
-    // Filter suggestions based on search input
+    // Leave out the current user and those already added
     const suggestions = useMemo(() => {
-        if (searchEmail.length < 2) return [];
-        
-        return allUsers.filter(u => 
+        if (searchEmail.trim().length < 2) return [];
+
+        return allUsers.filter(u =>
             u.id !== user?.id && // Exclude current user
-            !selectedCollaborators.some(c => c.id === u.id) && // Exclude selected collaborators
-            u.email.toLowerCase().includes(searchEmail.toLowerCase()) // Filter by search term
+            !selectedCollaborators.some(c => c.id === u.id) // Exclude selected collaborators
         );
     }, [searchEmail, allUsers, user, selectedCollaborators]);
 
@@ -177,7 +205,7 @@ const NewProjectModal: React.FC<NewProjectModalProps> = ({ isOpen, onClose, onCr
 
                             {/* Suggestions Dropdown */}
                             {isDropdownOpen && suggestions.length > 0 && (
-                                <div className="absolute mt-1 w-full bg-white border border-gray-200 rounded-md shadow-lg max-h-[200px] overflow-y-auto z-10">
+                                <div onScroll={handleSuggestionsScroll} className="absolute mt-1 w-full bg-white border border-gray-200 rounded-md shadow-lg max-h-[200px] overflow-y-auto z-10">
                                     {suggestions.map((suggestion, index) => (
                                         <button
                                             key={suggestion.id}
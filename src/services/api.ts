@@ -42,24 +42,40 @@ export const newProject = async (
     return response.json();
 };
 
-export const fetchAllUsers = async () => {
+// Users whose email starts with `query`, a page at a time: pass the previous page's next_cursor for the next one
+export const searchUsers = async (query: string, cursor?: string | null) => {
     try {
-        const response = await fetch(`${API_BASE_URL}/all-users/`);
+        const params = new URLSearchParams({ q: query, limit: '20' });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${API_BASE_URL}/all-users/?${params}`);
+        if (!response.ok) {
+            throw new Error('Failed to fetch users');
+        }
         const data = await response.json();
-        return data.users;
+        return { users: data.users, next_cursor: data.next_cursor as string | null };
     } catch (error) {
         console.error('Error fetching users:', error);
+        return { users: [], next_cursor: null };
     }
 };
 
 export const fetchAllProjects = async (user_id: string) => {
     try {
-        const response = await fetch(`${API_BASE_URL}/all-projects/?user_id=${user_id}`);
-        if (!response.ok) {
-            throw new Error('Failed to fetch projects');
-        }
-        const data = await response.json();
-        return data.projects;
+        // The listing is paged; follow next_cursor to the last page
+        const projects: any[] = [];
+        let cursor: string | null = null;
+        do {
+            const params = new URLSearchParams({ user_id });
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetch(`${API_BASE_URL}/all-projects/?${params}`);
+            if (!response.ok) {
+                throw new Error('Failed to fetch projects');
+            }
+            const data = await response.json();
+            projects.push(...data.projects);
+            cursor = data.next_cursor;
+        } while (cursor);
+        return projects;
     } catch (error) {
         console.error('Error fetching projects:', error);
         return [];
@@ -123,3 +139,21 @@ export const uploadWhiteBoard = async (user_id: string, project: Project) => {
 };
 
 
+
+export const uploadDataset = async (file: File) => {
+    try {
+        const body = new FormData();
+        body.append('file', file);
+        const response = await fetch(`${API_BASE_URL}/datasets/`, { method: 'POST', body });
+
+        if (!response.ok) {
+            throw new Error('Failed to upload dataset');
+        }
+
+        const data = await response.json();
+        return data.dataset;
+    } catch (error) {
+        console.error('Error uploading dataset:', error);
+        return null;
+    }
+};
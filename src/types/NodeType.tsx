@@ -103,6 +103,126 @@ export const nodeTemplates: NodeTemplate[] = [
             { name: 'classes', dataType: 'text', value: '' }
         ],
         component: BaseNode
+    },
+    {
+        type: 'filterRows',
+        title: 'Filter Rows',
+        inputs: [
+            { name: 'data', dataType: 'data', label: 'Input Table' }
+        ],
+        outputs: [{ name: 'table', dataType: 'table', label: 'Table' }],
+        data: [
+            { name: 'column', dataType: 'text', value: '' },
+            { name: 'operator', dataType: 'text', value: '==' },
+            { name: 'value', dataType: 'text', value: '' }
+        ],
+        component: BaseNode
+    },
+    {
+        type: 'fillMissing',
+        title: 'Fill Missing',
+        inputs: [
+            { name: 'data', dataType: 'data', label: 'Input Table' }
+        ],
+        outputs: [{ name: 'table', dataType: 'table', label: 'Table' }],
+        data: [
+            { name: 'columns', dataType: 'text', value: '' },
+            { name: 'strategy', dataType: 'text', value: 'value' },
+            { name: 'value', dataType: 'text', value: '' }
+        ],
+        component: BaseNode
+    },
+    {
+        type: 'dedupe',
+        title: 'Remove Duplicates',
+        inputs: [
+            { name: 'data', dataType: 'data', label: 'Input Table' }
+        ],
+        outputs: [{ name: 'table', dataType: 'table', label: 'Table' }],
+        data: [
+            { name: 'columns', dataType: 'text', value: '' },
+            { name: 'keep', dataType: 'text', value: 'first' }
+        ],
+        component: BaseNode
+    },
+    {
+        type: 'typeCast',
+        title: 'Type Cast',
+        inputs: [
+            { name: 'data', dataType: 'data', label: 'Input Table' }
+        ],
+        outputs: [{ name: 'table', dataType: 'table', label: 'Table' }],
+        data: [
+            { name: 'columns', dataType: 'text', value: '' },
+            { name: 'type', dataType: 'text', value: 'float' }
+        ],
+        component: BaseNode
+    },
+    {
+        type: 'textTransform',
+        title: 'Text Transform',
+        inputs: [
+            { name: 'data', dataType: 'data', label: 'Input Table' }
+        ],
+        outputs: [{ name: 'table', dataType: 'table', label: 'Table' }],
+        data: [
+            { name: 'columns', dataType: 'text', value: '' },
+            { name: 'operations', dataType: 'text', value: 'strip' }
+        ],
+        component: BaseNode
+    },
+    {
+        type: 'normalize',
+        title: 'Normalize',
+        inputs: [
+            { name: 'data', dataType: 'data', label: 'Input Table' }
+        ],
+        outputs: [{ name: 'table', dataType: 'table', label: 'Table' }],
+        data: [
+            { name: 'columns', dataType: 'text', value: '' },
+            { name: 'method', dataType: 'text', value: 'minmax' }
+        ],
+        component: BaseNode
+    },
+    {
+        type: 'join',
+        title: 'Join',
+        inputs: [
+            { name: 'left', dataType: 'data', label: 'Left Table' },
+            { name: 'right', dataType: 'data', label: 'Right Table' }
+        ],
+        outputs: [{ name: 'table', dataType: 'table', label: 'Table' }],
+        data: [
+            { name: 'on', dataType: 'text', value: '' },
+            { name: 'how', dataType: 'text', value: 'inner' }
+        ],
+        component: BaseNode
+    },
+    {
+        type: 'groupAggregate',
+        title: 'Group & Aggregate',
+        inputs: [
+            { name: 'data', dataType: 'data', label: 'Input Table' }
+        ],
+        outputs: [{ name: 'table', dataType: 'table', label: 'Table' }],
+        data: [
+            { name: 'by', dataType: 'text', value: '' },
+            { name: 'aggregations', dataType: 'text', value: '*:count' }
+        ],
+        component: BaseNode
+    },
+    {
+        type: 'sortRows',
+        title: 'Sort Rows',
+        inputs: [
+            { name: 'data', dataType: 'data', label: 'Input Table' }
+        ],
+        outputs: [{ name: 'table', dataType: 'table', label: 'Table' }],
+        data: [
+            { name: 'column', dataType: 'text', value: '' },
+            { name: 'order', dataType: 'text', value: 'asc' }
+        ],
+        component: BaseNode
     }
 ];
     